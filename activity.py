@@ -0,0 +1,204 @@
+"""
+Activity history: who changed what on projects, stages, tasks and assignments.
+
+Changes are written to ``activity`` in the transaction that makes them, one
+narrow row per changed field: time, actor, project, object type and id,
+action, field, and the old and new values as JSON. Object types and actions
+are small integers and field names are interned in ``activity_fields`` (the
+ids are cached per database), so a row is mostly integers. Values are JSON,
+datetimes as ISO-8601. On PostgreSQL an update returns the old values from
+the UPDATE itself (``UPDATE ... FROM`` a CTE that locks the row), so it
+only adds one multi-row INSERT; SQLite can't return another table's columns
+and needs a primary-key SELECT first. Creates, deletes and assignment
+changes only cost the INSERT. Columns that change on their own
+(``updated_at``, ``version``, leases) are not tracked.
+
+Rows stay when their object is deleted or archived. They live in the
+project's shard, so history by entity or time range fans out over shards.
+"""
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import status
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from concurrency import update_failed, versioned_update
+from models import Activity, ActivityAction, ActivityField, ActivityObject, Project, Stage
+
+ACTIVITY_ENABLED = os.getenv("ACTIVITY_ENABLED", "true").lower() == "true"
+
+UNTRACKED_FIELDS = {"updated_at", "version", "lease_expires_at"}
+
+# (field, old value, new value)
+Change = Tuple[str, Any, Any]
+# (object type, object id, project id)
+Target = Tuple[ActivityObject, int, int]
+Event = Tuple[ActivityAction, Target, Sequence[Change]]
+
+# Database URL -> field name -> id, for names already committed
+_field_ids: Dict[str, Dict[str, int]] = {}
+
+
+def target(obj) -> Target:
+    """What an activity row about ``obj`` (a Project, Stage or Task) points at"""
+    if isinstance(obj, Project):
+        return ActivityObject.PROJECT, obj.id, obj.id
+    if isinstance(obj, Stage):
+        return ActivityObject.STAGE, obj.id, obj.project_id
+    return ActivityObject.TASK, obj.id, obj.project_id
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value, default=_json_default)
+
+
+def decode(value: Optional[str]) -> Any:
+    return None if value is None else json.loads(value)
+
+
+async def field_ids(db: AsyncSession, names: Iterable[str]) -> Dict[str, int]:
+    """Ids of field names, interning new ones in the session's transaction"""
+    cache = _field_ids.setdefault(str(db.bind.url), {})
+    missing = {name for name in names if name not in cache}
+    if not missing:
+        return cache
+
+    # Imported here because database imports modules that import this one
+    from database import dialect_insert
+
+    query = select(ActivityField.name, ActivityField.id).where(ActivityField.name.in_(missing))
+    found = dict((await db.execute(query)).all())
+    # Interned by this (uncommitted) transaction: usable now, cached once seen committed
+    interned = db.info.setdefault("activity_fields", set())
+    cache.update((name, field_id) for name, field_id in found.items() if name not in interned)
+    new = missing - set(found)
+    if new:
+        await db.execute(dialect_insert(db, ActivityField).on_conflict_do_nothing(), [{"name": name} for name in new])
+        found.update((await db.execute(query)).all())
+        interned.update(new)
+    return {**cache, **found}
+
+
+async def record_all(db: AsyncSession, actor_id: Optional[int], events: Iterable[Event]):
+    """Add ``events`` to the activity log in the session's transaction (one INSERT)"""
+    if not ACTIVITY_ENABLED:
+        return
+    events = list(events)
+    ids = await field_ids(db, {field for _, _, changes in events for field, _, _ in changes})
+    now = datetime.utcnow()
+    rows = []
+    for action, (object_type, object_id, project_id), changes in events:
+        row = {
+            "at": now, "actor_id": actor_id, "project_id": project_id, "object_type": object_type,
+            "object_id": object_id, "action": action, "field_id": None, "old_value": None, "new_value": None,
+        }
+        if not changes:
+            rows.append(row)
+        for field, old, new in changes:
+            rows.append({**row, "field_id": ids[field], "old_value": encode(old), "new_value": encode(new)})
+    if rows:
+        await db.execute(insert(Activity), rows)
+
+
+async def record(
+    db: AsyncSession, actor_id: Optional[int], action: ActivityAction, obj_target: Target,
+    changes: Sequence[Change] = ()
+):
+    """Add one event to the activity log in the session's transaction"""
+    await record_all(db, actor_id, [(action, obj_target, changes)])
+
+
+def update_returning_old(model, object_id: int, fields: Sequence[str], values: Dict[str, Any],
+                         expected_version: Optional[int] = None):
+    """
+    versioned_update()'s UPDATE, also returning the old values of ``fields``:
+    it reads them from a CTE that locks the row, so they are the ones it
+    replaces (PostgreSQL)
+    """
+    old = (
+        select(model.id, *(getattr(model, field) for field in fields))
+        .where(model.id == object_id)
+        .with_for_update()
+        .cte("old")
+    )
+    query = update(model).where(model.id == old.c.id)
+    if expected_version is not None:
+        query = query.where(model.version == expected_version)
+    return query.values(**values, version=model.version + 1).returning(model, *(old.c[field] for field in fields))
+
+
+async def tracked_update(
+    db: AsyncSession,
+    model,
+    object_id: int,
+    values: Dict[str, Any],
+    actor_id: Optional[int],
+    expected_version: Optional[int] = None,
+    conflict_status: int = status.HTTP_412_PRECONDITION_FAILED,
+):
+    """versioned_update() that also records the fields it changed; the caller commits"""
+    fields = [field for field in values if field not in UNTRACKED_FIELDS]
+    if not ACTIVITY_ENABLED or not fields:
+        return await versioned_update(db, model, object_id, values, expected_version, conflict_status)
+
+    if db.bind.dialect.name == "postgresql":
+        result = await db.execute(update_returning_old(model, object_id, fields, values, expected_version))
+        row = result.one_or_none()
+        if row is None:
+            await update_failed(db, model, object_id, conflict_status)
+        obj, old = row[0], row[1:]
+    else:
+        result = await db.execute(select(*(getattr(model, field) for field in fields)).where(model.id == object_id))
+        old = result.one_or_none()
+        obj = await versioned_update(db, model, object_id, values, expected_version, conflict_status)
+    if old is not None:
+        changes = [
+            (field, before, getattr(obj, field))
+            for field, before in zip(fields, old) if before != getattr(obj, field)
+        ]
+        if changes:
+            await record(db, actor_id, ActivityAction.UPDATED, target(obj), changes)
+    return obj
+
+
+async def history(
+    db: AsyncSession,
+    object_type: Optional[ActivityObject] = None,
+    object_id: Optional[int] = None,
+    project_id: Optional[int] = None,
+    actor_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Activity matching the filters, newest first; ``since`` is inclusive and ``until`` exclusive"""
+    query = select(Activity, ActivityField.name).outerjoin(ActivityField, ActivityField.id == Activity.field_id)
+    if object_type is not None:
+        query = query.where(Activity.object_type == object_type, Activity.object_id == object_id)
+    if project_id is not None:
+        query = query.where(Activity.project_id == project_id)
+    if actor_id is not None:
+        query = query.where(Activity.actor_id == actor_id)
+    if since is not None:
+        query = query.where(Activity.at >= since)
+    if until is not None:
+        query = query.where(Activity.at < until)
+    result = await db.execute(query.order_by(Activity.at.desc(), Activity.id.desc()).limit(limit))
+    return [
+        {
+            "at": row.at, "actor_id": row.actor_id, "project_id": row.project_id,
+            "object_type": ActivityObject(row.object_type).name.lower(), "object_id": row.object_id,
+            "action": ActivityAction(row.action).name.lower(), "field": field,
+            "old_value": decode(row.old_value), "new_value": decode(row.new_value),
+        }
+        for row, field in result
+    ]
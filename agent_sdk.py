@@ -0,0 +1,374 @@
+"""
+Agent SDK for the Kanban PM API
+
+AsyncAgentClient and AgentClient keep one pooled keep-alive connection set
+per client, retry transient failures with exponential backoff, and expose
+the same task/comment operations. Multi-step updates (status + comment +
+assignment) go through the single transition endpoint; the async client can
+also run independent calls concurrently over the pool and subscribe to
+WebSocket updates.
+
+Both clients ask for MessagePack responses and WebSocket frames by default
+(``use_msgpack``), which are smaller and cheaper to decode than JSON.
+``msgpack`` is in requirements.txt; a copy of this module used without it
+falls back to JSON unless ``use_msgpack=True`` is passed.
+"""
+
+import abc
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+try:
+    import msgpack
+except ImportError:  # Optional; JSON only without it
+    msgpack = None
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.2
+MAX_BACKOFF = 5.0
+
+# Statuses where the server did not act on the request, safe to retry for any method
+RETRY_ALWAYS = {429, 503}
+# Gateway errors: the request may have been applied, so only retry idempotent requests
+RETRY_IDEMPOTENT = {502, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+class AgentAPIError(Exception):
+    """Raised when the API answers with an error status"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _idempotent(method: str, headers: Optional[Dict[str, str]]) -> bool:
+    """Whether sending the request twice does no more than once; a PATCH only with If-Match"""
+    if method == "PATCH":
+        return any(name.lower() == "if-match" for name in headers or {})
+    return method in IDEMPOTENT_METHODS
+
+
+def _should_retry(idempotent: bool, status_code: int) -> bool:
+    return status_code in RETRY_ALWAYS or (status_code in RETRY_IDEMPOTENT and idempotent)
+
+
+def _backoff_delay(attempt: int, backoff: float, response: Optional[httpx.Response] = None) -> float:
+    """Exponential backoff with jitter, honouring Retry-After when the server sends one"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), MAX_BACKOFF)
+    return min(backoff * (2 ** attempt), MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+
+def _wants_msgpack(use_msgpack: Optional[bool]) -> bool:
+    if use_msgpack and msgpack is None:
+        raise ImportError("use_msgpack=True needs the msgpack package")
+    return msgpack is not None if use_msgpack is None else use_msgpack
+
+
+def _headers(api_key: str, use_msgpack: bool) -> Dict[str, str]:
+    headers = {"X-API-Key": api_key}
+    if use_msgpack:
+        headers["Accept"] = f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.9"
+    return headers
+
+
+def _decode(response: httpx.Response) -> Any:
+    if response.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
+
+
+def _parse(response: httpx.Response) -> Any:
+    if response.status_code >= 400:
+        try:
+            detail = _decode(response).get("detail", response.text)
+        except (ValueError, AttributeError):
+            detail = response.text
+        raise AgentAPIError(response.status_code, detail)
+    if response.status_code == 204 or not response.content:
+        return None
+    return _decode(response)
+
+
+class _AgentEndpoints(abc.ABC):
+    """
+    API operations shared by both clients. Each method returns whatever
+    ``_call`` returns: a value for the sync client, an awaitable for the async one.
+    """
+
+    @abc.abstractmethod
+    def _call(self, method: str, path: str, **kwargs):
+        """Send one request, with retries, and return the decoded response body"""
+
+    def get_profile(self):
+        """Get agent's own profile"""
+        return self._call("GET", "/entities/me")
+
+    def get_available_tasks(self):
+        """Get tasks available based on agent's skills"""
+        return self._call("GET", "/tasks/available")
+
+    def get_my_tasks(self):
+        """Get tasks assigned to this agent"""
+        return self._call("GET", "/tasks", params={"assigned_to_me": True})
+
+    def get_task_details(self, task_id: int):
+        """Get detailed information about a task"""
+        return self._call("GET", f"/tasks/{task_id}")
+
+    def self_assign_task(self, task_id: int):
+        """Self-assign a task (takes a lease kept alive by heartbeats)"""
+        return self._call("POST", f"/tasks/{task_id}/self-assign")
+
+    def update_task_status(self, task_id: int, status: str, expected_version: Optional[int] = None):
+        """
+        Update task status (pending, in_progress, in_review, completed, blocked).
+        With ``expected_version`` the update is conditional (412 if the task
+        moved on), which also makes it safe to retry after a gateway error.
+        """
+        headers = {"If-Match": f'"{expected_version}"'} if expected_version is not None else None
+        return self._call("PATCH", f"/tasks/{task_id}", json={"status": status}, headers=headers)
+
+    def add_comment(self, task_id: int, content: str):
+        """Add a comment to a task"""
+        return self._call("POST", "/comments", json={"task_id": task_id, "content": content})
+
+    def get_task_comments(self, task_id: int):
+        """Get all comments for a task"""
+        return self._call("GET", f"/tasks/{task_id}/comments")
+
+    def transition(self, task_id: int, **changes):
+        """
+        Apply status/stage changes, a comment and assignment changes in one call.
+        Accepts the TaskTransition fields: status, stage_id, comment, assign,
+        unassign, release, expected_version.
+        """
+        return self._call("POST", f"/tasks/{task_id}/transition", json=changes)
+
+    def heartbeat(self):
+        """Keep this agent's task leases alive"""
+        return self._call("POST", "/agents/heartbeat")
+
+
+class AsyncAgentClient(_AgentEndpoints):
+    """Async client backed by a pooled httpx.AsyncClient"""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        max_connections: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        use_msgpack: Optional[bool] = None,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # None: MessagePack if the package is installed
+        self.use_msgpack = _wants_msgpack(use_msgpack)
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=_headers(api_key, self.use_msgpack),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "AsyncAgentClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """Stop heartbeats and close pooled connections"""
+        self.stop_heartbeats()
+        await self._http.aclose()
+
+    async def _call(self, method: str, path: str, **kwargs) -> Any:
+        idempotent = _idempotent(method, kwargs.get("headers"))
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self._http.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                # The request never reached the server
+                if last_attempt:
+                    raise
+                await asyncio.sleep(_backoff_delay(attempt, self.backoff))
+                continue
+            except httpx.TransportError:
+                if last_attempt or not idempotent:
+                    raise
+                await asyncio.sleep(_backoff_delay(attempt, self.backoff))
+                continue
+
+            if not last_attempt and _should_retry(idempotent, response.status_code):
+                await asyncio.sleep(_backoff_delay(attempt, self.backoff, response))
+                continue
+            return _parse(response)
+
+    async def gather(self, *calls) -> List[Any]:
+        """Run several API calls concurrently over the connection pool"""
+        return list(await asyncio.gather(*calls))
+
+    async def complete_task(self, task_id: int, comment: Optional[str] = None) -> Dict:
+        """Mark task as completed with optional comment in a single request"""
+        result = await self.transition(task_id, status="completed", comment=comment)
+        return result["task"]
+
+    def start_heartbeats(self, interval: float = 10.0):
+        """Send heartbeats in the background until stop_heartbeats() or aclose()"""
+        async def beat():
+            while True:
+                try:
+                    await self.heartbeat()
+                except (AgentAPIError, httpx.HTTPError):
+                    pass  # The next beat retries; the lease TTL absorbs a few misses
+                await asyncio.sleep(interval)
+
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(beat())
+
+    def stop_heartbeats(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def subscribe(self, project_id: Optional[int] = None, reconnect: bool = True,
+                        filters: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """
+        Yield real-time events from the project (or global) WebSocket,
+        reconnecting with backoff if the connection drops. ``filters`` narrows
+        the events sent, e.g. {"assigned_to_me": True} or
+        {"events": ["task_created"], "skills": ["python"]}.
+        """
+        import websockets
+
+        url = self.base_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        url += f"/ws/projects/{project_id}" if project_id is not None else "/ws"
+
+        attempt = 0
+        while True:
+            try:
+                async with websockets.connect(
+                    url, extra_headers={"X-API-Key": self.api_key},
+                    subprotocols=["msgpack"] if self.use_msgpack else None
+                ) as websocket:
+                    attempt = 0
+                    if filters:
+                        await websocket.send(json.dumps({"type": "subscribe", **filters}))
+                    async for message in websocket:
+                        # Binary frames are MessagePack (the server agreed to the subprotocol)
+                        if isinstance(message, bytes):
+                            event = msgpack.unpackb(message, raw=False)
+                        else:
+                            event = json.loads(message)
+                        if event.get("type") == "ping":
+                            await websocket.send('{"type": "pong"}')
+                            continue
+                        yield event
+            except (OSError, websockets.ConnectionClosed):
+                if not reconnect:
+                    raise
+            if not reconnect:
+                return
+            await asyncio.sleep(_backoff_delay(attempt, self.backoff))
+            attempt += 1
+
+
+class AgentClient(_AgentEndpoints):
+    """Blocking client backed by a pooled httpx.Client"""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        max_connections: int = 10,
+        transport: Optional[httpx.BaseTransport] = None,
+        use_msgpack: Optional[bool] = None,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # None: MessagePack if the package is installed
+        self.use_msgpack = _wants_msgpack(use_msgpack)
+        self._http = httpx.Client(
+            base_url=self.base_url,
+            headers=_headers(api_key, self.use_msgpack),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    def __enter__(self) -> "AgentClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close pooled connections"""
+        self._http.close()
+
+    def _call(self, method: str, path: str, **kwargs) -> Any:
+        idempotent = _idempotent(method, kwargs.get("headers"))
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self._http.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if last_attempt:
+                    raise
+                time.sleep(_backoff_delay(attempt, self.backoff))
+                continue
+            except httpx.TransportError:
+                if last_attempt or not idempotent:
+                    raise
+                time.sleep(_backoff_delay(attempt, self.backoff))
+                continue
+
+            if not last_attempt and _should_retry(idempotent, response.status_code):
+                time.sleep(_backoff_delay(attempt, self.backoff, response))
+                continue
+            return _parse(response)
+
+    def complete_task(self, task_id: int, comment: Optional[str] = None) -> Dict:
+        """Mark task as completed with optional comment in a single request"""
+        return self.transition(task_id, status="completed", comment=comment)["task"]
+
+
+def register_agent(base_url: str, name: str, skills: str, max_concurrent_tasks: int = 1) -> Dict:
+    """Register a new agent; the response contains the API key"""
+    response = httpx.post(
+        f"{base_url.rstrip('/')}/entities/register/agent",
+        json={
+            "name": name,
+            "entity_type": "agent",
+            "skills": skills,
+            "max_concurrent_tasks": max_concurrent_tasks,
+        },
+        timeout=DEFAULT_TIMEOUT,
+    )
+    return _parse(response)
@@ -0,0 +1,201 @@
+"""
+Archival of completed tasks.
+
+Tasks completed more than ARCHIVE_AFTER_DAYS ago are moved, with their
+comments and assignments, from the hot tables into ``archived_tasks``,
+``archived_comments`` and ``archived_task_assignments``. Each batch of
+ARCHIVE_BATCH_SIZE tasks is copied and deleted in one short transaction.
+Read endpoints take ``include_archived=true`` to query the archive as well.
+
+A task is only archived once it has no subtasks left in ``tasks``, so
+parents follow their children and no live row references an archived one.
+
+Storage:
+- SQLite: set ARCHIVE_DATABASE_PATH to keep the archive in a separate file,
+  ATTACHed to every connection as ``archive``. Moves stay atomic. The hot
+  database file stops growing with history.
+- PostgreSQL: ``archived_tasks`` is range-partitioned by ``completed_at``.
+  Monthly partitions are created as batches need them, so old months can be
+  detached or dropped cheaply.
+
+Archival runs as an ``archive_tasks`` background job, enqueued by
+POST /tasks/archive or every ARCHIVE_INTERVAL_SECONDS.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import select, insert, update, delete, exists, event, func, literal, text, DateTime
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
+
+from models import (
+    ARCHIVE_SCHEMA, ArchivedTask, ArchivedComment, Comment, Task, TaskStatus,
+    archived_task_assignments, task_assignments
+)
+from cache import project_cache
+from board import publish_changed
+from jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "0"))  # 0 = only on request
+ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH")  # SQLite only
+
+
+def archive_attached(database_url: str) -> bool:
+    """Whether the archive lives in a separate, ATTACHed SQLite file"""
+    return bool(ARCHIVE_DATABASE_PATH) and make_url(database_url).get_backend_name() == "sqlite"
+
+
+def schema_translate_map(database_url: str) -> Dict[str, Optional[str]]:
+    """Engine execution option resolving the archive tables' placeholder schema"""
+    return {ARCHIVE_SCHEMA: ARCHIVE_SCHEMA if archive_attached(database_url) else None}
+
+
+def attach_archive(engine: AsyncEngine):
+    """ATTACH the archive database to every new SQLite connection"""
+    @event.listens_for(engine.sync_engine, "connect")
+    def attach(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE_PATH,))
+        cursor.close()
+
+
+async def _ensure_partitions(db: AsyncSession, task_ids):
+    """Create the monthly archived_tasks partitions a batch will be inserted into (PostgreSQL)"""
+    result = await db.execute(
+        select(func.date_trunc("month", Task.completed_at)).where(Task.id.in_(task_ids)).distinct()
+    )
+    for start in result.scalars():
+        end = (start + timedelta(days=32)).replace(day=1)
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS archived_tasks_{start:%Y_%m} PARTITION OF archived_tasks "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+
+
+async def archive_completed(db: AsyncSession, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                            batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    """Move tasks completed before the cutoff into the archive; returns the number of rows moved"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    child = aliased(Task)
+    task_columns = [column.name for column in Task.__table__.c]
+    comment_columns = [column.name for column in Comment.__table__.c]
+    moved = {"tasks": 0, "comments": 0}
+
+    while True:
+        result = await db.execute(
+            select(Task.id)
+            .where(
+                Task.status == TaskStatus.COMPLETED,
+                Task.completed_at < cutoff,
+                ~exists().where(child.parent_task_id == Task.id)
+            )
+            .order_by(Task.id)
+            .limit(batch_size)
+        )
+        task_ids = result.scalars().all()
+        if not task_ids:
+            break
+
+        if db.bind.dialect.name == "postgresql":
+            await _ensure_partitions(db, task_ids)
+        elif ARCHIVE_DATABASE_PATH:
+            # Take the main database's write lock before the archive's. Holding only a read lock on
+            # main while waiting to write it deadlocks with other writers, which SQLite reports as
+            # "database is locked" without waiting.
+            await db.execute(update(Task).where(literal(False)).values(id=Task.id))
+        now = datetime.utcnow()
+        await db.execute(
+            insert(ArchivedTask.__table__).from_select(
+                task_columns + ["archived_at"],
+                select(*Task.__table__.c, literal(now, DateTime)).where(Task.id.in_(task_ids))
+            )
+        )
+        await db.execute(
+            insert(ArchivedComment.__table__).from_select(
+                comment_columns, select(*Comment.__table__.c).where(Comment.task_id.in_(task_ids))
+            )
+        )
+        await db.execute(
+            insert(archived_task_assignments).from_select(
+                ["task_id", "entity_id"],
+                select(task_assignments.c.task_id, task_assignments.c.entity_id)
+                .where(task_assignments.c.task_id.in_(task_ids))
+            )
+        )
+        result = await db.execute(delete(Comment).where(Comment.task_id.in_(task_ids)))
+        moved["comments"] += result.rowcount
+        await db.execute(delete(task_assignments).where(task_assignments.c.task_id.in_(task_ids)))
+        result = await db.execute(delete(Task).where(Task.id.in_(task_ids)).returning(Task.project_id))
+        project_ids = set(result.scalars().all())
+        await db.commit()
+        await project_cache.invalidate(*project_ids)
+        await publish_changed(*project_ids)
+        moved["tasks"] += len(task_ids)
+
+    if moved["tasks"]:
+        logger.info("Archived %d tasks and %d comments", moved["tasks"], moved["comments"])
+    return moved
+
+
+async def delete_archived_project(db: AsyncSession, project_id: int):
+    """Delete a project's archived rows (in the caller's transaction)"""
+    archived_ids = select(ArchivedTask.id).where(ArchivedTask.project_id == project_id).scalar_subquery()
+    await db.execute(delete(ArchivedComment).where(ArchivedComment.task_id.in_(archived_ids)))
+    await db.execute(
+        delete(archived_task_assignments).where(archived_task_assignments.c.task_id.in_(archived_ids))
+    )
+    await db.execute(delete(ArchivedTask).where(ArchivedTask.project_id == project_id))
+
+
+@job_queue.handler("archive_tasks")
+async def archive_tasks(db: AsyncSession, job) -> dict:
+    """Archive every shard, concurrently"""
+    # Imported here because database imports this module
+    from database import fan_out
+
+    older_than_days = job.payload.get("older_than_days", ARCHIVE_AFTER_DAYS)
+    moved = await fan_out(lambda db: archive_completed(db, older_than_days))
+    return {key: sum(shard[key] for shard in moved) for key in ("tasks", "comments")}
+
+
+class Archiver:
+    """Enqueues an archival job every ARCHIVE_INTERVAL_SECONDS"""
+
+    def __init__(self):
+        self._background: Optional[asyncio.Task] = None
+
+    async def run_forever(self, session_maker: async_sessionmaker):
+        while True:
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+            try:
+                async with session_maker() as db:
+                    job_queue.enqueue(db, "archive_tasks")
+                    await db.commit()
+                job_queue.wake()
+            except Exception:
+                logger.exception("Scheduling archival failed")
+
+    def start(self, session_maker: async_sessionmaker):
+        if self._background is None:
+            self._background = asyncio.create_task(self.run_forever(session_maker))
+
+    async def stop(self):
+        if self._background is not None:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
+
+
+# Global instance
+archiver = Archiver()
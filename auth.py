@@ -1,16 +1,20 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, WebSocket
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import os
 from dotenv import load_dotenv
+import asyncio
 import secrets
+import time
+from functools import lru_cache
 
-from database import get_db
+from database import get_db, async_session_maker
+from serialization import receive_frame, decode
 from models import Entity, EntityType
+from metrics import auth_cache_lookups
 from schemas import TokenData
 
 load_dotenv()
@@ -18,18 +22,32 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_SIZE = 100_000
+# WebSockets must present an API key, a JWT, or a board token (see create_board_token)
+WS_AUTH_REQUIRED = os.getenv("WS_AUTH_REQUIRED", "true").lower() == "true"
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+BOARD_TOKEN_EXPIRE_HOURS = int(os.getenv("BOARD_TOKEN_EXPIRE_HOURS", "12"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# API key -> (entity id, cached at); used by hot endpoints that only need the caller's id
+_api_key_cache: Dict[str, Tuple[int, float]] = {}
+
+@lru_cache(maxsize=1)
+def password_context():
+    """The bcrypt context, built on first use: agents never need it, and importing passlib isn't free"""
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 
 def generate_api_key() -> str:
@@ -71,6 +89,33 @@ async def authenticate_agent(db: AsyncSession, api_key: str) -> Optional[Entity]
     return entity
 
 
+async def resolve_entity(
+    db: AsyncSession, authorization: Optional[str] = None, api_key: Optional[str] = None
+) -> Optional[Entity]:
+    """The active entity behind an API key or a Bearer token, or None if they don't check out"""
+    # Try API key first (for agents)
+    if api_key:
+        entity = await authenticate_agent(db, api_key)
+        return entity if entity and entity.is_active else None
+
+    # Try JWT token (for humans)
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.replace("Bearer ", "")
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        entity_id = payload.get("sub")
+        if entity_id is None:
+            return None
+
+        result = await db.execute(select(Entity).filter(Entity.id == entity_id))
+        entity = result.scalar_one_or_none()
+        return entity if entity and entity.is_active else None
+
+    return None
+
+
 async def get_current_entity(
     authorization: Optional[str] = Header(None),
     x_api_key: Optional[str] = Header(None),
@@ -80,38 +125,49 @@ async def get_current_entity(
     Get current authenticated entity (human or agent)
     Supports both JWT tokens (Bearer) and API keys (X-API-Key header)
     """
+    entity = await resolve_entity(db, authorization, x_api_key)
+    if entity is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return entity
+
+
+async def get_current_agent_id(
+    x_api_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+) -> int:
+    """
+    Get the authenticated agent's id from its API key.
+    Cheaper than get_current_entity for high-frequency calls such as heartbeats:
+    keys are cached in memory for AUTH_CACHE_TTL_SECONDS, so a deactivated
+    agent can keep access for up to that long.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    # Try API key first (for agents)
-    if x_api_key:
-        entity = await authenticate_agent(db, x_api_key)
-        if entity and entity.is_active:
-            return entity
+    if not x_api_key:
         raise credentials_exception
-    
-    # Try JWT token (for humans)
-    if authorization and authorization.startswith("Bearer "):
-        token = authorization.replace("Bearer ", "")
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            entity_id: int = payload.get("sub")
-            if entity_id is None:
-                raise credentials_exception
-        except JWTError:
-            raise credentials_exception
-        
-        result = await db.execute(select(Entity).filter(Entity.id == entity_id))
-        entity = result.scalar_one_or_none()
-        
-        if entity is None or not entity.is_active:
-            raise credentials_exception
-        return entity
-    
-    raise credentials_exception
+
+    now = time.monotonic()
+    cached = _api_key_cache.get(x_api_key)
+    if cached and now - cached[1] < AUTH_CACHE_TTL_SECONDS:
+        auth_cache_lookups.inc(1, "hit")
+        return cached[0]
+    auth_cache_lookups.inc(1, "miss")
+
+    entity = await authenticate_agent(db, x_api_key)
+    if not entity or not entity.is_active:
+        _api_key_cache.pop(x_api_key, None)
+        raise credentials_exception
+
+    if len(_api_key_cache) >= AUTH_CACHE_MAX_SIZE:
+        _api_key_cache.clear()
+    _api_key_cache[x_api_key] = (entity.id, now)
+    return entity.id
 
 
 async def get_current_active_entity(
@@ -121,3 +177,54 @@ async def get_current_active_entity(
     if not current_entity.is_active:
         raise HTTPException(status_code=400, detail="Inactive entity")
     return current_entity
+
+
+def create_board_token(project_id: int) -> str:
+    """
+    A token that lets the kanban page's WebSocket watch one project. The
+    board page is public, so it grants nothing the page doesn't already show;
+    it keeps anonymous sockets off every other project and off /ws.
+    """
+    return create_access_token({"board": project_id}, timedelta(hours=BOARD_TOKEN_EXPIRE_HOURS))
+
+
+def board_token_project(token: str) -> Optional[int]:
+    try:
+        project_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("board")
+    except JWTError:
+        return None
+    return project_id if isinstance(project_id, int) else None
+
+
+async def authenticate_websocket(
+    websocket: WebSocket, project_id: Optional[int] = None
+) -> Tuple[bool, Optional[Entity]]:
+    """
+    Authenticate an accepted socket once, before it is subscribed. Credentials
+    come from the ``api_key``/``token`` query parameters, the X-API-Key or
+    Authorization headers, or else a first frame
+    {"type": "auth", "api_key": ...} or {"type": "auth", "token": ...} sent
+    within WS_AUTH_TIMEOUT_SECONDS. ``token`` is a JWT, or a board token for
+    ``project_id``. Returns whether the socket may stay, and its entity if any.
+    """
+    api_key = websocket.query_params.get("api_key") or websocket.headers.get("x-api-key")
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization") or (f"Bearer {token}" if token else None)
+    if not api_key and not authorization:
+        if not WS_AUTH_REQUIRED:
+            return True, None
+        try:
+            frame = decode(await asyncio.wait_for(receive_frame(websocket), WS_AUTH_TIMEOUT_SECONDS))
+        except Exception:  # Timed out or disconnected
+            return False, None
+        if not isinstance(frame, dict) or frame.get("type") != "auth":
+            return False, None
+        api_key = frame.get("api_key") if isinstance(frame.get("api_key"), str) else None
+        token = frame.get("token") if isinstance(frame.get("token"), str) else None
+        authorization = f"Bearer {token}" if token else None
+
+    if token and project_id is not None and board_token_project(token) == project_id:
+        return True, None
+    async with async_session_maker() as db:
+        entity = await resolve_entity(db, authorization, api_key)
+    return entity is not None, entity
@@ -0,0 +1,18 @@
+"""
+Benchmark and load-test suite for the Kanban PM API.
+
+    python -m benchmarks seed --database-url sqlite+aiosqlite:///./bench.db --tasks 1000000
+    python -m benchmarks run --database-url sqlite+aiosqlite:///./bench.db --mode inprocess \
+        --scenario agent_workflow --scenario board --concurrency 32 --duration 30
+    python -m benchmarks compare results/old.json results/new.json
+    python -m benchmarks --check-startup --max-ready 2
+
+``run`` drives the app in-process (httpx ASGI transport), against a local
+uvicorn it starts itself (``--mode uvicorn``), or against an already running
+server (``--url``). Results hold p50/p95/p99 latency and throughput per
+operation plus the git commit, and are written as JSON for comparison
+across commits.
+
+``--check-startup`` boots the app in a fresh interpreter and breaks the
+time to ready down into imports (per top-level module) and startup phases.
+"""
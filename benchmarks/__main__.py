@@ -0,0 +1,320 @@
+"""Command line entry point: ``python -m benchmarks {seed,run,compare}`` or ``--check-startup``"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./bench.db"
+RESULTS_DIR = os.path.join(PROJECT_DIR, "benchmarks", "results")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def uvicorn_server(database_url: str):
+    """Start the app under uvicorn in a subprocess and wait until /health answers"""
+    import httpx
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_DIR,
+        env={**os.environ, "DATABASE_URL": database_url},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient() as probe:
+            for _ in range(100):
+                try:
+                    if (await probe.get(f"{base_url}/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if process.poll() is not None:
+                    raise SystemExit("uvicorn exited during startup")
+                await asyncio.sleep(0.1)
+            else:
+                raise SystemExit("uvicorn did not become healthy")
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+async def command_seed(args) -> None:
+    from benchmarks.seed import seed
+
+    start = time.perf_counter()
+    counts = await seed(
+        args.database_url,
+        projects=args.projects,
+        tasks=args.tasks,
+        agents=args.agents,
+        comments=args.comments,
+        open_ratio=args.open_ratio,
+        reset=args.reset,
+    )
+    print(f"Seeded {counts} in {time.perf_counter() - start:.1f}s")
+
+
+async def command_run(args) -> None:
+    # The app reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    # Scenarios measure capacity, so per-client limits would only distort them
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    import httpx
+    from benchmarks import micro
+    from benchmarks.scenarios import SCENARIOS, applied_throughput, run_scenario
+    from benchmarks.seed import load_context
+
+    ctx = await load_context(args.database_url)
+    mode = "url" if args.url else args.mode
+    results: Dict = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "mode": mode,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "dataset": {"projects": len(ctx["project_ids"]), "agents": len(ctx["api_keys"]), "tasks": ctx["task_count"]},
+        },
+        "scenarios": {},
+    }
+
+    async def run_scenarios(base_url: str, transport=None):
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=60) as client:
+            for name in args.scenario:
+                scenario = SCENARIOS[name](ctx, base_url, transport)
+                scenario.subscribers = args.ws_subscribers
+                if scenario.requires_server and transport is not None:
+                    print(f"Skipping {name}: needs --mode uvicorn or --url")
+                    continue
+                print(f"Running {name} ({args.concurrency} workers, {args.duration}s)...")
+                results["scenarios"][name] = await run_scenario(
+                    scenario, client, args.concurrency, args.duration, args.warmup
+                )
+            if "occ_contention" in results["scenarios"] and "occ_serialized" in results["scenarios"]:
+                results["occ_vs_serialized"] = {
+                    "occ_applied_per_s": applied_throughput(results["scenarios"]["occ_contention"]),
+                    "serialized_applied_per_s": applied_throughput(results["scenarios"]["occ_serialized"]),
+                }
+            if args.micro:
+                engine = None
+                if transport is not None:
+                    from database import engine
+                results["micro"] = await micro.run_all(client if engine else None, engine, ctx)
+
+    if mode == "inprocess":
+        import main
+        await main.startup_event()
+        try:
+            await run_scenarios("http://bench", httpx.ASGITransport(app=main.app, raise_app_exceptions=False))
+        finally:
+            await main.shutdown_event()
+    elif mode == "uvicorn":
+        async with uvicorn_server(args.database_url) as base_url:
+            await run_scenarios(base_url)
+    else:
+        await run_scenarios(args.url.rstrip("/"))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['meta']['commit'] or 'local'}-{mode}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as handle:
+        json.dump(results, handle, indent=2)
+
+    for name, summary in results["scenarios"].items():
+        print(f"\n{name}")
+        for operation, stats in summary["operations"].items():
+            print(
+                f"  {operation:24} p50 {stats['p50_ms']:8.2f}ms  p95 {stats['p95_ms']:8.2f}ms  "
+                f"p99 {stats['p99_ms']:8.2f}ms  {stats['throughput_rps']:8.1f}/s  errors {stats['errors']}"
+            )
+        if summary.get("counters"):
+            print(f"  counters: {summary['counters']}")
+    if "occ_vs_serialized" in results:
+        comparison = results["occ_vs_serialized"]
+        print(
+            f"\nApplied hot-task updates: OCC {comparison['occ_applied_per_s']:.1f}/s, "
+            f"serialized {comparison['serialized_applied_per_s']:.1f}/s"
+        )
+    print(f"\nWrote {output}")
+
+
+# Run in a fresh interpreter under -X importtime: import the app, start it, report JSON on stdout
+STARTUP_PROBE = """
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def boot():
+    await main.startup_event()
+    ready = time.perf_counter()
+    await main.shutdown_event()
+    return ready
+
+ready = asyncio.run(boot())
+print(json.dumps({"import_s": imported - start, "ready_s": ready - start, "phases": main.startup.timings}))
+"""
+
+
+def import_times(importtime_log: str) -> Dict[str, float]:
+    """Cumulative import seconds per top-level module, from ``-X importtime`` output"""
+    totals: Dict[str, float] = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented; the first, unindented line of a package carries its total
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        top = name.strip().split(".")[0]
+        totals[top] = totals.get(top, 0.0) + int(cumulative) / 1e6
+    return totals
+
+
+def command_check_startup(args) -> int:
+    """Time a cold start of the app; returns 1 if it's ready later than --max-ready seconds"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_PROBE],
+        cwd=PROJECT_DIR, capture_output=True, text=True,
+        env={**os.environ, "DATABASE_URL": args.database_url},
+    )
+    if process.returncode != 0:
+        print(process.stderr[-4000:], file=sys.stderr)
+        raise SystemExit("App failed to start")
+    report = json.loads(process.stdout.strip().splitlines()[-1])
+    imports = sorted(import_times(process.stderr).items(), key=lambda item: item[1], reverse=True)
+
+    print(f"import main {report['import_s'] * 1000:8.1f}ms")
+    for name, seconds in imports[:args.top]:
+        print(f"  {name:28} {seconds * 1000:8.1f}ms")
+    print(f"startup     {(report['ready_s'] - report['import_s']) * 1000:8.1f}ms")
+    for name, seconds in report["phases"].items():
+        print(f"  {name:28} {seconds * 1000:8.1f}ms")
+    print(f"ready after {report['ready_s'] * 1000:8.1f}ms")
+    return 1 if args.max_ready and report["ready_s"] > args.max_ready else 0
+
+
+def command_compare(args) -> int:
+    """Print per-operation changes; returns 1 if any p95 regressed by more than --threshold percent"""
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.candidate) as handle:
+        candidate = json.load(handle)
+
+    def change(old: float, new: float) -> float:
+        return (new - old) / old * 100 if old else 0.0
+
+    print(f"{baseline['meta'].get('commit')} -> {candidate['meta'].get('commit')}")
+    regressions = 0
+    for name, summary in candidate["scenarios"].items():
+        old_operations = baseline["scenarios"].get(name, {}).get("operations", {})
+        print(f"\n{name}")
+        for operation, stats in summary["operations"].items():
+            old = old_operations.get(operation)
+            if old is None:
+                print(f"  {operation:24} (new)")
+                continue
+            p95_change = change(old["p95_ms"], stats["p95_ms"])
+            regressed = p95_change > args.threshold
+            regressions += regressed
+            print(
+                f"  {operation:24} p50 {change(old['p50_ms'], stats['p50_ms']):+7.1f}%  "
+                f"p95 {p95_change:+7.1f}%  p99 {change(old['p99_ms'], stats['p99_ms']):+7.1f}%  "
+                f"throughput {change(old['throughput_rps'], stats['throughput_rps']):+7.1f}%"
+                + ("  REGRESSION" if regressed else "")
+            )
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+def main(argv=None) -> int:
+    sys.path.insert(0, PROJECT_DIR)
+    os.chdir(PROJECT_DIR)
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Kanban PM benchmarks")
+    parser.add_argument(
+        "--check-startup", action="store_true",
+        help="Start the app in a fresh interpreter and report import and ready-time breakdowns",
+    )
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL, help="Database for --check-startup")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list with --check-startup")
+    parser.add_argument("--max-ready", type=float, help="With --check-startup, fail if not ready within this many seconds")
+    commands = parser.add_subparsers(dest="command")
+
+    seed_parser = commands.add_parser("seed", help="Create and fill a benchmark database")
+    seed_parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    seed_parser.add_argument("--projects", type=int, default=200)
+    seed_parser.add_argument("--tasks", type=int, default=1_000_000)
+    seed_parser.add_argument("--agents", type=int, default=1000)
+    seed_parser.add_argument("--comments", type=int, default=500_000)
+    seed_parser.add_argument("--open-ratio", type=float, default=0.02, help="Share of tasks pending or in progress")
+    seed_parser.add_argument("--reset", action="store_true", help="Drop existing tables first")
+
+    run_parser = commands.add_parser("run", help="Run load scenarios and write results as JSON")
+    run_parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    run_parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    run_parser.add_argument("--url", help="Target an already running server instead")
+    run_parser.add_argument(
+        "--scenario", action="append",
+        choices=["agent_workflow", "board", "search", "occ_contention", "occ_serialized", "ws_fanout"],
+        help="Repeat to run several (default: agent_workflow and board); occ_contention brings occ_serialized along",
+    )
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=30.0)
+    run_parser.add_argument("--warmup", type=float, default=5.0)
+    run_parser.add_argument("--ws-subscribers", type=int, default=200, help="WebSocket clients in ws_fanout")
+    run_parser.add_argument("--micro", action="store_true", help="Also run the micro-benchmarks (scheduler, broadcast, WebSocket sweep, job queue, payload size, wire formats, board render, round trips)")
+    run_parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>-<mode>.json)")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="p95 regression threshold in percent")
+    compare_parser.add_argument("--fail-on-regression", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.check_startup:
+        return command_check_startup(args)
+    if args.command is None:
+        parser.error("a command or --check-startup is required")
+    if args.command == "seed":
+        asyncio.run(command_seed(args))
+    elif args.command == "run":
+        args.scenario = args.scenario or ["agent_workflow", "board"]
+        # OCC throughput only means something next to the serialized baseline
+        if "occ_contention" in args.scenario and "occ_serialized" not in args.scenario:
+            args.scenario.append("occ_serialized")
+        asyncio.run(command_run(args))
+    else:
+        return command_compare(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
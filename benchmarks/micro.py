@@ -0,0 +1,704 @@
+"""
+Micro-benchmarks for components that can be measured without load:
+scheduler dispatch, WebSocket broadcast fan-out and heartbeat sweeps,
+background job throughput, project detail payload size and compression
+cost, JSON versus MessagePack, kanban board render cost, write throughput
+on one versus several shard files, buffered versus synchronous comments,
+activity log overhead on task updates, and SQL round trips per endpoint.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.seed import SHARED_TABLES_IN_DATABASE, SKILLS
+from benchmarks.stats import LatencyRecorder
+
+
+def scheduler_dispatch(agents: int = 1000, tasks: int = 100_000, random_seed: int = 42) -> Dict:
+    """Dispatch decisions per second for the skill-heap scheduler, without the database"""
+    from scheduler import AgentSlot, Dispatcher
+
+    rng = random.Random(random_seed)
+    slots = [
+        AgentSlot(agent_id, set(rng.sample(SKILLS, rng.randint(1, 3))), rng.randint(50, 150), 0)
+        for agent_id in range(agents)
+    ]
+    required = [set(rng.sample(SKILLS, rng.randint(0, 2))) for _ in range(tasks)]
+
+    start = time.perf_counter()
+    dispatcher = Dispatcher(slots)
+    assigned = sum(1 for skills in required if dispatcher.assign(skills) is not None)
+    elapsed = time.perf_counter() - start
+    return {
+        "agents": agents,
+        "tasks": tasks,
+        "assigned": assigned,
+        "seconds": round(elapsed, 4),
+        "decisions_per_s": round(tasks / elapsed, 1),
+    }
+
+
+class _SinkWebSocket:
+    """Stands in for a client connection; sends go nowhere"""
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        pass
+
+    async def send_bytes(self, frame):
+        pass
+
+
+async def broadcast_fanout(connections: int = 1000, messages: int = 200, stages: int = 50) -> Dict:
+    """
+    Latency of ConnectionManager.broadcast_to_project to ``connections``
+    in-memory sockets: first with every socket unfiltered, then with each
+    socket subscribed to one of ``stages`` stages, where an event should only
+    cost the sockets on its own stage.
+    """
+    from websocket_manager import ConnectionManager, create_notification
+
+    async def run(subscribe) -> Dict:
+        manager = ConnectionManager()
+        for index in range(connections):
+            socket = _SinkWebSocket()
+            await manager.connect(socket, project_id=1)
+            subscribe(manager, socket, index)
+
+        rec = LatencyRecorder()
+        delivered = 0
+        for index in range(messages):
+            task = {"id": index, "priority": index % 10, "stage_id": index % stages, "assignee_ids": []}
+            message = create_notification("task_updated", {"task": task}, project_id=1)
+            delivered += len(manager.matching(message, 1))
+            start = time.perf_counter()
+            await manager.broadcast_to_project(message, 1)
+            rec.record("broadcast", time.perf_counter() - start)
+        summary = rec.summary()["operations"]["broadcast"]
+        summary["connections"] = connections
+        summary["deliveries_per_message"] = delivered / messages
+        return summary
+
+    return {
+        "unfiltered": await run(lambda manager, socket, index: None),
+        "by_stage": await run(lambda manager, socket, index: manager.subscribe(socket, stage_ids=[index % stages])),
+    }
+
+
+class _ClientWebSocket(_SinkWebSocket):
+    """
+    A simulated client. A live one answers pings at once; the others went
+    away without closing: their sends fail (``reset``), succeed with nobody
+    reading (``silent``), or never complete (``stalled``).
+    """
+
+    def __init__(self, manager, mode: str = "live"):
+        self.manager = manager
+        self.mode = mode
+
+    async def send_text(self, frame):
+        if self.mode == "reset":
+            raise ConnectionResetError("peer went away")
+        if self.mode == "stalled":
+            await asyncio.Event().wait()
+        if self.mode == "live" and frame == '{"type":"ping"}':
+            self.manager.touch(self, active=False)
+
+    async def close(self, code: int = 1000):
+        await self.send_text("")
+
+
+async def websocket_sweep(clients: int = 5000, dropped: float = 0.4, messages: int = 50) -> Dict:
+    """
+    Heartbeat sweeps over ``clients`` simulated sockets, a ``dropped``
+    fraction of which vanished abruptly (equally reset, silent and stalled).
+    Runs the sweeper at the ping interval and again past the pong timeout on
+    a simulated clock, and measures broadcast latency with the silent
+    zombies still registered and after they are evicted.
+    """
+    from websocket_manager import ConnectionManager, create_notification
+
+    manager = ConnectionManager(ping_interval=20, pong_timeout=20, max_connections=clients, send_timeout=0.05)
+    rng = random.Random(7)
+    modes = {"live": 0, "reset": 0, "silent": 0, "stalled": 0}
+    for _ in range(clients):
+        mode = rng.choice(("reset", "silent", "stalled")) if rng.random() < dropped else "live"
+        modes[mode] += 1
+        await manager.connect(_ClientWebSocket(manager, mode), project_id=1)
+
+    async def broadcast_ms() -> float:
+        message = create_notification("tasks_changed", {}, project_id=1)
+        start = time.perf_counter()
+        for _ in range(messages):
+            await manager.broadcast_to_project(message, 1)
+        return round((time.perf_counter() - start) / messages * 1000, 3)
+
+    now = time.monotonic()
+    start = time.perf_counter()
+    first = await manager.sweep(now + manager.ping_interval)
+    first["seconds"] = round(time.perf_counter() - start, 4)
+    states = manager.states(now + manager.ping_interval)
+    with_zombies = await broadcast_ms()
+
+    start = time.perf_counter()
+    second = await manager.sweep(now + manager.ping_interval + manager.pong_timeout)
+    second["seconds"] = round(time.perf_counter() - start, 4)
+    return {
+        "clients": clients,
+        "modes": modes,
+        "first_sweep": first,
+        "states_after_first_sweep": states,
+        "second_sweep": second,
+        "remaining": len(manager.subscriptions),
+        "leaked": len(manager.subscriptions) - modes["live"],
+        "broadcast_ms_with_zombies": with_zombies,
+        "broadcast_ms_after_sweep": await broadcast_ms(),
+    }
+
+
+async def job_throughput(jobs: int = 2000, workers: int = 4, work_seconds: float = 0.001) -> Dict:
+    """
+    Jobs per second through a JobQueue on a scratch SQLite database, for a
+    no-op handler that sleeps ``work_seconds``. Also checks that a per-kind
+    limit of 1 is never exceeded and that failing jobs end up failed after
+    their retries.
+    """
+    from sqlalchemy import func, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from jobs import JobQueue
+    from models import Base, Job, JobStatus
+
+    directory = tempfile.mkdtemp(prefix="bench-jobs-")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{os.path.join(directory, 'jobs.db')}", execution_options=SHARED_TABLES_IN_DATABASE
+    )
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    queue = JobQueue(workers=workers, kind_limits={"serial": 1})
+    peak = {"serial": 0}
+
+    @queue.handler("noop")
+    async def noop(db, job):
+        await asyncio.sleep(work_seconds)
+
+    @queue.handler("serial")
+    async def serial(db, job):
+        peak["serial"] = max(peak["serial"], queue.running["serial"])
+        await asyncio.sleep(work_seconds)
+
+    @queue.handler("broken")
+    async def broken(db, job):
+        raise RuntimeError("expected failure")
+
+    kinds = ["noop"] * (jobs - jobs // 10 - 10) + ["serial"] * (jobs // 10) + ["broken"] * 10
+    async with session_maker() as db:
+        for kind in kinds:
+            queue.enqueue(db, kind, max_attempts=2)
+        await db.commit()
+
+    # Every broken job runs twice
+    expected = len(kinds) + 10
+    try:
+        start = time.perf_counter()
+        await queue.start(session_maker)
+        while queue.processed < expected:
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        async with session_maker() as db:
+            counts = dict((await db.execute(select(Job.status, func.count()).group_by(Job.status))).all())
+    finally:
+        await queue.stop()
+        await engine.dispose()
+
+    return {
+        "jobs": len(kinds),
+        "workers": workers,
+        "seconds": round(elapsed, 4),
+        "jobs_per_s": round(len(kinds) / elapsed, 1),
+        "succeeded": counts.get(JobStatus.SUCCEEDED, 0),
+        "failed": counts.get(JobStatus.FAILED, 0),
+        "serial_peak_concurrency": peak["serial"],
+    }
+
+
+async def shard_writes(shard_counts: Tuple[int, ...] = (1, 16), writers: int = 32, writes: int = 200) -> Dict:
+    """
+    Commits per second from ``writers`` concurrent writers, each committing
+    ``writes`` one-row transactions to the SQLite file of its project
+    (writer i writes to shard i % shards), for each shard count. WAL mode as
+    in database.py; lock errors are counted rather than retried.
+    """
+    from sqlalchemy import Column, Integer, MetaData, String, Table, event
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    metadata = MetaData()
+    rows = Table(
+        "writes", metadata,
+        Column("id", Integer, primary_key=True), Column("writer", Integer), Column("body", String(200))
+    )
+
+    results = {}
+    for shards in shard_counts:
+        directory = tempfile.mkdtemp(prefix=f"bench-shards-{shards}-")
+        engines = []
+        for shard in range(shards):
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, f'shard-{shard}.db')}")
+
+            @event.listens_for(engine.sync_engine, "connect")
+            def set_journal_mode(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.close()
+
+            async with engine.begin() as conn:
+                await conn.run_sync(metadata.create_all)
+            engines.append(engine)
+
+        errors = 0
+
+        async def writer(number: int):
+            nonlocal errors
+            engine = engines[number % shards]
+            for write in range(writes):
+                try:
+                    async with engine.begin() as conn:
+                        await conn.execute(rows.insert().values(writer=number, body=f"update {write}"))
+                except OperationalError:
+                    errors += 1
+
+        try:
+            start = time.perf_counter()
+            await asyncio.gather(*(writer(number) for number in range(writers)))
+            elapsed = time.perf_counter() - start
+        finally:
+            for engine in engines:
+                await engine.dispose()
+
+        committed = writers * writes - errors
+        results[f"{shards}_shards"] = {
+            "seconds": round(elapsed, 4),
+            "commits_per_s": round(committed / elapsed, 1),
+            "errors": errors,
+        }
+    results["writers"] = writers
+    return results
+
+
+async def comment_ingest(comments: int = 5000, writers: int = 16, tasks: int = 100) -> Dict:
+    """
+    Comments per second on a scratch SQLite database from ``writers``
+    concurrent posters, written the way ``POST /comments`` does: one
+    INSERT ... SELECT and commit each, against the write-behind buffer
+    (acknowledged at once, committed in batches). Buffered throughput is
+    given both to the last acknowledgement and to the last commit.
+    """
+    from datetime import datetime
+
+    from sqlalchemy import func, insert, literal, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from models import Base, Comment, Entity, EntityType, Project, Stage, Task
+    from writebehind import CommentBuffer
+
+    directory = tempfile.mkdtemp(prefix="bench-comments-")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{os.path.join(directory, 'comments.db')}", execution_options=SHARED_TABLES_IN_DATABASE
+    )
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Entity), [
+            {"id": 1, "name": "agent", "entity_type": EntityType.AGENT, "is_active": True}
+        ])
+        await conn.execute(insert(Project), [{"id": 1, "name": "Benchmark", "creator_id": 1, "version": 1}])
+        await conn.execute(insert(Stage), [{"id": 1, "project_id": 1, "name": "Stage", "order": 1, "version": 1}])
+        await conn.execute(insert(Task), [
+            {"id": index, "project_id": 1, "stage_id": 1, "title": f"Task {index}", "version": 1}
+            for index in range(1, tasks + 1)
+        ])
+
+    per_writer = comments // writers
+
+    async def synchronous(number: int):
+        for write in range(per_writer):
+            task_id = (number * per_writer + write) % tasks + 1
+            async with session_maker() as db:
+                columns = {
+                    "content": literal(f"progress {write}"), "task_id": Task.id,
+                    "author_id": literal(1), "created_at": literal(datetime.utcnow()),
+                }
+                await db.execute(
+                    insert(Comment)
+                    .from_select(list(columns), select(*columns.values()).where(Task.id == task_id))
+                    .returning(Comment)
+                )
+                await db.commit()
+
+    buffer = CommentBuffer(enabled=True)
+    for task_id in range(1, tasks + 1):
+        buffer.task_exists(task_id)
+
+    async def buffered(number: int):
+        for write in range(per_writer):
+            task_id = (number * per_writer + write) % tasks + 1
+            if not buffer.accepts(task_id):
+                raise RuntimeError("Comment buffer is full")
+            buffer.add(0, task_id, 1, f"progress {write}")
+            # A request handler yields to the event loop at least once
+            await asyncio.sleep(0)
+
+    total = per_writer * writers
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(synchronous(number) for number in range(writers)))
+        synchronous_seconds = time.perf_counter() - start
+
+        buffer.start([session_maker])
+        start = time.perf_counter()
+        await asyncio.gather(*(buffered(number) for number in range(writers)))
+        acknowledged_seconds = time.perf_counter() - start
+        await buffer.stop([session_maker])
+        committed_seconds = time.perf_counter() - start
+
+        async with session_maker() as db:
+            stored = (await db.execute(select(func.count()).select_from(Comment))).scalar_one()
+    finally:
+        await engine.dispose()
+
+    return {
+        "comments": total,
+        "writers": writers,
+        "synchronous_per_s": round(total / synchronous_seconds, 1),
+        "buffered_acknowledged_per_s": round(total / acknowledged_seconds, 1),
+        "buffered_committed_per_s": round(total / committed_seconds, 1),
+        "stored": stored,
+    }
+
+
+async def activity_overhead(updates: int = 2000, tasks: int = 100, max_overhead_pct: float = 10.0) -> Dict:
+    """
+    Cost of the activity log on the task update path, on a scratch SQLite
+    database: ``updates`` single-task updates (title and status), each in its
+    own transaction, through versioned_update() and through tracked_update(),
+    which also reads the old values and writes the field diffs. The HTTP
+    request around it is left out, so this is the worst case.
+    """
+    from sqlalchemy import func, insert, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from activity import tracked_update
+    from concurrency import versioned_update
+    from models import Activity, Base, Entity, EntityType, Project, Stage, Task, TaskStatus
+
+    directory = tempfile.mkdtemp(prefix="bench-activity-")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{os.path.join(directory, 'activity.db')}", execution_options=SHARED_TABLES_IN_DATABASE
+    )
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Entity), [
+            {"id": 1, "name": "human", "entity_type": EntityType.HUMAN, "is_active": True}
+        ])
+        await conn.execute(insert(Project), [{"id": 1, "name": "Benchmark", "creator_id": 1, "version": 1}])
+        await conn.execute(insert(Stage), [{"id": 1, "project_id": 1, "name": "Stage", "order": 1, "version": 1}])
+        await conn.execute(insert(Task), [
+            {"id": index, "project_id": 1, "stage_id": 1, "title": f"Task {index}", "version": 1}
+            for index in range(1, tasks + 1)
+        ])
+
+    statuses = list(TaskStatus)
+
+    async def run(tracked: bool) -> float:
+        start = time.perf_counter()
+        for number in range(updates):
+            values = {"title": f"Task {number}", "status": statuses[number % len(statuses)]}
+            async with session_maker() as db:
+                if tracked:
+                    await tracked_update(db, Task, number % tasks + 1, values, 1)
+                else:
+                    await versioned_update(db, Task, number % tasks + 1, values)
+                await db.commit()
+        return time.perf_counter() - start
+
+    try:
+        # Warm up, then alternate so neither side gets a warmer cache
+        await run(False)
+        plain = tracked = 0.0
+        for _ in range(2):
+            plain += await run(False)
+            tracked += await run(True)
+        async with session_maker() as db:
+            rows = (await db.execute(select(func.count()).select_from(Activity))).scalar_one()
+    finally:
+        await engine.dispose()
+
+    overhead_pct = (tracked - plain) / plain * 100
+    return {
+        "updates": updates * 2,
+        "plain_per_s": round(updates * 2 / plain, 1),
+        "tracked_per_s": round(updates * 2 / tracked, 1),
+        "overhead_pct": round(overhead_pct, 1),
+        "activity_rows": rows,
+        "within_budget": overhead_pct < max_overhead_pct,
+    }
+
+
+def payload_compression(tasks: int = 20_000, entities: int = 200, random_seed: int = 42) -> Dict:
+    """Project detail body size per shape and encoding, with the CPU time to encode it"""
+    from datetime import datetime
+
+    from compression import brotli, compress
+    from schemas import ProjectDetailResponse, NormalizedProjectDetailResponse
+
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    people = [
+        {"id": index, "name": f"agent-{index}", "entity_type": "agent", "skills": ",".join(rng.sample(SKILLS, 3)),
+         "max_concurrent_tasks": 3, "is_active": True, "created_at": now}
+        for index in range(1, entities + 1)
+    ]
+    project = {
+        "id": 1, "name": "Benchmark", "description": None, "creator_id": 1, "approval_status": "approved",
+        "created_at": now, "updated_at": now, "version": 1,
+        "stages": [
+            {"id": index, "project_id": 1, "name": f"Stage {index}", "description": None, "order": index,
+             "created_at": now, "version": 1}
+            for index in range(1, 6)
+        ],
+        "tasks": [
+            {"id": index, "title": f"Task {index}", "description": "Benchmark task " * 4,
+             "required_skills": ",".join(rng.sample(SKILLS, 2)), "priority": rng.randint(0, 9),
+             "status": "in_progress", "project_id": 1, "stage_id": rng.randint(1, 5), "parent_task_id": None,
+             "created_at": now, "updated_at": now, "completed_at": None, "version": 1,
+             "assignees": rng.sample(people, 2)}
+            for index in range(1, tasks + 1)
+        ],
+    }
+
+    results = {}
+    for shape, schema in (("nested", ProjectDetailResponse), ("normalized", NormalizedProjectDetailResponse)):
+        start = time.perf_counter()
+        body = schema.model_validate(project).model_dump_json().encode()
+        row = {"bytes": len(body), "serialize_ms": round((time.perf_counter() - start) * 1000, 2)}
+        for encoding in ("gzip", "br") if brotli is not None else ("gzip",):
+            start = time.perf_counter()
+            compressed = compress(body, encoding)
+            row[f"{encoding}_bytes"] = len(compressed)
+            row[f"{encoding}_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        results[shape] = row
+    results["tasks"] = tasks
+    return results
+
+
+def wire_formats(tasks: int = 500, rounds: int = 50, random_seed: int = 42) -> Dict:
+    """
+    Size and encode/decode time of a task list, and of a single task, as
+    JSON and as MessagePack: the same rendering the negotiated responses
+    and WebSocket frames use.
+    """
+    import json
+    import zlib
+    from datetime import datetime
+
+    from schemas import TaskResponse
+    from serialization import encode, msgpack
+
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    people = [
+        {"id": index, "name": f"agent-{index}", "entity_type": "agent", "skills": ",".join(rng.sample(SKILLS, 3)),
+         "max_concurrent_tasks": 3, "is_active": True, "created_at": now}
+        for index in range(1, 51)
+    ]
+    content = [
+        TaskResponse.model_validate({
+            "id": index, "title": f"Task {index}", "description": "Benchmark task " * 4,
+            "required_skills": ",".join(rng.sample(SKILLS, 2)), "priority": rng.randint(0, 9),
+            "status": "in_progress", "project_id": 1, "stage_id": rng.randint(1, 5), "parent_task_id": None,
+            "created_at": now, "updated_at": now, "completed_at": None, "version": 1,
+            "assignees": rng.sample(people, rng.randint(0, 2)),
+        }).model_dump(mode="json")
+        for index in range(1, tasks + 1)
+    ]
+
+    def measure(payload, encoder, decoder) -> Dict:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            body = encoder(payload)
+        encode_seconds = (time.perf_counter() - start) / rounds
+        start = time.perf_counter()
+        for _ in range(rounds):
+            decoder(body)
+        decode_seconds = (time.perf_counter() - start) / rounds
+        raw = body.encode() if isinstance(body, str) else body
+        return {
+            "bytes": len(raw),
+            "gzip_bytes": len(zlib.compress(raw, 6)),
+            "encode_us": round(encode_seconds * 1e6, 1),
+            "decode_us": round(decode_seconds * 1e6, 1),
+        }
+
+    formats = {"json": (lambda payload: encode(payload, "json"), json.loads)}
+    if msgpack is not None:
+        formats["msgpack"] = (lambda payload: encode(payload, "msgpack"), lambda body: msgpack.unpackb(body, raw=False))
+    results = {"tasks": tasks, "msgpack_installed": msgpack is not None}
+    for name, (encoder, decoder) in formats.items():
+        results[name] = {
+            "task_list": measure(content, encoder, decoder),
+            "single_task": measure(content[0], encoder, decoder),
+        }
+    return results
+
+
+async def board_render(tasks: int = 50_000, stages: int = 5, entities: int = 200, random_seed: int = 42) -> Dict:
+    """
+    Server time and HTML size of the kanban board for one project of
+    ``tasks`` tasks on a scratch SQLite database: the paged board (first
+    BOARD_PAGE_SIZE cards per column) against rendering every card, plus the
+    cost of loading one further page of a column. Cards in the HTML stand in
+    for time to first paint, which needs a browser to measure.
+    """
+    from types import SimpleNamespace
+
+    from fastapi.templating import Jinja2Templates
+    from sqlalchemy import insert, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import selectinload
+    from board import BOARD_PAGE_SIZE, first_pages, stage_page
+    from models import Base, Entity, EntityType, Project, Stage, Task, TaskStatus, task_assignments
+
+    rng = random.Random(random_seed)
+    directory = tempfile.mkdtemp(prefix="bench-board-")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{os.path.join(directory, 'board.db')}", execution_options=SHARED_TABLES_IN_DATABASE
+    )
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Entity), [
+            {"id": index, "name": f"agent-{index}", "entity_type": EntityType.AGENT, "is_active": True,
+             "max_concurrent_tasks": 3, "skills": ",".join(rng.sample(SKILLS, 2))}
+            for index in range(1, entities + 1)
+        ])
+        await conn.execute(insert(Project), [{"id": 1, "name": "Benchmark", "creator_id": 1, "version": 1}])
+        await conn.execute(insert(Stage), [
+            {"id": index, "project_id": 1, "name": f"Stage {index}", "order": index, "version": 1}
+            for index in range(1, stages + 1)
+        ])
+        statuses = list(TaskStatus)
+        await conn.execute(insert(Task), [
+            {"id": index, "project_id": 1, "stage_id": rng.randint(1, stages), "title": f"Task {index}",
+             "description": "Benchmark task description " * 3, "status": rng.choice(statuses),
+             "priority": rng.randint(0, 9), "required_skills": ",".join(rng.sample(SKILLS, 2)), "version": 1}
+            for index in range(1, tasks + 1)
+        ])
+        await conn.execute(insert(task_assignments), [
+            {"task_id": index, "entity_id": rng.randint(1, entities)} for index in range(1, tasks + 1)
+        ])
+
+    template = Jinja2Templates(
+        directory=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+    ).get_template("kanban_board.html")
+    request = SimpleNamespace(url=SimpleNamespace(path="/ui/projects/1/board"))
+
+    async def render(load_all: bool) -> Dict:
+        start = time.perf_counter()
+        async with session_maker() as db:
+            result = await db.execute(select(Project).where(Project.id == 1).options(selectinload(Project.stages)))
+            project = result.scalar_one()
+            if load_all:
+                result = await db.execute(select(Task).where(Task.project_id == 1).options(selectinload(Task.assignees)))
+                stage_tasks: Dict[int, List] = {}
+                for task in result.scalars():
+                    stage_tasks.setdefault(task.stage_id, []).append(task)
+                counts = {stage_id: len(column) for stage_id, column in stage_tasks.items()}
+            else:
+                stage_tasks, counts = await first_pages(db, 1)
+        queried = time.perf_counter()
+        html = template.render(
+            request=request, project=project, stage_tasks=stage_tasks, stage_counts=counts, server_time=""
+        )
+        done = time.perf_counter()
+        return {
+            "query_ms": round((queried - start) * 1000, 1),
+            "render_ms": round((done - queried) * 1000, 1),
+            "html_bytes": len(html.encode()),
+            "cards": html.count('class="kanban-task"'),
+        }
+
+    try:
+        paged = await render(load_all=False)
+        full = await render(load_all=True)
+        async with session_maker() as db:
+            start = time.perf_counter()
+            page = await stage_page(db, 1, 1, after=tasks // 2)
+            page_ms = (time.perf_counter() - start) * 1000
+    finally:
+        await engine.dispose()
+
+    return {
+        "tasks": tasks,
+        "page_size": BOARD_PAGE_SIZE,
+        "paged": paged,
+        "full": full,
+        "next_page_ms": round(page_ms, 2),
+        "next_page_cards": len(page["tasks"]),
+    }
+
+
+async def round_trips(client: httpx.AsyncClient, engine, ctx: Dict) -> Dict[str, Dict]:
+    """SQL statements and DB time per call for the main endpoints (in-process only)"""
+    from profiling import capture_queries
+
+    headers = {"X-API-Key": ctx["api_keys"][0]}
+    project_id = ctx["project_ids"][0]
+    task_id = ctx["open_task_ids"][0] if ctx["open_task_ids"] else 1
+    endpoints: List[Tuple[str, str, str, Dict]] = [
+        ("dashboard", "GET", "/", {}),
+        ("board_html", "GET", f"/ui/projects/{project_id}/board", {}),
+        ("project_detail", "GET", f"/projects/{project_id}", {"headers": headers}),
+        ("task_detail", "GET", f"/tasks/{task_id}", {"headers": headers}),
+        ("update_task", "PATCH", f"/tasks/{task_id}", {"headers": headers, "json": {"priority": 5}}),
+        ("add_comment", "POST", "/comments", {"headers": headers, "json": {"task_id": task_id, "content": "x"}}),
+        ("heartbeat", "POST", "/agents/heartbeat", {"headers": headers}),
+        ("search", "GET", "/search", {"headers": headers, "params": {"q": "cache"}}),
+    ]
+
+    results = {}
+    for name, method, path, kwargs in endpoints:
+        with capture_queries(engine, name) as profile:
+            response = await client.request(method, path, **kwargs)
+        results[name] = {
+            "status": response.status_code,
+            "queries": profile.count,
+            "db_time_ms": round(profile.total_time * 1000, 3),
+            "n_plus_one": len(profile.n_plus_one()),
+        }
+    return results
+
+
+async def run_all(client: httpx.AsyncClient = None, engine=None, ctx: Dict = None) -> Dict:
+    results = {
+        "scheduler_dispatch": await asyncio.to_thread(scheduler_dispatch),
+        "broadcast_fanout": await broadcast_fanout(),
+        "websocket_sweep": await websocket_sweep(),
+        "job_throughput": await job_throughput(),
+        "payload_compression": await asyncio.to_thread(payload_compression),
+        "wire_formats": await asyncio.to_thread(wire_formats),
+        "board_render": await board_render(),
+        "shard_writes": await shard_writes(),
+        "comment_ingest": await comment_ingest(),
+        "activity_overhead": await activity_overhead(),
+    }
+    if client is not None and engine is not None:
+        results["round_trips"] = await round_trips(client, engine, ctx)
+    return results
@@ -0,0 +1,319 @@
+"""
+Load scenarios.
+
+Each scenario's ``step`` is one iteration of a virtual user; the runner
+calls it in a loop from ``concurrency`` workers. Every request is timed
+under an operation name, and non-2xx responses count as errors for that
+operation.
+"""
+import abc
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from agent_sdk import AgentAPIError, AsyncAgentClient
+from benchmarks.seed import WORDS
+from benchmarks.stats import LatencyRecorder
+
+
+async def timed_request(rec: LatencyRecorder, operation: str, request) -> Optional[httpx.Response]:
+    """Await an httpx request, recording its latency or an error"""
+    start = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        rec.error(operation)
+        return None
+    if response.status_code >= 400:
+        rec.error(operation)
+        rec.count(f"{operation}_{response.status_code}")
+        return None
+    rec.record(operation, time.perf_counter() - start)
+    return response
+
+
+async def timed_call(rec: LatencyRecorder, operation: str, call):
+    """Await an SDK call, recording its latency or an error"""
+    start = time.perf_counter()
+    try:
+        result = await call
+    except AgentAPIError as exc:
+        rec.error(operation)
+        rec.count(f"{operation}_{exc.status_code}")
+        return None
+    except httpx.HTTPError:
+        rec.error(operation)
+        return None
+    rec.record(operation, time.perf_counter() - start)
+    return result
+
+
+class Scenario(abc.ABC):
+    name = ""
+    # Needs a real server (WebSockets are not available over the ASGI transport)
+    requires_server = False
+
+    def __init__(self, ctx: Dict, base_url: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.ctx = ctx
+        self.base_url = base_url
+        self.transport = transport
+        self.rng = random.Random(7)
+
+    def headers(self, worker: int) -> Dict[str, str]:
+        return {"X-API-Key": self.ctx["api_keys"][worker % len(self.ctx["api_keys"])]}
+
+    async def setup(self, client: httpx.AsyncClient, concurrency: int):
+        pass
+
+    @abc.abstractmethod
+    async def step(self, client: httpx.AsyncClient, worker: int, rec: LatencyRecorder):
+        """One iteration of a virtual user"""
+
+    async def teardown(self):
+        pass
+
+
+class AgentWorkflow(Scenario):
+    """
+    The loop from example_agent_client.example_agent_workflow, through the SDK:
+    profile, available tasks, self-assign, start, comment, complete.
+    """
+    name = "agent_workflow"
+
+    async def setup(self, client, concurrency):
+        self.agents: List[AsyncAgentClient] = [
+            AsyncAgentClient(
+                self.base_url, self.ctx["api_keys"][worker % len(self.ctx["api_keys"])],
+                max_retries=0, transport=self.transport,
+            )
+            for worker in range(concurrency)
+        ]
+
+    async def step(self, client, worker, rec):
+        agent = self.agents[worker]
+        await timed_call(rec, "get_profile", agent.get_profile())
+        available = await timed_call(rec, "get_available_tasks", agent.get_available_tasks())
+        if not available:
+            rec.count("no_available_tasks")
+            return
+
+        # Pick the best of a random sample so concurrent agents rarely collide on one task
+        pending = [task for task in available if task["status"] == "pending"] or available
+        task = max(self.rng.sample(pending, min(len(pending), 20)), key=lambda t: t["priority"])
+
+        if await timed_call(rec, "self_assign_task", agent.self_assign_task(task["id"])) is None:
+            return
+        await timed_call(rec, "update_task_status", agent.update_task_status(task["id"], "in_progress"))
+        await timed_call(rec, "add_comment", agent.add_comment(task["id"], "Starting work on this task now."))
+        await timed_call(rec, "complete_task", agent.complete_task(task["id"], "Task completed successfully."))
+
+    async def teardown(self):
+        await asyncio.gather(*(agent.aclose() for agent in self.agents))
+
+
+class BoardRender(Scenario):
+    """Kanban board HTML and the project detail JSON for a random project"""
+    name = "board"
+
+    async def step(self, client, worker, rec):
+        project_id = self.rng.choice(self.ctx["project_ids"])
+        await timed_request(rec, "board_html", client.get(f"/ui/projects/{project_id}/board"))
+        await timed_request(
+            rec, "project_detail", client.get(f"/projects/{project_id}", headers=self.headers(worker))
+        )
+
+
+class Search(Scenario):
+    """Two-term full-text searches across all projects"""
+    name = "search"
+
+    async def step(self, client, worker, rec):
+        query = f"{self.rng.choice(WORDS)} {self.rng.choice(WORDS)}"
+        await timed_request(rec, "search", client.get("/search", params={"q": query}, headers=self.headers(worker)))
+
+
+class OCCContention(Scenario):
+    """
+    Read-then-conditional-update on a handful of hot tasks; counts 412
+    conflicts and the updates that were applied
+    """
+    name = "occ_contention"
+    hot_tasks = 10
+
+    async def step(self, client, worker, rec):
+        task_id = self.rng.choice(self.ctx["open_task_ids"][:self.hot_tasks])
+        headers = self.headers(worker)
+        response = await timed_request(rec, "read_task", client.get(f"/tasks/{task_id}", headers=headers))
+        if response is None:
+            return
+        start = time.perf_counter()
+        try:
+            response = await client.patch(
+                f"/tasks/{task_id}",
+                json={"priority": self.rng.randint(0, 10)},
+                headers={**headers, "If-Match": response.headers.get("ETag", "*")},
+            )
+        except httpx.HTTPError:
+            rec.error("conditional_update")
+            return
+        if response.status_code == 412:
+            rec.count("conflicts")
+        elif response.status_code >= 400:
+            rec.error("conditional_update")
+            return
+        else:
+            rec.count("applied_updates")
+        rec.record("conditional_update", time.perf_counter() - start)
+
+
+class SerializedContention(OCCContention):
+    """
+    The baseline for occ_contention: the same reads and updates of the same
+    hot tasks, but one at a time behind a lock, as a pessimistic scheme would
+    run them. Nothing conflicts, so every update is applied.
+    """
+    name = "occ_serialized"
+
+    async def setup(self, client, concurrency):
+        self.lock = asyncio.Lock()
+
+    async def step(self, client, worker, rec):
+        task_id = self.rng.choice(self.ctx["open_task_ids"][:self.hot_tasks])
+        headers = self.headers(worker)
+        async with self.lock:
+            response = await timed_request(rec, "read_task", client.get(f"/tasks/{task_id}", headers=headers))
+            if response is None:
+                return
+            response = await timed_request(rec, "serialized_update", client.patch(
+                f"/tasks/{task_id}", json={"priority": self.rng.randint(0, 10)}, headers=headers
+            ))
+        if response is not None:
+            rec.count("applied_updates")
+
+
+def applied_throughput(summary: Dict) -> float:
+    """Updates per second that took effect in an occ_contention or occ_serialized run"""
+    elapsed = summary["elapsed_s"]
+    return round(summary.get("counters", {}).get("applied_updates", 0) / elapsed, 2) if elapsed else 0.0
+
+
+class WebSocketFanout(Scenario):
+    """
+    ``subscribers`` WebSocket clients watch one project while workers update
+    its tasks. Records the time from each update until every subscriber has
+    seen an event for that task, and counts deliveries that never arrive.
+    """
+    name = "ws_fanout"
+    requires_server = True
+    subscribers = 200
+    delivery_timeout = 2.0
+
+    async def setup(self, client, concurrency):
+        import websockets
+
+        self.project_id = self.ctx["project_ids"][0]
+        response = await client.get(
+            "/tasks", params={"project_id": self.project_id, "status": "pending"}, headers=self.headers(0)
+        )
+        response.raise_for_status()
+        task_ids = [task["id"] for task in response.json()]
+        if not task_ids:
+            raise SystemExit(f"Project {self.project_id} has no pending tasks to update")
+        # Each worker owns distinct tasks so an event can be matched to one update
+        self.worker_tasks = [task_ids[worker::concurrency] or task_ids[:1] for worker in range(concurrency)]
+        self.waiters: Dict[int, Dict] = {}
+
+        url = self.base_url.replace("http://", "ws://", 1) + f"/ws/projects/{self.project_id}"
+        self.sockets = [
+            await websockets.connect(url, extra_headers=self.headers(index)) for index in range(self.subscribers)
+        ]
+        self.readers = [asyncio.create_task(self._read(index, socket)) for index, socket in enumerate(self.sockets)]
+
+    async def _read(self, index: int, socket):
+        async for message in socket:
+            event = json.loads(message)
+            if event.get("type") == "ping":
+                await socket.send('{"type": "pong"}')
+                continue
+            data = event.get("data") or {}
+            task_id = data.get("id", data.get("task_id"))
+            waiter = self.waiters.get(task_id)
+            if waiter is not None and index in waiter["pending"]:
+                waiter["pending"].discard(index)
+                waiter["latencies"].append(time.perf_counter() - waiter["start"])
+                if not waiter["pending"]:
+                    waiter["done"].set()
+
+    async def step(self, client, worker, rec):
+        task_id = self.rng.choice(self.worker_tasks[worker])
+        waiter = {
+            "start": time.perf_counter(),
+            "pending": set(range(len(self.sockets))),
+            "latencies": [],
+            "done": asyncio.Event(),
+        }
+        self.waiters[task_id] = waiter
+        response = await timed_request(
+            rec, "update", client.patch(
+                f"/tasks/{task_id}", json={"priority": self.rng.randint(0, 10)}, headers=self.headers(worker)
+            )
+        )
+        if response is not None:
+            try:
+                await asyncio.wait_for(waiter["done"].wait(), self.delivery_timeout)
+                rec.record("fanout_complete", time.perf_counter() - waiter["start"])
+            except asyncio.TimeoutError:
+                rec.count("missed_deliveries", len(waiter["pending"]))
+            for latency in waiter["latencies"]:
+                rec.record("delivery", latency)
+        self.waiters.pop(task_id, None)
+
+    async def teardown(self):
+        for reader in self.readers:
+            reader.cancel()
+        await asyncio.gather(*(socket.close() for socket in self.sockets), return_exceptions=True)
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (AgentWorkflow, BoardRender, Search, OCCContention, SerializedContention, WebSocketFanout)
+}
+
+
+async def run_scenario(
+    scenario: Scenario,
+    client: httpx.AsyncClient,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> Dict:
+    """Run ``concurrency`` workers for warmup + duration seconds; only post-warm-up samples are kept"""
+    rec = LatencyRecorder()
+    rec.recording = False
+    await scenario.setup(client, concurrency)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + warmup + duration
+
+    async def worker(index: int):
+        while loop.time() < deadline:
+            try:
+                await scenario.step(client, index, rec)
+            except Exception:
+                rec.count("worker_exceptions")
+
+    try:
+        workers = [asyncio.create_task(worker(index)) for index in range(concurrency)]
+        await asyncio.sleep(warmup)
+        rec.reset()
+        rec.recording = True
+        await asyncio.gather(*workers)
+    finally:
+        await scenario.teardown()
+
+    summary = rec.summary()
+    summary["concurrency"] = concurrency
+    return summary
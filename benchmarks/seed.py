@@ -0,0 +1,209 @@
+"""
+Seed a database with realistic benchmark data.
+
+Rows are written with Core executemany batches straight into the app's
+tables, and the full-text index is built once at the end rather than
+through its per-row triggers. Agents get deterministic API keys
+(``bench-key-<n>``) so load scenarios can authenticate without
+registering. Most tasks are completed history; ``open_ratio`` of them are
+pending or in progress, which is what agents and boards actually read.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models import (
+    SHARED_SCHEMA, Base, Comment, Entity, EntityType, Project, ApprovalStatus, Stage, Task, TaskStatus, task_assignments
+)
+from search import create_search_index
+
+# Seeded databases are standalone: entities and jobs live in them, not in an attached main database
+SHARED_TABLES_IN_DATABASE = {"schema_translate_map": {SHARED_SCHEMA: None}}
+
+SKILLS = [
+    "python", "javascript", "sql", "devops", "testing", "design",
+    "docs", "security", "data", "ml", "frontend", "backend",
+]
+WORDS = [
+    "api", "login", "cache", "board", "search", "export", "import", "report", "payment", "invoice",
+    "webhook", "migration", "dashboard", "billing", "sync", "queue", "upload", "profile", "audit", "alert",
+    "latency", "timeout", "refactor", "schema", "index", "retry", "session", "token", "email", "notification",
+]
+STAGES = [
+    ("Backlog", "Tasks to be done"),
+    ("To Do", "Ready to start"),
+    ("In Progress", "Currently being worked on"),
+    ("Review", "Awaiting review"),
+    ("Done", "Completed tasks"),
+]
+# Zero-based index into STAGES for each status
+STATUS_STAGE = {
+    TaskStatus.PENDING: 1,
+    TaskStatus.IN_PROGRESS: 2,
+    TaskStatus.IN_REVIEW: 3,
+    TaskStatus.BLOCKED: 1,
+    TaskStatus.COMPLETED: 4,
+}
+
+API_KEY_PREFIX = "bench-key-"
+
+
+def agent_api_key(index: int) -> str:
+    return f"{API_KEY_PREFIX}{index}"
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+async def seed(
+    database_url: str,
+    projects: int = 200,
+    tasks: int = 1_000_000,
+    agents: int = 1000,
+    comments: int = 500_000,
+    open_ratio: float = 0.02,
+    batch_size: int = 10_000,
+    reset: bool = False,
+    random_seed: int = 42,
+) -> Dict[str, int]:
+    """Create the schema and fill it; refuses to touch a non-empty database unless ``reset``"""
+    rng = random.Random(random_seed)
+    engine = create_async_engine(database_url, execution_options=SHARED_TABLES_IN_DATABASE)
+    now = datetime.utcnow()
+
+    async def write(conn, table, rows: List[Dict]):
+        for start in range(0, len(rows), batch_size):
+            await conn.execute(insert(table), rows[start:start + batch_size])
+
+    try:
+        async with engine.begin() as conn:
+            if reset:
+                await conn.run_sync(Base.metadata.drop_all)
+                if conn.dialect.name == "sqlite":
+                    for table in ("tasks_fts", "comments_fts"):
+                        await conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+            await conn.run_sync(Base.metadata.create_all)
+            existing = (await conn.execute(select(func.count()).select_from(Entity))).scalar()
+            if existing:
+                raise SystemExit("Database already has data; pass --reset to replace it")
+
+            await write(conn, Entity.__table__, [
+                {
+                    "id": index + 1,
+                    "name": f"bench-agent-{index}",
+                    "entity_type": EntityType.AGENT,
+                    "api_key": agent_api_key(index),
+                    "skills": ",".join(rng.sample(SKILLS, rng.randint(1, 3))),
+                    "max_concurrent_tasks": rng.randint(1, 4),
+                    "is_active": True,
+                    "created_at": now,
+                }
+                for index in range(agents)
+            ])
+
+            await write(conn, Project.__table__, [
+                {
+                    "id": project_id,
+                    "name": f"Project {project_id} {_sentence(rng, 2)}",
+                    "description": _sentence(rng, 8),
+                    "creator_id": rng.randint(1, agents),
+                    "approval_status": ApprovalStatus.APPROVED,
+                    "created_at": now,
+                    "updated_at": now,
+                    "version": 1,
+                }
+                for project_id in range(1, projects + 1)
+            ])
+            await write(conn, Stage.__table__, [
+                {
+                    "id": (project_id - 1) * len(STAGES) + order,
+                    "project_id": project_id,
+                    "name": name,
+                    "description": description,
+                    "order": order,
+                    "created_at": now,
+                    "version": 1,
+                }
+                for project_id in range(1, projects + 1)
+                for order, (name, description) in enumerate(STAGES, start=1)
+            ])
+
+            # Tasks and their assignments are generated and written batch by batch to bound memory
+            open_statuses = [TaskStatus.PENDING, TaskStatus.PENDING, TaskStatus.PENDING, TaskStatus.IN_PROGRESS]
+            for start in range(0, tasks, batch_size):
+                task_rows, assignment_rows = [], []
+                for task_id in range(start + 1, min(start + batch_size, tasks) + 1):
+                    project_id = rng.randint(1, projects)
+                    if rng.random() < open_ratio:
+                        status = rng.choice(open_statuses)
+                    else:
+                        status = rng.choice([TaskStatus.COMPLETED] * 18 + [TaskStatus.IN_REVIEW, TaskStatus.BLOCKED])
+                    created_at = now - timedelta(minutes=rng.randint(1, 60 * 24 * 365))
+                    task_rows.append({
+                        "id": task_id,
+                        "title": f"{_sentence(rng, 3)} #{task_id}",
+                        "description": _sentence(rng, 20),
+                        "status": status,
+                        "project_id": project_id,
+                        "stage_id": (project_id - 1) * len(STAGES) + STATUS_STAGE[status] + 1,
+                        "required_skills": ",".join(rng.sample(SKILLS, rng.randint(0, 2))) or None,
+                        "priority": rng.randint(0, 10),
+                        "created_at": created_at,
+                        "updated_at": created_at,
+                        "completed_at": created_at + timedelta(hours=rng.randint(1, 72))
+                        if status == TaskStatus.COMPLETED else None,
+                        "version": 1,
+                    })
+                    if status != TaskStatus.PENDING:
+                        assignment_rows.append({"task_id": task_id, "entity_id": rng.randint(1, agents)})
+                await conn.execute(insert(Task.__table__), task_rows)
+                if assignment_rows:
+                    await conn.execute(insert(task_assignments), assignment_rows)
+
+            for start in range(0, comments if tasks else 0, batch_size):
+                await conn.execute(insert(Comment.__table__), [
+                    {
+                        "content": _sentence(rng, 12),
+                        "task_id": rng.randint(1, tasks),
+                        "author_id": rng.randint(1, agents),
+                        "created_at": now,
+                    }
+                    for _ in range(start, min(start + batch_size, comments))
+                ])
+
+            # Builds the FTS tables and indexes everything written above in one pass
+            await create_search_index(conn)
+    finally:
+        await engine.dispose()
+
+    return {"projects": projects, "tasks": tasks, "agents": agents, "comments": comments}
+
+
+async def load_context(database_url: str) -> Dict:
+    """Ids and keys the scenarios need, read from a seeded database"""
+    engine = create_async_engine(database_url, execution_options=SHARED_TABLES_IN_DATABASE)
+    try:
+        async with engine.connect() as conn:
+            project_ids = (await conn.execute(select(Project.id))).scalars().all()
+            api_keys = (await conn.execute(
+                select(Entity.api_key).where(Entity.api_key.like(f"{API_KEY_PREFIX}%"))
+            )).scalars().all()
+            task_count = (await conn.execute(select(func.count()).select_from(Task))).scalar()
+            open_task_ids = (await conn.execute(
+                select(Task.id).where(Task.status == TaskStatus.PENDING).limit(1000)
+            )).scalars().all()
+    finally:
+        await engine.dispose()
+
+    if not project_ids or not api_keys:
+        raise SystemExit("Database is not seeded; run `python -m benchmarks seed` first")
+    return {
+        "project_ids": list(project_ids),
+        "api_keys": list(api_keys),
+        "task_count": task_count,
+        "open_task_ids": list(open_task_ids),
+    }
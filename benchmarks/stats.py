@@ -0,0 +1,83 @@
+"""Latency recording and summary statistics"""
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(samples: List[float], errors: int, elapsed: float) -> Dict:
+    """Latency distribution in milliseconds and throughput in operations per second"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+class LatencyRecorder:
+    """Collects per-operation latencies; failed operations are counted but not timed"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.recording = True
+
+    def record(self, operation: str, seconds: float):
+        if self.recording:
+            self.samples.setdefault(operation, []).append(seconds)
+
+    def error(self, operation: str):
+        if self.recording:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def count(self, name: str, amount: int = 1):
+        """Scenario-specific tallies such as conflicts or missed events"""
+        if self.recording:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        """Drop warm-up samples and restart the throughput clock"""
+        self.samples.clear()
+        self.errors.clear()
+        self.counters.clear()
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def timed(self, operation: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(operation)
+            raise
+        self.record(operation, time.perf_counter() - start)
+
+    def summary(self) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        operations = set(self.samples) | set(self.errors)
+        result = {
+            "elapsed_s": round(elapsed, 3),
+            "operations": {
+                operation: summarize(self.samples.get(operation, []), self.errors.get(operation, 0), elapsed)
+                for operation in sorted(operations)
+            },
+        }
+        if self.counters:
+            result["counters"] = dict(self.counters)
+        return result
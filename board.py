@@ -0,0 +1,213 @@
+"""
+Live board updates.
+
+Board pages keep a WebSocket open on /ws/projects/{id} instead of reloading.
+Right after connecting, the client gets a compact snapshot of the board:
+stages, tasks with ``assignee_ids`` and each assignee listed once. After
+that, endpoints publish a delta for every change they commit
+(``task_created``/``task_updated``/``task_deleted`` and the ``stage_*``
+equivalents). Bulk changes (scheduling, lease expiry, archival, imports)
+publish ``tasks_changed`` instead, and clients ask for a delta.
+
+A delta is sent on reconnect (``?since=<server_time>``) or on a
+``{"type": "resync", "since": ...}`` message. It holds every stage with its
+task count and the tasks changed since then. Clients learn which tasks were
+deleted while they weren't listening from ``task_ids`` (every live task) or,
+when the resync message lists the ``known`` task ids, from ``deleted``.
+
+Large boards are paged: the board page renders the first BOARD_PAGE_SIZE
+cards of each column, and columns load further pages by id (keyset) as
+they are scrolled.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from models import Entity, Stage, Task, task_assignments
+from websocket_manager import manager, create_notification
+
+# Board cards show the first 60 characters; one more tells the client to add an ellipsis
+DESCRIPTION_PREVIEW = 61
+# Commits can land out of timestamp order; a delta reaches back this far to cover them
+DELTA_OVERLAP = timedelta(seconds=5)
+BOARD_PAGE_SIZE = int(os.getenv("BOARD_PAGE_SIZE", "50"))
+# Most ``known`` ids a resync message may list, and how many go in one IN (...)
+MAX_KNOWN_IDS = 20_000
+ID_CHUNK = 500
+
+
+def compact_entity(entity) -> Dict:
+    return {"id": entity.id, "name": entity.name, "entity_type": entity.entity_type.value}
+
+
+def compact_stage(stage) -> Dict:
+    return {"id": stage.id, "name": stage.name, "order": stage.order, "version": stage.version}
+
+
+def compact_task(task, assignee_ids: Iterable[int]) -> Dict:
+    description = task.description
+    return {
+        "id": task.id,
+        "title": task.title,
+        "description": description[:DESCRIPTION_PREVIEW] if description else description,
+        "status": task.status.value,
+        "priority": task.priority,
+        "stage_id": task.stage_id,
+        "required_skills": task.required_skills,
+        "assignee_ids": list(assignee_ids),
+        "version": task.version,
+    }
+
+
+async def stage_counts(db: AsyncSession, project_id: int) -> Dict[int, int]:
+    result = await db.execute(
+        select(Task.stage_id, func.count()).where(Task.project_id == project_id, Task.stage_id.isnot(None))
+        .group_by(Task.stage_id)
+    )
+    return dict(result.all())
+
+
+async def first_pages(db: AsyncSession, project_id: int,
+                      page_size: int = BOARD_PAGE_SIZE) -> Tuple[Dict[int, List[Task]], Dict[int, int]]:
+    """The first ``page_size`` tasks of every column, by id, and each column's total"""
+    ranked = (
+        select(Task.id, func.row_number().over(partition_by=Task.stage_id, order_by=Task.id).label("position"))
+        .where(Task.project_id == project_id, Task.stage_id.isnot(None))
+        .subquery()
+    )
+    result = await db.execute(
+        select(Task).join(ranked, ranked.c.id == Task.id).where(ranked.c.position <= page_size)
+        .order_by(Task.stage_id, Task.id)
+        .options(selectinload(Task.assignees))
+    )
+    pages: Dict[int, List[Task]] = {}
+    for task in result.scalars():
+        pages.setdefault(task.stage_id, []).append(task)
+    return pages, await stage_counts(db, project_id)
+
+
+async def stage_page(db: AsyncSession, project_id: int, stage_id: int, after: int = 0,
+                     limit: int = BOARD_PAGE_SIZE) -> Dict:
+    """The next ``limit`` tasks of a column after task id ``after``, with their assignees"""
+    result = await db.execute(
+        select(Task)
+        .where(Task.project_id == project_id, Task.stage_id == stage_id, Task.id > after)
+        .order_by(Task.id).limit(limit + 1)
+        .options(selectinload(Task.assignees))
+    )
+    tasks = result.scalars().all()
+    more = len(tasks) > limit
+    tasks = tasks[:limit]
+    entities = {entity.id: entity for task in tasks for entity in task.assignees}
+    return {
+        "tasks": [compact_task(task, [entity.id for entity in task.assignees]) for task in tasks],
+        "entities": [compact_entity(entity) for entity in entities.values()],
+        "next_after": tasks[-1].id if more else None,
+    }
+
+
+async def existing_task_ids(db: AsyncSession, project_id: int, task_ids: Sequence[int]) -> List[int]:
+    existing = []
+    for start in range(0, len(task_ids), ID_CHUNK):
+        result = await db.execute(
+            select(Task.id).where(Task.project_id == project_id, Task.id.in_(task_ids[start:start + ID_CHUNK]))
+        )
+        existing.extend(result.scalars())
+    return existing
+
+
+async def board_state(db: AsyncSession, project_id: int, since: Optional[datetime] = None,
+                      known: Optional[Sequence[int]] = None) -> Dict:
+    """Snapshot of a project's board, or only what changed after ``since``"""
+    result = await db.execute(select(Stage).where(Stage.project_id == project_id).order_by(Stage.order))
+    stages = [compact_stage(stage) for stage in result.scalars()]
+    counts = await stage_counts(db, project_id)
+    for stage in stages:
+        stage["task_count"] = counts.get(stage["id"], 0)
+
+    conditions = [Task.project_id == project_id]
+    if since is not None:
+        conditions.append(Task.updated_at > since - DELTA_OVERLAP)
+    rows = (await db.execute(
+        select(
+            Task.id, Task.title, func.substr(Task.description, 1, DESCRIPTION_PREVIEW).label("description"),
+            Task.status, Task.priority, Task.stage_id, Task.required_skills, Task.version
+        ).where(*conditions).order_by(Task.id)
+    )).all()
+
+    assignees: Dict[int, List[int]] = {}
+    entities = []
+    if rows:
+        task_ids = select(Task.id).where(*conditions)
+        result = await db.execute(
+            select(task_assignments.c.task_id, task_assignments.c.entity_id)
+            .where(task_assignments.c.task_id.in_(task_ids))
+        )
+        for task_id, entity_id in result:
+            assignees.setdefault(task_id, []).append(entity_id)
+        entity_ids = {entity_id for ids in assignees.values() for entity_id in ids}
+        if entity_ids:
+            result = await db.execute(select(Entity).where(Entity.id.in_(entity_ids)))
+            entities = [compact_entity(entity) for entity in result.scalars()]
+
+    message = {
+        "type": "snapshot" if since is None else "delta",
+        "project_id": project_id,
+        # Taken after reading, so clients can tell which of the events they got meanwhile it already covers
+        "server_time": datetime.utcnow().isoformat(),
+        "stages": stages,
+        "tasks": [compact_task(row, assignees.get(row.id, ())) for row in rows],
+        "entities": entities,
+    }
+    if since is not None and known is not None and len(known) <= MAX_KNOWN_IDS:
+        message["deleted"] = list(set(known) - set(await existing_task_ids(db, project_id, known)))
+    elif since is not None:
+        result = await db.execute(select(Task.id).where(Task.project_id == project_id))
+        message["task_ids"] = result.scalars().all()
+    return message
+
+
+async def publish_task(task, event_type: str = "task_updated", previous_stage_id: Optional[int] = None,
+                       previous_assignee_ids: Iterable[int] = ()):
+    """
+    Send a task's new state to the project's boards; ``task.assignees`` must
+    be loaded. Pass ``previous_stage_id`` when the task moved, so boards that
+    haven't loaded its card can still keep column counts right, and
+    ``previous_assignee_ids`` when entities were unassigned, so sockets
+    filtering on their assignee hear about it.
+    """
+    assignee_ids = [entity.id for entity in task.assignees]
+    data = {
+        "task": compact_task(task, assignee_ids),
+        "entities": [compact_entity(entity) for entity in task.assignees],
+    }
+    if previous_stage_id is not None and previous_stage_id != task.stage_id:
+        data["previous_stage_id"] = previous_stage_id
+    removed = sorted(set(previous_assignee_ids) - set(assignee_ids))
+    if removed:
+        data["previous_assignee_ids"] = removed
+    await manager.broadcast_to_project(create_notification(event_type, data, task.project_id), task.project_id)
+
+
+async def publish_task_deleted(project_id: int, task_id: int, stage_id: Optional[int] = None):
+    message = create_notification("task_deleted", {"id": task_id, "stage_id": stage_id}, project_id)
+    await manager.broadcast_to_project(message, project_id)
+
+
+async def publish_stage(stage, event_type: str = "stage_updated"):
+    message = create_notification(event_type, {"stage": compact_stage(stage)}, stage.project_id)
+    await manager.broadcast_to_project(message, stage.project_id)
+
+
+async def publish_stage_deleted(project_id: int, stage_id: int):
+    await manager.broadcast_to_project(create_notification("stage_deleted", {"id": stage_id}, project_id), project_id)
+
+
+async def publish_changed(*project_ids: Optional[int]):
+    """Tell boards that many tasks changed at once, so they fetch a delta"""
+    for project_id in set(filter(None, project_ids)):
+        await manager.broadcast_to_project(create_notification("tasks_changed", {}, project_id), project_id)
@@ -0,0 +1,174 @@
+"""
+Response cache for project detail.
+
+Serialized ``ProjectDetailResponse`` bodies are cached per project under a
+generation number. Any project-scoped mutation calls ``invalidate``, which
+bumps the project's generation, so the next read misses and rebuilds.
+Stale bodies are never deleted explicitly; they fall out of the LRU, or
+expire from the shared backend after CACHE_TTL_SECONDS.
+
+Two levels:
+- An in-process LRU of bytes (CACHE_MAX_ENTRIES).
+- An optional shared Redis backend (CACHE_REDIS_URL, needs the ``redis``
+  package). It holds the generation counters and the bodies, so every
+  worker process sees an invalidation immediately. Each read then costs one
+  Redis round trip for the generation. Without Redis, generations are
+  process-local, which is exact for a single worker.
+
+Concurrent misses for the same project and generation are coalesced: one
+request rebuilds the body and the rest wait for it (single-flight).
+
+A project can have several cached variants of its body (response shape,
+compressed encodings); each is keyed separately and shares the project's
+generation, so one invalidation drops them all.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+cache_lookups = registry.counter(
+    "response_cache_lookups_total", "Project detail cache lookups by result", ("result",)
+)
+
+CacheKey = Tuple[int, int, str]
+
+
+class ProjectCache:
+    """Two-level cache of serialized project detail responses with generation-based invalidation"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, redis_url: Optional[str] = CACHE_REDIS_URL):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(redis_url)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _generation(self, project_id: int) -> int:
+        if self._redis is not None:
+            try:
+                value = await self._redis.get(f"project:{project_id}:gen")
+                return int(value or 0)
+            except Exception:
+                logger.warning("Shared cache unavailable, using local generations", exc_info=True)
+        return self._generations.get(project_id, 0)
+
+    @staticmethod
+    def _shared_key(key: CacheKey) -> str:
+        project_id, generation, variant = key
+        return f"project:{project_id}:{generation}:{variant}" if variant else f"project:{project_id}:{generation}"
+
+    async def _shared_get(self, key: CacheKey) -> Optional[bytes]:
+        if self._redis is None:
+            return None
+        try:
+            return await self._redis.get(self._shared_key(key))
+        except Exception:
+            logger.warning("Shared cache read failed", exc_info=True)
+            return None
+
+    async def _shared_set(self, key: CacheKey, body: bytes):
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(self._shared_key(key), body, ex=CACHE_TTL_SECONDS)
+        except Exception:
+            logger.warning("Shared cache write failed", exc_info=True)
+
+    def _local_set(self, key: CacheKey, body: bytes):
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_build(self, project_id: int, build: Callable[[], Awaitable[Optional[bytes]]],
+                           variant: str = "") -> Optional[bytes]:
+        """
+        Return the cached body (of ``variant``) for the project's current
+        generation, calling ``build`` on a miss. ``build`` returns None for a
+        missing project, which is passed through and not cached.
+        """
+        if not CACHE_ENABLED:
+            return await build()
+
+        while True:
+            key = (project_id, await self._generation(project_id), variant)
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                cache_lookups.inc(1, "hit")
+                return body
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                cache_lookups.inc(1, "coalesced")
+                try:
+                    return await asyncio.shield(inflight)
+                except asyncio.CancelledError:
+                    if inflight.cancelled():
+                        continue  # The rebuilding request went away; try again
+                    raise
+
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            try:
+                body = await self._shared_get(key)
+                if body is not None:
+                    cache_lookups.inc(1, "shared_hit")
+                else:
+                    cache_lookups.inc(1, "miss")
+                    body = await build()
+                    if body is not None:
+                        await self._shared_set(key, body)
+                if body is not None:
+                    self._local_set(key, body)
+                future.set_result(body)
+                return body
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as exc:
+                future.set_exception(exc)
+                future.exception()  # Waiters re-raise it; don't warn when there are none
+                raise
+            finally:
+                self._inflight.pop(key, None)
+
+    async def invalidate(self, *project_ids: Optional[int]):
+        """Bump the generation of each project so cached bodies are no longer served"""
+        for project_id in set(filter(None, project_ids)):
+            self._generations[project_id] = self._generations.get(project_id, 0) + 1
+            if self._redis is not None:
+                try:
+                    await self._redis.incr(f"project:{project_id}:gen")
+                except Exception:
+                    logger.warning("Shared cache invalidation failed for project %s", project_id, exc_info=True)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Global instance
+project_cache = ProjectCache()
+
+registry.gauge(
+    "response_cache_entries", "Project detail bodies held in the local cache",
+    callback=lambda: [((), len(project_cache))]
+)
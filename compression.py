@@ -0,0 +1,168 @@
+"""
+Response compression.
+
+``CompressionMiddleware`` compresses HTTP responses with brotli (when the
+optional ``brotli`` package is installed) or gzip, whichever the client
+prefers in Accept-Encoding. Bodies smaller than COMPRESSION_MIN_SIZE and
+non-text content types are sent as is. Streamed responses are compressed
+chunk by chunk and flushed after each one, so they are never buffered.
+Responses that already carry a Content-Encoding pass through untouched;
+the project detail endpoint uses that to serve bodies that were compressed
+once and cached (see ``compress``).
+
+Bodies above THREAD_THRESHOLD are compressed in a worker thread (zlib and
+brotli release the GIL) so a large board doesn't stall the event loop.
+
+WebSocket frames are compressed by the server instead: uvicorn negotiates
+permessage-deflate when WS_PER_MESSAGE_DEFLATE is on.
+"""
+import asyncio
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip only without it
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+
+THREAD_THRESHOLD = 256 * 1024
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/msgpack", "application/javascript", "application/xml",
+    "image/svg+xml"
+)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The best encoding we support from an Accept-Encoding header, or None"""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue  # A malformed q-value: ignore the item, as for any unknown coding
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Incremental compressor; ``compress`` output is flushed so it can be sent right away"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a complete body"""
+    return _Compressor(encoding).finish(body)
+
+
+async def compress_async(body: bytes, encoding: str) -> bytes:
+    if len(body) >= THREAD_THRESHOLD:
+        return await asyncio.to_thread(compress, body, encoding)
+    return compress(body, encoding)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing HTTP responses for clients that accept it"""
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.min_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = await compress_async(body, encoding)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            chunk = compressor.compress(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,70 @@
+"""
+Optimistic concurrency helpers.
+
+Task, Stage and Project carry a ``version`` column (SQLAlchemy
+``version_id_col``). Clients send the version they last saw, either as an
+``If-Match`` header (412 on mismatch) or in the request body (409), and the
+row is changed with one conditional ``UPDATE ... WHERE version = ?
+RETURNING`` instead of a SELECT followed by a write.
+"""
+import re
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+_ETAG_PATTERN = re.compile(r'^(?:W/)?"?(\d+)"?$')
+
+
+def etag(version: int) -> str:
+    """ETag header value for a resource version"""
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Extract the expected version from an If-Match header ("3", W/"3"); None for no header or *"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    match = _ETAG_PATTERN.match(if_match.strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="If-Match must be a version ETag such as \"3\"")
+    return int(match.group(1))
+
+
+async def versioned_update(
+    db: AsyncSession,
+    model,
+    object_id: int,
+    values: Dict[str, Any],
+    expected_version: Optional[int] = None,
+    conflict_status: int = status.HTTP_412_PRECONDITION_FAILED,
+):
+    """
+    Update one row and bump its version with a single UPDATE ... RETURNING.
+    Returns the updated ORM object; the caller commits.
+    Raises 404 if the row does not exist and ``conflict_status`` if
+    ``expected_version`` is given but stale.
+    """
+    query = update(model).where(model.id == object_id)
+    if expected_version is not None:
+        query = query.where(model.version == expected_version)
+    result = await db.execute(query.values(**values, version=model.version + 1).returning(model))
+    obj = result.scalar_one_or_none()
+    if obj is not None:
+        return obj
+    await update_failed(db, model, object_id, conflict_status)
+
+
+async def update_failed(db: AsyncSession, model, object_id: int, conflict_status: int):
+    """For an update that matched nothing: roll back and raise 404, or ``conflict_status`` if the row moved on"""
+    await db.rollback()
+    result = await db.execute(select(model.version).where(model.id == object_id))
+    current_version = result.scalar_one_or_none()
+    if current_version is None:
+        raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+    raise HTTPException(
+        status_code=conflict_status,
+        detail=f"{model.__name__} was modified concurrently (current version {current_version})",
+        headers={"ETag": etag(current_version)}
+    )
@@ -1,19 +1,197 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+"""
+Engines, sessions and shard routing.
+
+By default everything lives in DATABASE_URL. With SHARD_COUNT > 1 (SQLite
+only) projects are spread over several database files so writes to
+different projects don't serialize on one lock:
+
+- Shard 0 is DATABASE_URL; shards 1..SHARD_COUNT-1 are SHARD_DATABASE_URL
+  with ``{shard}`` filled in. A project's stages, tasks, comments,
+  assignments and archive live in its shard.
+- Entities, jobs and the shard directory stay in the main database, which is
+  ATTACHed to every shard as ``shared``, so shard queries still join
+  entities and jobs are still enqueued in the caller's transaction (atomic
+  per database file: all files are put in WAL mode).
+- Shard N hands out ids from ``N * SHARD_ID_SPAN`` up (``id_sequences``),
+  so an id names the shard a row was created in. Projects moved by
+  ``python shards.py`` are listed in ``project_shards``; once any have
+  moved, lookups by task or stage id fall back to the other shards.
+
+Requests get a session for the right shard from get_project_db,
+get_task_db and get_stage_db; views over all projects use fan_out.
+"""
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from models import Base
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy import event, exists, func, or_, select, update
+from collections import OrderedDict
+from search import detect_search_index
+from archive import attach_archive, archive_attached, schema_translate_map
+from migrate import current_revision, head_revision, upgrade, MIGRATE_ON_STARTUP
+from metrics import instrument_engine, METRICS_ENABLED
+from profiling import profile_engine, SQL_PROFILING
+from ratelimit import admission, ADMISSION_MAX_POOL_WAIT_MS
+from models import (
+    ARCHIVE_SCHEMA, SHARED_SCHEMA, ArchivedComment, ArchivedTask, Comment, IdSequence, Project, ProjectShard,
+    Stage, Task
+)
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+import asyncio
+import itertools
+import logging
 import os
+import random
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./kanban.db")
+# Logs every SQL statement; for local debugging only
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+SHARD_COUNT = max(int(os.getenv("SHARD_COUNT", "1")), 1)
+SHARD_DATABASE_URL = os.getenv("SHARD_DATABASE_URL", "sqlite+aiosqlite:///./kanban-shard-{shard}.db")
+# Ids below 2**53 stay exact in JavaScript clients, which leaves room for 9000 shards
+SHARD_ID_SPAN = 10 ** 12
+# Located task and stage ids, once projects have moved between shards
+SHARD_LOCATION_CACHE_SIZE = int(os.getenv("SHARD_LOCATION_CACHE_SIZE", "100000"))
+SHARDED = SHARD_COUNT > 1
+
+if SHARDED and make_url(DATABASE_URL).get_backend_name() != "sqlite":
+    raise RuntimeError("SHARD_COUNT > 1 needs SQLite; one PostgreSQL database doesn't serialize writes")
+
+T = TypeVar("T")
+
+
+def _instrument(engine: AsyncEngine):
+    if METRICS_ENABLED:
+        instrument_engine(engine)
+    if ADMISSION_MAX_POOL_WAIT_MS > 0:
+        admission.track(engine)
+    if SQL_PROFILING:
+        profile_engine(engine)
+
+
+def _use_wal(engine: AsyncEngine):
+    """Readers of the shared tables, from any shard, must not block their writers"""
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_journal_mode(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+
+def _attach_shared(engine: AsyncEngine):
+    """ATTACH the main database to every new connection of a shard"""
+    main_path = make_url(DATABASE_URL).database
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def attach(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {SHARED_SCHEMA}", (main_path,))
+        cursor.close()
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+
+engine = create_async_engine(
+    DATABASE_URL, echo=DB_ECHO, future=True,
+    execution_options={"schema_translate_map": {**schema_translate_map(DATABASE_URL), SHARED_SCHEMA: None}}
+)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+if archive_attached(DATABASE_URL):
+    attach_archive(engine)
+if SHARDED:
+    _use_wal(engine)
+_instrument(engine)
+
+shard_engines: List[AsyncEngine] = [engine]
+shard_session_makers: List[async_sessionmaker] = [async_session_maker]
+for _shard in range(1, SHARD_COUNT):
+    _shard_engine = create_async_engine(
+        SHARD_DATABASE_URL.format(shard=_shard), echo=DB_ECHO, future=True,
+        # Shards keep their archive in their own file
+        execution_options={"schema_translate_map": {ARCHIVE_SCHEMA: None, SHARED_SCHEMA: SHARED_SCHEMA}}
+    )
+    _use_wal(_shard_engine)
+    _attach_shared(_shard_engine)
+    _instrument(_shard_engine)
+    shard_engines.append(_shard_engine)
+    shard_session_makers.append(async_sessionmaker(_shard_engine, class_=AsyncSession, expire_on_commit=False))
+
+# Project id -> shard, for projects that no longer live in the shard of their id
+moved_projects: Dict[int, int] = {}
+# (table, id) -> shard, for ids looked up since
+_located: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+# New projects go to the shards in turn, from a random start so workers don't all begin at shard 0
+_new_project_shards = itertools.count(random.randrange(SHARD_COUNT))
+
+
+def dialect_insert(db: AsyncSession, table):
+    """INSERT construct for the session's dialect, exposing on_conflict_do_nothing() on SQLite and PostgreSQL"""
+    if db.bind.dialect.name == "postgresql":
+        return postgresql_insert(table)
+    return sqlite_insert(table)
+
+
+def shard_of_id(object_id: int) -> int:
+    """The shard whose id range ``object_id`` is in (shard 0 for ids outside every range)"""
+    shard = object_id // SHARD_ID_SPAN
+    return shard if 0 <= shard < SHARD_COUNT else 0
+
+
+def project_shard(project_id: int) -> int:
+    return moved_projects.get(project_id, shard_of_id(project_id))
+
+
+async def _locate(model, object_id: int, *archived) -> int:
+    """Shard holding a task or stage: the one its id belongs to, unless its project was moved"""
+    home = shard_of_id(object_id)
+    if not moved_projects:
+        return home
+    key = (model.__tablename__, object_id)
+    shard = _located.get(key)
+    if shard is not None:
+        _located.move_to_end(key)
+        return shard
+
+    found = or_(*(exists().where(table.id == object_id) for table in (model, *archived)))
+    for shard in [home, *(shard for shard in range(SHARD_COUNT) if shard != home)]:
+        async with shard_session_makers[shard]() as db:
+            if (await db.execute(select(found))).scalar():
+                _located[key] = shard
+                if len(_located) > SHARD_LOCATION_CACHE_SIZE:
+                    _located.popitem(last=False)
+                return shard
+    return home  # Missing everywhere; the handler answers 404
+
+
+async def task_shard(task_id: int) -> int:
+    return await _locate(Task, task_id, ArchivedTask)
+
+
+async def stage_shard(stage_id: int) -> int:
+    return await _locate(Stage, stage_id)
+
+
+def new_project_shard() -> int:
+    return next(_new_project_shards) % SHARD_COUNT
+
+
+def project_session(project_id: int) -> AsyncSession:
+    """Session on the project's shard, for handlers that only learn the project from the body"""
+    return shard_session_makers[project_shard(project_id)]()
+
+
+async def task_session(task_id: int) -> AsyncSession:
+    return shard_session_makers[await task_shard(task_id)]()
+
 
 async def get_db():
-    """Dependency for getting database session"""
+    """Dependency for getting a session on the main database (entities, jobs; all data when unsharded)"""
     async with async_session_maker() as session:
         try:
             yield session
@@ -21,7 +199,95 @@ async def get_db():
             await session.close()
 
 
+async def get_project_db(project_id: int):
+    """Dependency: session on the shard of the ``project_id`` path parameter"""
+    async with project_session(project_id) as session:
+        yield session
+
+
+async def get_task_db(task_id: int):
+    """Dependency: session on the shard of the ``task_id`` path parameter"""
+    async with await task_session(task_id) as session:
+        yield session
+
+
+async def get_stage_db(stage_id: int):
+    """Dependency: session on the shard of the ``stage_id`` path parameter"""
+    async with shard_session_makers[await stage_shard(stage_id)]() as session:
+        yield session
+
+
+async def get_new_project_db():
+    """Dependency: session on the shard a new project is created in"""
+    async with shard_session_makers[new_project_shard()]() as session:
+        yield session
+
+
+async def fan_out(query: Callable[[AsyncSession], Awaitable[T]], shards: Optional[Sequence[int]] = None) -> List[T]:
+    """Run ``query`` on every shard (or on ``shards``) concurrently; results in shard order"""
+    async def run(shard: int) -> T:
+        async with shard_session_makers[shard]() as db:
+            return await query(db)
+
+    return list(await asyncio.gather(*(run(shard) for shard in (range(SHARD_COUNT) if shards is None else shards))))
+
+
+async def assign_ids(db: AsyncSession, model, rows: List[dict]) -> List[dict]:
+    """Give ``rows`` ids from the session's shard range; unsharded, the database assigns them"""
+    if SHARDED and rows:
+        result = await db.execute(
+            update(IdSequence).where(IdSequence.name == model.__tablename__)
+            .values(next_id=IdSequence.next_id + len(rows))
+            .returning(IdSequence.next_id)
+        )
+        first = result.scalar_one() - len(rows)
+        for offset, row in enumerate(rows):
+            row["id"] = first + offset
+    return rows
+
+
+async def next_id(db: AsyncSession, model) -> Optional[int]:
+    """An id for one new ``model`` row on the session's shard; None when unsharded"""
+    row, = await assign_ids(db, model, [{}])
+    return row.get("id")
+
+
+def _seed_id_sequences(conn, shard: int):
+    """Start each table's sequence after the highest id already in the shard's range (rows may predate it)"""
+    low, high = shard * SHARD_ID_SPAN, (shard + 1) * SHARD_ID_SPAN
+    for model, *archived in ((Project,), (Stage,), (Task, ArchivedTask), (Comment, ArchivedComment)):
+        highest = max(
+            conn.execute(select(func.max(table.id)).where(table.id >= low, table.id < high)).scalar() or low
+            for table in (model, *archived)
+        )
+        statement = sqlite_insert(IdSequence).values(name=model.__tablename__, next_id=highest + 1)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=[IdSequence.name],
+            set_={"next_id": func.max(IdSequence.next_id, statement.excluded.next_id)}
+        ))
+
+
 async def init_db():
-    """Initialize database tables"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Bring every shard's schema up to date; no DDL at all when it already is"""
+    for shard, shard_engine in enumerate(shard_engines):
+        async with shard_engine.connect() as conn:
+            revision = await conn.run_sync(current_revision)
+            if revision != head_revision():
+                if not MIGRATE_ON_STARTUP:
+                    raise RuntimeError(
+                        f"Database schema of shard {shard} is at revision {revision}, expected {head_revision()}; "
+                        + ("run `alembic upgrade head`" if shard == 0 else "start once with MIGRATE_ON_STARTUP=true")
+                    )
+                logger.info("Migrating shard %d schema from %s to %s", shard, revision, head_revision())
+                await conn.run_sync(upgrade)
+                await conn.commit()
+            if SHARDED:
+                await conn.run_sync(_seed_id_sequences, shard)
+                await conn.commit()
+            await detect_search_index(conn)
+
+    if SHARDED:
+        async with async_session_maker() as db:
+            result = await db.execute(select(ProjectShard.project_id, ProjectShard.shard))
+            moved_projects.clear()
+            moved_projects.update(dict(result.all()))
@@ -3,98 +3,9 @@ Example Agent Client
 This demonstrates how an AI agent can interact with the Kanban PM API
 """
 
-import requests
 import time
-from typing import List, Dict, Optional
 
-
-class AgentClient:
-    """Simple client for AI agents to interact with the Kanban PM API"""
-    
-    def __init__(self, base_url: str, api_key: str):
-        self.base_url = base_url.rstrip('/')
-        self.api_key = api_key
-        self.headers = {
-            'X-API-Key': api_key,
-            'Content-Type': 'application/json'
-        }
-    
-    def get_profile(self) -> Dict:
-        """Get agent's own profile"""
-        response = requests.get(f"{self.base_url}/entities/me", headers=self.headers)
-        response.raise_for_status()
-        return response.json()
-    
-    def get_available_tasks(self) -> List[Dict]:
-        """Get tasks available based on agent's skills"""
-        response = requests.get(f"{self.base_url}/tasks/available", headers=self.headers)
-        response.raise_for_status()
-        return response.json()
-    
-    def get_my_tasks(self) -> List[Dict]:
-        """Get tasks assigned to this agent"""
-        response = requests.get(
-            f"{self.base_url}/tasks",
-            headers=self.headers,
-            params={'assigned_to_me': True}
-        )
-        response.raise_for_status()
-        return response.json()
-    
-    def get_task_details(self, task_id: int) -> Dict:
-        """Get detailed information about a task"""
-        response = requests.get(f"{self.base_url}/tasks/{task_id}", headers=self.headers)
-        response.raise_for_status()
-        return response.json()
-    
-    def self_assign_task(self, task_id: int) -> Dict:
-        """Self-assign a task"""
-        response = requests.post(
-            f"{self.base_url}/tasks/{task_id}/self-assign",
-            headers=self.headers
-        )
-        response.raise_for_status()
-        return response.json()
-    
-    def update_task_status(self, task_id: int, status: str) -> Dict:
-        """Update task status (pending, in_progress, in_review, completed, blocked)"""
-        response = requests.patch(
-            f"{self.base_url}/tasks/{task_id}",
-            headers=self.headers,
-            json={'status': status}
-        )
-        response.raise_for_status()
-        return response.json()
-    
-    def add_comment(self, task_id: int, content: str) -> Dict:
-        """Add a comment to a task"""
-        response = requests.post(
-            f"{self.base_url}/comments",
-            headers=self.headers,
-            json={'task_id': task_id, 'content': content}
-        )
-        response.raise_for_status()
-        return response.json()
-    
-    def get_task_comments(self, task_id: int) -> List[Dict]:
-        """Get all comments for a task"""
-        response = requests.get(
-            f"{self.base_url}/tasks/{task_id}/comments",
-            headers=self.headers
-        )
-        response.raise_for_status()
-        return response.json()
-    
-    def complete_task(self, task_id: int, comment: Optional[str] = None) -> Dict:
-        """Mark task as completed with optional comment"""
-        # Update status
-        task = self.update_task_status(task_id, 'completed')
-        
-        # Add completion comment if provided
-        if comment:
-            self.add_comment(task_id, comment)
-        
-        return task
+from agent_sdk import AgentClient, register_agent
 
 
 def example_agent_workflow():
@@ -104,6 +15,7 @@ def example_agent_workflow():
     API_KEY = "YOUR_API_KEY_HERE"
     BASE_URL = "http://localhost:8000"
     
+    # Speaks MessagePack when the msgpack package is installed, JSON otherwise
     agent = AgentClient(BASE_URL, API_KEY)
     
     print("=== Agent Workflow Example ===\n")
@@ -155,21 +67,13 @@ def example_agent_workflow():
     for task in my_tasks:
         print(f"   - {task['title']} (status: {task['status']})")
     
+    agent.close()
     print("\n=== Workflow Complete ===")
 
 
 def register_new_agent(base_url: str, name: str, skills: str) -> str:
     """Helper function to register a new agent"""
-    response = requests.post(
-        f"{base_url}/entities/register/agent",
-        json={
-            "name": name,
-            "entity_type": "agent",
-            "skills": skills
-        }
-    )
-    response.raise_for_status()
-    data = response.json()
+    data = register_agent(base_url, name, skills)
     
     print(f"Agent registered successfully!")
     print(f"Name: {data['name']}")
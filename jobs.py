@@ -0,0 +1,332 @@
+"""
+Background jobs.
+
+Expensive work (cascading deletes, bulk imports, index reconciliation,
+notifications) is recorded as a row in ``jobs`` and run by a pool of
+in-process workers, so the request that asked for it returns a job id
+straight away. Because jobs are rows, they are enqueued in the caller's
+transaction: a job exists exactly when the change that asked for it was
+committed, and queued work survives a restart.
+
+Workers claim the oldest queued job with a single UPDATE ... RETURNING
+(FOR UPDATE SKIP LOCKED on PostgreSQL). JOB_WORKERS bounds the jobs running
+at once and JOB_KIND_CONCURRENCY caps individual kinds, e.g.
+``delete_project=1,import_tasks=2``. A failed job is retried until it has
+run JOB_MAX_ATTEMPTS times. Jobs still marked running when the queue starts
+were interrupted and are requeued, so handlers must be idempotent; this
+assumes one process runs the workers (set JOB_WORKERS=0 elsewhere).
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update, delete, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import (
+    ActivityAction, ActivityObject, Job, JobStatus, Project, ProjectShard, Stage, Task, Comment, task_assignments
+)
+from activity import record, record_all
+from cache import project_cache
+from metrics import registry
+from websocket_manager import manager, create_notification
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_KIND_CONCURRENCY = os.getenv("JOB_KIND_CONCURRENCY", "delete_project=1,reindex_search=1,archive_tasks=1")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "500"))
+
+jobs_finished = registry.counter("jobs_total", "Finished job runs by kind and outcome", ("kind", "status"))
+job_duration = registry.histogram("job_duration_seconds", "Job run time by kind", ("kind",))
+
+# Handlers get a session and the claimed row (id, kind, payload, result, attempts, max_attempts)
+Handler = Callable[[AsyncSession, Any], Awaitable[Optional[dict]]]
+
+
+def parse_kind_limits(spec: str) -> Dict[str, int]:
+    """Parse ``kind=limit,kind=limit``"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, limit = item.partition("=")
+        limits[kind.strip()] = int(limit)
+    return limits
+
+
+class JobQueue:
+    """Database-backed job queue with a bounded pool of in-process workers"""
+
+    def __init__(self, workers: int = JOB_WORKERS, kind_limits: Optional[Dict[str, int]] = None):
+        self.workers = workers
+        self.kind_limits = parse_kind_limits(JOB_KIND_CONCURRENCY) if kind_limits is None else kind_limits
+        self.running: Dict[str, int] = {}
+        self.processed = 0
+        self._handlers: Dict[str, Handler] = {}
+        self._session_maker: Optional[async_sessionmaker] = None
+        self._claim_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def handler(self, kind: str):
+        """Decorator registering the coroutine that runs jobs of ``kind``"""
+        def register(func: Handler) -> Handler:
+            self._handlers[kind] = func
+            return func
+        return register
+
+    def enqueue(self, db: AsyncSession, kind: str, payload: Optional[dict] = None,
+                created_by: Optional[int] = None, max_attempts: int = JOB_MAX_ATTEMPTS) -> Job:
+        """Add a job to the caller's transaction; call ``wake`` once it is committed"""
+        job = Job(
+            kind=kind, status=JobStatus.QUEUED, payload=payload or {},
+            attempts=0, max_attempts=max_attempts, created_by=created_by
+        )
+        db.add(job)
+        return job
+
+    def wake(self):
+        """Tell idle workers there is new work instead of waiting for the next poll"""
+        self._wakeup.set()
+
+    async def _claim(self, finished: Optional[tuple] = None):
+        """Record the outcome of a finished job, if any, and claim the next one in the same transaction"""
+        # Claims are serialized in-process so the per-kind counts can't be overshot
+        async with self._claim_lock:
+            if finished is not None:
+                done, outcome = finished
+                self.running[done.kind] -= 1
+            saturated = [kind for kind, limit in self.kind_limits.items() if self.running.get(kind, 0) >= limit]
+            candidate = select(Job.id).where(Job.status == JobStatus.QUEUED)
+            if saturated:
+                candidate = candidate.where(Job.kind.notin_(saturated))
+            candidate = candidate.order_by(Job.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+            async with self._session_maker() as db:
+                if finished is not None:
+                    await db.execute(
+                        update(Job).where(Job.id == done.id).values(**outcome)
+                        .execution_options(synchronize_session=False)
+                    )
+                result = await db.execute(
+                    update(Job)
+                    .where(Job.id == candidate, Job.status == JobStatus.QUEUED)
+                    .values(status=JobStatus.RUNNING, attempts=Job.attempts + 1, started_at=datetime.utcnow())
+                    .returning(
+                        Job.id, Job.kind, Job.payload, Job.result, Job.attempts, Job.max_attempts, Job.created_by
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                job = result.first()
+                await db.commit()
+            if finished is not None:
+                self.processed += 1
+            if job is not None:
+                self.running[job.kind] = self.running.get(job.kind, 0) + 1
+            return job
+
+    async def _run(self, job) -> dict:
+        """Run a claimed job; returns the column values recording its outcome"""
+        start = time.perf_counter()
+        try:
+            handler = self._handlers.get(job.kind)
+            if handler is None:
+                raise LookupError(f"No handler for job kind {job.kind!r}")
+            async with self._session_maker() as db:
+                result = await handler(db, job)
+            jobs_finished.inc(1, job.kind, "succeeded")
+            return {"status": JobStatus.SUCCEEDED, "result": result, "error": None, "finished_at": datetime.utcnow()}
+        except Exception as exc:
+            retry = job.attempts < job.max_attempts and job.kind in self._handlers
+            logger.exception("Job %s (%s) failed on attempt %d", job.id, job.kind, job.attempts)
+            jobs_finished.inc(1, job.kind, "retried" if retry else "failed")
+            return {
+                "status": JobStatus.QUEUED if retry else JobStatus.FAILED,
+                "error": f"{type(exc).__name__}: {exc}",
+                "finished_at": None if retry else datetime.utcnow(),
+            }
+        finally:
+            job_duration.observe(time.perf_counter() - start, job.kind)
+
+    async def _worker(self):
+        finished = None
+        while True:
+            self._wakeup.clear()
+            try:
+                # Saves a commit per job over recording the outcome separately
+                job = await self._claim(finished)
+            except Exception:
+                if finished is not None:
+                    logger.exception("Recording the outcome of job %s failed; it reruns on restart", finished[0].id)
+                else:
+                    logger.exception("Claiming a job failed")
+                job = None
+            finished = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Another worker may be able to take the next job right away
+            self._wakeup.set()
+            finished = (job, await self._run(job))
+
+    async def start(self, session_maker: async_sessionmaker):
+        """Requeue interrupted jobs and start the workers"""
+        if self._tasks or self.workers <= 0:
+            return
+        self._session_maker = session_maker
+        async with session_maker() as db:
+            result = await db.execute(
+                update(Job).where(Job.status == JobStatus.RUNNING).values(status=JobStatus.QUEUED)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.info("Requeued %d interrupted jobs", result.rowcount)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers; jobs they were running are requeued on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+# Global instance
+job_queue = JobQueue()
+
+registry.gauge(
+    "jobs_running", "Jobs currently running by kind", ("kind",),
+    callback=lambda: [((kind,), count) for kind, count in job_queue.running.items()]
+)
+
+
+# ============================================================================
+# JOB HANDLERS
+# ============================================================================
+
+@job_queue.handler("delete_project")
+async def delete_project(db: AsyncSession, job) -> dict:
+    """Delete a project's tasks in batches, then its stages and the project itself"""
+    # Imported here because database imports this module (through archive)
+    from database import project_session
+
+    project_id = job.payload["project_id"]
+    async with project_session(project_id) as db:
+        return await _delete_project(db, project_id, job.created_by)
+
+
+async def _delete_project(db: AsyncSession, project_id: int, actor_id: Optional[int] = None) -> dict:
+    await db.execute(
+        update(Task).where(Task.project_id == project_id, Task.parent_task_id.isnot(None))
+        .values(parent_task_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+    # Short transactions keep the database available to requests during a large delete
+    tasks_deleted = 0
+    while True:
+        result = await db.execute(select(Task.id).where(Task.project_id == project_id).limit(JOB_BATCH_SIZE))
+        task_ids = result.scalars().all()
+        if not task_ids:
+            break
+        await db.execute(delete(Comment).where(Comment.task_id.in_(task_ids)))
+        await db.execute(delete(task_assignments).where(task_assignments.c.task_id.in_(task_ids)))
+        await db.execute(delete(Task).where(Task.id.in_(task_ids)))
+        await db.commit()
+        tasks_deleted += len(task_ids)
+        await project_cache.invalidate(project_id)
+
+    await db.execute(delete(Stage).where(Stage.project_id == project_id))
+    # Imported here because archive registers its own handler on this queue
+    from archive import delete_archived_project
+    await delete_archived_project(db, project_id)
+    await db.execute(delete(ProjectShard).where(ProjectShard.project_id == project_id))
+    result = await db.execute(delete(Project).where(Project.id == project_id).returning(Project.id))
+    if result.scalar_one_or_none() is not None:
+        await record(db, actor_id, ActivityAction.DELETED, (ActivityObject.PROJECT, project_id, project_id))
+        job_queue.enqueue(db, "notify", {
+            "event_type": "project_deleted", "project_id": project_id, "data": {"id": project_id}
+        })
+    await db.commit()
+    job_queue.wake()
+    await project_cache.invalidate(project_id)
+    return {"project_id": project_id, "tasks_deleted": tasks_deleted}
+
+
+@job_queue.handler("import_tasks")
+async def import_tasks(db: AsyncSession, job) -> dict:
+    """Insert tasks into a project in batches"""
+    from database import project_session
+
+    async with project_session(job.payload["project_id"]) as db:
+        return await _import_tasks(db, job)
+
+
+async def _import_tasks(db: AsyncSession, job) -> dict:
+    from database import assign_ids
+
+    payload = job.payload
+    project_id = payload["project_id"]
+    # A retried import resumes after the batches that were already committed
+    imported = (job.result or {}).get("imported", 0)
+    now = datetime.utcnow()
+    rows = [
+        {**task, "project_id": project_id, "stage_id": payload.get("stage_id"), "version": 1,
+         "created_at": now, "updated_at": now}
+        for task in payload["tasks"]
+    ]
+    for start in range(imported, len(rows), JOB_BATCH_SIZE):
+        batch = await assign_ids(db, Task, rows[start:start + JOB_BATCH_SIZE])
+        result = await db.execute(insert(Task).returning(Task.id), batch)
+        await record_all(db, job.created_by, [
+            (ActivityAction.CREATED, (ActivityObject.TASK, task_id, project_id), ()) for task_id in result.scalars()
+        ])
+        await db.execute(update(Job).where(Job.id == job.id).values(result={"imported": start + len(batch)}))
+        await db.commit()
+        await project_cache.invalidate(project_id)
+
+    job_queue.enqueue(db, "notify", {
+        "event_type": "tasks_imported", "project_id": project_id, "data": {"count": len(rows)}
+    })
+    await db.commit()
+    job_queue.wake()
+    return {"project_id": project_id, "imported": len(rows)}
+
+
+@job_queue.handler("reindex_search")
+async def reindex_search(db: AsyncSession, job) -> dict:
+    """Rebuild the SQLite full-text tables of every shard from the base tables"""
+    from database import fan_out
+
+    if db.bind.dialect.name != "sqlite":
+        # PostgreSQL uses expression indexes, which can't drift
+        return {"rebuilt": False}
+
+    async def rebuild(db: AsyncSession):
+        await db.execute(text("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')"))
+        await db.execute(text("INSERT INTO comments_fts(comments_fts) VALUES ('rebuild')"))
+        await db.commit()
+
+    shards = await fan_out(rebuild)
+    return {"rebuilt": True, "shards": len(shards)}
+
+
+@job_queue.handler("notify")
+async def notify(db: AsyncSession, job) -> dict:
+    """Broadcast an event to WebSocket clients"""
+    payload = job.payload
+    message = create_notification(payload["event_type"], payload.get("data", {}), payload.get("project_id"))
+    if payload.get("project_id") is not None:
+        await manager.broadcast_to_project(message, payload["project_id"])
+    else:
+        await manager.broadcast_to_all(message)
+    return {"delivered": True}
@@ -0,0 +1,206 @@
+"""
+Task leases for agent claims.
+
+A task claimed by an agent (self-assign or scheduler) carries a
+``lease_expires_at`` deadline. Agents keep their leases alive with
+heartbeats, which only mark the agent in an in-memory buffer; the buffer is
+flushed with a single UPDATE per batch of agents. A reaper returns tasks
+whose lease has expired to PENDING and drops their agent assignees, walking
+the indexed expiry column in batches.
+
+Buffered heartbeats are lost if the process dies before a flush, so
+LEASE_TTL_SECONDS should comfortably exceed the agent heartbeat interval
+plus HEARTBEAT_FLUSH_SECONDS.
+
+With several shards each flush applies the same heartbeats to every shard,
+and each shard is reaped on its own.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Set
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import ActivityAction, ActivityObject, Entity, Task, EntityType, TaskStatus, task_assignments
+from activity import record_all
+from cache import project_cache
+from board import publish_changed
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "60"))
+HEARTBEAT_FLUSH_SECONDS = float(os.getenv("HEARTBEAT_FLUSH_SECONDS", "5"))
+LEASE_REAP_INTERVAL_SECONDS = float(os.getenv("LEASE_REAP_INTERVAL_SECONDS", "15"))
+LEASE_REAP_BATCH_SIZE = int(os.getenv("LEASE_REAP_BATCH_SIZE", "500"))
+
+# Statuses in which a lease is enforced; review, blocked and completed tasks are left alone
+LEASED_STATUSES = (TaskStatus.PENDING, TaskStatus.IN_PROGRESS)
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+FLUSH_CHUNK_SIZE = 500
+
+
+def lease_expiry(now: Optional[datetime] = None) -> datetime:
+    """Deadline for a lease taken or renewed now"""
+    return (now or datetime.utcnow()) + timedelta(seconds=LEASE_TTL_SECONDS)
+
+
+class LeaseManager:
+    """Buffers agent heartbeats and reclaims tasks with expired leases"""
+
+    def __init__(self):
+        self._heartbeats: Set[int] = set()
+        self._background: Optional[asyncio.Task] = None
+
+    def heartbeat(self, entity_id: int):
+        """Record a heartbeat; takes effect on the next flush"""
+        self._heartbeats.add(entity_id)
+
+    @property
+    def pending_heartbeats(self) -> int:
+        return len(self._heartbeats)
+
+    def take_heartbeats(self) -> List[int]:
+        """Agents that sent a heartbeat since the last call, emptying the buffer"""
+        entity_ids = list(self._heartbeats)
+        self._heartbeats = set()
+        return entity_ids
+
+    async def flush(self, db: AsyncSession, entity_ids: Optional[List[int]] = None) -> int:
+        """Extend the leases of ``entity_ids``, by default every agent that sent a heartbeat since the last flush"""
+        if entity_ids is None:
+            entity_ids = self.take_heartbeats()
+        if not entity_ids:
+            return 0
+
+        expiry = lease_expiry()
+        project_ids = set()
+        for start in range(0, len(entity_ids), FLUSH_CHUNK_SIZE):
+            chunk = entity_ids[start:start + FLUSH_CHUNK_SIZE]
+            result = await db.execute(
+                update(Task)
+                .where(
+                    Task.lease_expires_at.isnot(None),
+                    Task.status.in_(LEASED_STATUSES),
+                    Task.id.in_(
+                        select(task_assignments.c.task_id).where(task_assignments.c.entity_id.in_(chunk))
+                    )
+                )
+                .values(lease_expires_at=expiry)
+                .returning(Task.project_id)
+                .execution_options(synchronize_session=False)
+            )
+            project_ids.update(result.scalars().all())
+        await db.commit()
+        await project_cache.invalidate(*project_ids)
+        return len(entity_ids)
+
+    async def reap(self, db: AsyncSession) -> int:
+        """Return tasks with expired leases to PENDING; returns the number reclaimed"""
+        reclaimed = 0
+        agent_ids = select(Entity.id).where(Entity.entity_type == EntityType.AGENT)
+        while True:
+            now = datetime.utcnow()
+            result = await db.execute(
+                select(Task.id, Task.project_id, Task.status)
+                .where(Task.lease_expires_at < now, Task.status.in_(LEASED_STATUSES))
+                .limit(LEASE_REAP_BATCH_SIZE)
+            )
+            expired = result.all()
+            if not expired:
+                break
+            candidates = {task_id: (project_id, previous) for task_id, project_id, previous in expired}
+
+            # Checked again, so a heartbeat or a transition committed since the SELECT wins
+            result = await db.execute(
+                update(Task)
+                .where(
+                    Task.id.in_(list(candidates)),
+                    Task.lease_expires_at < now,
+                    Task.status.in_(LEASED_STATUSES)
+                )
+                .values(status=TaskStatus.PENDING, lease_expires_at=None, version=Task.version + 1, updated_at=now)
+                .returning(Task.id)
+                .execution_options(synchronize_session=False)
+            )
+            task_ids = result.scalars().all()
+            targets = {task_id: (ActivityObject.TASK, task_id, candidates[task_id][0]) for task_id in task_ids}
+            events = []
+            if task_ids:
+                result = await db.execute(
+                    delete(task_assignments).where(
+                        task_assignments.c.task_id.in_(task_ids),
+                        task_assignments.c.entity_id.in_(agent_ids)
+                    )
+                    .returning(task_assignments.c.task_id, task_assignments.c.entity_id)
+                )
+                events = [
+                    (ActivityAction.UNASSIGNED, targets[task_id], [("assignee", entity_id, None)])
+                    for task_id, entity_id in result.all()
+                ]
+            events += [
+                (ActivityAction.UPDATED, targets[task_id], [("status", candidates[task_id][1], TaskStatus.PENDING)])
+                for task_id in task_ids if candidates[task_id][1] != TaskStatus.PENDING
+            ]
+            # No actor: the reaper reclaimed them
+            await record_all(db, None, events)
+            project_ids = {targets[task_id][2] for task_id in task_ids}
+            await db.commit()
+            if project_ids:
+                await project_cache.invalidate(*project_ids)
+                await publish_changed(*project_ids)
+
+            reclaimed += len(task_ids)
+            if len(expired) < LEASE_REAP_BATCH_SIZE:
+                break
+
+        if reclaimed:
+            logger.info("Reclaimed %d tasks with expired leases", reclaimed)
+        return reclaimed
+
+    async def flush_all(self, session_makers: Sequence[async_sessionmaker], reap: bool = False):
+        """Flush the buffered heartbeats to every shard, reaping each one after its flush if ``reap``"""
+        entity_ids = self.take_heartbeats()
+        for session_maker in session_makers:
+            async with session_maker() as db:
+                # Always flush first so a live agent is never reaped on a stale lease
+                await self.flush(db, entity_ids)
+                if reap:
+                    await self.reap(db)
+
+    async def run_forever(self, session_makers: Sequence[async_sessionmaker]):
+        """Flush heartbeats every HEARTBEAT_FLUSH_SECONDS and reap every LEASE_REAP_INTERVAL_SECONDS"""
+        loop = asyncio.get_running_loop()
+        next_reap = loop.time() + LEASE_REAP_INTERVAL_SECONDS
+        while True:
+            await asyncio.sleep(HEARTBEAT_FLUSH_SECONDS)
+            try:
+                reap = loop.time() >= next_reap
+                await self.flush_all(session_makers, reap)
+                if reap:
+                    next_reap = loop.time() + LEASE_REAP_INTERVAL_SECONDS
+            except Exception:
+                logger.exception("Lease maintenance failed")
+
+    def start(self, session_makers: Sequence[async_sessionmaker]):
+        """Start the background flusher/reaper over the shards' session makers"""
+        if self._background is None:
+            self._background = asyncio.create_task(self.run_forever(session_makers))
+
+    async def stop(self, session_makers: Sequence[async_sessionmaker]):
+        """Stop the background task and flush any buffered heartbeats"""
+        if self._background is not None:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
+        await self.flush_all(session_makers)
+
+
+# Global instance
+lease_manager = LeaseManager()
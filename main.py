@@ -1,38 +1,105 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Request
+from fastapi import (
+    FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Request, Query, Header, Response
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, func
+from sqlalchemy import select, insert, update, delete, func, exists, literal
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List, Optional
+from functools import lru_cache
 from datetime import timedelta, datetime
-
-from database import get_db, init_db
-from models import Entity, Project, Task, Stage, Comment, EntityType, TaskStatus, ApprovalStatus
+import itertools
+import json
+import logging
+
+from database import (
+    get_db, get_project_db, get_task_db, get_stage_db, get_new_project_db, project_session, task_shard,
+    project_shard, stage_shard, fan_out, assign_ids, next_id, init_db, engine, async_session_maker,
+    shard_session_makers, dialect_insert
+)
+from models import (
+    Entity, Project, Task, Stage, Comment, Job, ArchivedTask, ArchivedComment, EntityType, TaskStatus,
+    ActivityAction, ActivityObject,
+    ApprovalStatus, parse_skills, task_assignments
+)
 from schemas import (
     EntityCreate, EntityResponse, ProjectCreate, ProjectUpdate, ProjectResponse,
-    ProjectDetailResponse, TaskCreate, TaskUpdate, TaskResponse, TaskDetailResponse,
+    ProjectDetailResponse, NormalizedProjectDetailResponse, ResponseShape, TaskCreate, TaskUpdate, TaskResponse, TaskDetailResponse,
     StageCreate, StageUpdate, StageResponse, CommentCreate, CommentResponse,
-    TaskAssignment, Token
+    TaskAssignment, Token, SearchHit, SearchScope, ScheduleResponse,
+    TaskTransition, TaskTransitionResponse, JobResponse, TaskImport, WebSocketSubscription, ActivityResponse
 )
 from auth import (
     get_password_hash, generate_api_key, authenticate_entity, create_access_token,
-    get_current_active_entity, ACCESS_TOKEN_EXPIRE_MINUTES
+    get_current_active_entity, get_current_agent_id, authenticate_websocket, create_board_token,
+    ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from websocket_manager import (
+    manager, create_notification, ConnectionLimitExceeded, WS_PING_INTERVAL_SECONDS, WS_PONG_TIMEOUT_SECONDS
+)
+from board import (
+    board_state, first_pages, stage_page, publish_task, publish_task_deleted, publish_stage,
+    publish_stage_deleted, BOARD_PAGE_SIZE
 )
-from websocket_manager import manager, create_notification
+import search as search_index
+from scheduler import scheduler, agent_loads, add_loads, SCHEDULER_INTERVAL_SECONDS
+from leases import lease_manager, lease_expiry, LEASED_STATUSES
+from writebehind import comment_buffer
+from concurrency import etag, parse_if_match, versioned_update
+from activity import history, record, record_all, target, tracked_update
+from cache import project_cache
+from jobs import job_queue
+from archive import archiver, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_SECONDS
+from metrics import registry, MetricsMiddleware, METRICS_ENABLED
+from profiling import SQLProfilerMiddleware, SQL_PROFILING, recent_profiles
+from ratelimit import RateLimitMiddleware, RATE_LIMIT_ENABLED
+from compression import (
+    CompressionMiddleware, COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, WS_PER_MESSAGE_DEFLATE, choose_encoding, compress_async
+)
+from startup import startup, WARMUP_ENABLED, WARMUP_PROJECTS
+from serialization import (
+    NegotiatedResponse, WireFormatMiddleware, negotiated_format, packb, websocket_format, receive_frame,
+    decode as decode_frame,
+    MSGPACK_MEDIA_TYPE, MSGPACK_SUBPROTOCOL
+)
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Agent Kanban Project Management API",
     description="A platform-agnostic project management system for humans and AI agents",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=NegotiatedResponse
 )
 
-# Mount static files and templates
+# Mount static files; templates are loaded on first use
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+
+UI_TEMPLATES = ("dashboard.html", "projects.html", "kanban_board.html")
+
+
+@lru_cache(maxsize=1)
+def ui_templates():
+    """Jinja environment for the UI pages; agent-only workers never build it"""
+    from fastapi.templating import Jinja2Templates
+
+    return Jinja2Templates(directory="templates")
+
+# The middleware added last runs first
+app.add_middleware(WireFormatMiddleware)
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Added before CORS, so 429/503 responses carry CORS headers the UI needs to read them,
+# and before the metrics middleware, so rejected requests are still counted
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 # CORS middleware for UI integration
 app.add_middleware(
@@ -41,13 +108,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if SQL_PROFILING:
+    app.add_middleware(SQLProfilerMiddleware)
+
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    """A versioned row changed between load and flush"""
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"detail": "Modified concurrently, retry"})
+
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
-    await init_db()
+    """Initialize database on startup, warm up, then start background workers"""
+    with startup.phase("schema"):
+        await init_db()
+    if WARMUP_ENABLED:
+        with startup.phase("warmup"):
+            await startup.warm_up(engine)
+    with startup.phase("workers"):
+        lease_manager.start(shard_session_makers)
+        comment_buffer.start(shard_session_makers)
+        if SCHEDULER_INTERVAL_SECONDS > 0:
+            scheduler.start(shard_session_makers)
+        await job_queue.start(async_session_maker)
+        if ARCHIVE_INTERVAL_SECONDS > 0:
+            archiver.start(async_session_maker)
+        manager.start()
+    logger.info("Startup: %s", startup.report())
+
+
+@startup.hook
+async def compile_templates():
+    for name in UI_TEMPLATES:
+        ui_templates().get_template(name)
+
+
+@startup.hook
+async def prime_project_cache():
+    """Build the nested detail of the most recently updated projects"""
+    async def recent(db: AsyncSession):
+        result = await db.execute(
+            select(Project.id, Project.updated_at).order_by(Project.updated_at.desc()).limit(WARMUP_PROJECTS)
+        )
+        return result.all()
+    
+    projects = sorted(itertools.chain(*await fan_out(recent)), key=lambda row: row.updated_at, reverse=True)
+    for project_id, _ in projects[:WARMUP_PROJECTS]:
+        async with project_session(project_id) as db:
+            await project_cache.get_or_build(
+                project_id, lambda: project_detail_body(db, project_id, ResponseShape.NESTED),
+                ResponseShape.NESTED.value
+            )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    await manager.stop()
+    await scheduler.stop()
+    await archiver.stop()
+    await job_queue.stop()
+    await lease_manager.stop(shard_session_makers)
+    await comment_buffer.stop(shard_session_makers)
 
 
 # ============================================================================
@@ -56,40 +184,62 @@ async def startup_event():
 
 @app.get("/", response_class=HTMLResponse, include_in_schema=False)
 async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
-    """Dashboard page"""
-    # Get stats
-    total_projects = await db.execute(select(func.count(Project.id)))
-    total_tasks = await db.execute(select(func.count(Task.id)))
-    completed_tasks = await db.execute(select(func.count(Task.id)).where(Task.status == TaskStatus.COMPLETED))
-    total_entities = await db.execute(select(func.count(Entity.id)))
-    
-    stats = {
-        "total_projects": total_projects.scalar(),
-        "total_tasks": total_tasks.scalar(),
-        "completed_tasks": completed_tasks.scalar(),
-        "total_entities": total_entities.scalar()
-    }
-    
-    # Get recent projects
-    result = await db.execute(
-        select(Project).order_by(Project.created_at.desc()).limit(5)
-    )
-    recent_projects = result.scalars().all()
-    
-    # Add task count to projects
-    for project in recent_projects:
-        task_count_result = await db.execute(
-            select(func.count(Task.id)).where(Task.project_id == project.id)
+    """Dashboard page; each shard is queried concurrently and the results merged"""
+    async def shard_summary(db: AsyncSession):
+        # Get stats in one round trip
+        result = await db.execute(
+            select(
+                select(func.count(Project.id)).scalar_subquery(),
+                select(func.count(Task.id)).scalar_subquery(),
+                select(func.count(Task.id)).where(Task.status == TaskStatus.COMPLETED).scalar_subquery(),
+                select(func.count(ArchivedTask.id)).scalar_subquery(),
+            )
+        )
+        counts = result.one()
+        
+        # Get recent projects
+        result = await db.execute(
+            select(Project).order_by(Project.created_at.desc()).limit(5)
         )
-        project.task_count = task_count_result.scalar()
+        projects = result.scalars().all()
+        
+        # Add task count to projects with one grouped query instead of one per project
+        result = await db.execute(
+            select(Task.project_id, func.count(Task.id))
+            .where(Task.project_id.in_([project.id for project in projects]))
+            .group_by(Task.project_id)
+        )
+        task_counts = dict(result.all())
+        for project in projects:
+            project.task_count = task_counts.get(project.id, 0)
+        
+        # Get recent tasks
+        result = await db.execute(
+            select(Task).order_by(Task.created_at.desc()).limit(6)
+        )
+        return counts, projects, result.scalars().all()
     
-    # Get recent tasks
-    result = await db.execute(
-        select(Task).order_by(Task.created_at.desc()).limit(6)
+    summaries = await fan_out(shard_summary)
+    total_projects, total_tasks, completed_tasks, archived_tasks = (
+        sum(column) for column in zip(*(counts for counts, _, _ in summaries))
     )
-    recent_tasks = result.scalars().all()
+    total_entities = (await db.execute(select(func.count(Entity.id)))).scalar()
     
-    return templates.TemplateResponse("dashboard.html", {
+    # Archived tasks are all completed
+    stats = {
+        "total_projects": total_projects,
+        "total_tasks": total_tasks + archived_tasks,
+        "completed_tasks": completed_tasks + archived_tasks,
+        "total_entities": total_entities
+    }
+    recent_projects = sorted(
+        itertools.chain(*(projects for _, projects, _ in summaries)), key=lambda project: project.created_at, reverse=True
+    )[:5]
+    recent_tasks = sorted(
+        itertools.chain(*(tasks for _, _, tasks in summaries)), key=lambda task: task.created_at, reverse=True
+    )[:6]
+    
+    return ui_templates().TemplateResponse("dashboard.html", {
         "request": request,
         "stats": stats,
         "recent_projects": recent_projects,
@@ -98,42 +248,62 @@ async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
 
 
 @app.get("/ui/projects", response_class=HTMLResponse, include_in_schema=False)
-async def ui_projects(request: Request, db: AsyncSession = Depends(get_db)):
+async def ui_projects(request: Request):
     """Projects list page"""
-    result = await db.execute(
-        select(Project)
-        .options(selectinload(Project.stages), selectinload(Project.tasks))
-        .order_by(Project.created_at.desc())
+    async def shard_projects(db: AsyncSession):
+        result = await db.execute(
+            select(Project)
+            .options(selectinload(Project.stages), selectinload(Project.tasks))
+            .order_by(Project.created_at.desc())
+        )
+        return result.scalars().all()
+    
+    projects = sorted(
+        itertools.chain(*await fan_out(shard_projects)), key=lambda project: project.created_at, reverse=True
     )
-    projects = result.scalars().all()
     
-    return templates.TemplateResponse("projects.html", {
+    return ui_templates().TemplateResponse("projects.html", {
         "request": request,
         "projects": projects
     })
 
 
 @app.get("/ui/projects/{project_id}/board", response_class=HTMLResponse, include_in_schema=False)
-async def project_kanban_board(request: Request, project_id: int, db: AsyncSession = Depends(get_db)):
-    """Kanban board for a project"""
+async def project_kanban_board(request: Request, project_id: int, db: AsyncSession = Depends(get_project_db)):
+    """Kanban board for a project; columns start with their first BOARD_PAGE_SIZE cards and load more on scroll"""
+    # Where the board's WebSocket picks up changes from
+    server_time = datetime.utcnow()
     result = await db.execute(
-        select(Project)
-        .filter(Project.id == project_id)
-        .options(
-            selectinload(Project.stages).selectinload(Stage.tasks).selectinload(Task.assignees)
-        )
+        select(Project).filter(Project.id == project_id).options(selectinload(Project.stages))
     )
     project = result.scalar_one_or_none()
     
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    return templates.TemplateResponse("kanban_board.html", {
+    stage_tasks, stage_counts = await first_pages(db, project_id)
+    return ui_templates().TemplateResponse("kanban_board.html", {
         "request": request,
-        "project": project
+        "project": project,
+        "stage_tasks": stage_tasks,
+        "stage_counts": stage_counts,
+        "server_time": server_time.isoformat(),
+        "ws_token": create_board_token(project_id)
     })
 
 
+@app.get("/ui/projects/{project_id}/stages/{stage_id}/cards", include_in_schema=False)
+async def project_board_cards(
+    project_id: int,
+    stage_id: int,
+    after: int = 0,
+    limit: int = Query(BOARD_PAGE_SIZE, ge=1, le=500),
+    db: AsyncSession = Depends(get_project_db)
+):
+    """Next page of a board column: compact cards with id greater than ``after``"""
+    return await stage_page(db, project_id, stage_id, after, limit)
+
+
 # ============================================================================
 # ENTITY MANAGEMENT ENDPOINTS
 # ============================================================================
@@ -157,11 +327,11 @@ async def register_human(entity: EntityCreate, db: AsyncSession = Depends(get_db
         entity_type=EntityType.HUMAN,
         email=entity.email,
         hashed_password=get_password_hash(entity.password),
-        skills=entity.skills
+        skills=entity.skills,
+        max_concurrent_tasks=entity.max_concurrent_tasks
     )
     db.add(db_entity)
     await db.commit()
-    await db.refresh(db_entity)
     return db_entity
 
 
@@ -178,11 +348,11 @@ async def register_agent(entity: EntityCreate, db: AsyncSession = Depends(get_db
         entity_type=EntityType.AGENT,
         email=entity.email,
         api_key=api_key,
-        skills=entity.skills
+        skills=entity.skills,
+        max_concurrent_tasks=entity.max_concurrent_tasks
     )
     db.add(db_entity)
     await db.commit()
-    await db.refresh(db_entity)
     
     return {
         "id": db_entity.id,
@@ -240,19 +410,17 @@ async def list_entities(
 @app.post("/projects", response_model=ProjectResponse, status_code=status.HTTP_201_CREATED)
 async def create_project(
     project: ProjectCreate,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_new_project_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """Create a new project (requires approval)"""
     db_project = Project(
+        id=await next_id(db, Project),
         name=project.name,
         description=project.description,
         creator_id=current_entity.id,
         approval_status=ApprovalStatus.PENDING
     )
-    db.add(db_project)
-    await db.commit()
-    await db.refresh(db_project)
     
     # Create default stages
     default_stages = [
@@ -262,20 +430,27 @@ async def create_project(
         {"name": "Review", "description": "Awaiting review", "order": 4},
         {"name": "Done", "description": "Completed tasks", "order": 5}
     ]
+    db.add(db_project)
+    await db.flush()
     
-    for stage_data in default_stages:
-        stage = Stage(project_id=db_project.id, **stage_data)
-        db.add(stage)
-    
+    # One executemany for all stages rather than an INSERT ... RETURNING per stage
+    await db.execute(
+        insert(Stage),
+        await assign_ids(
+            db, Stage, [{"project_id": db_project.id, "version": 1, **stage_data} for stage_data in default_stages]
+        )
+    )
+    await record(db, current_entity.id, ActivityAction.CREATED, target(db_project))
+    # Queued with the project, so the event is sent only if the project was created
+    job_queue.enqueue(db, "notify", {"event_type": "project_created", "data": {"id": db_project.id}})
     await db.commit()
-    await db.refresh(db_project)
+    job_queue.wake()
     return db_project
 
 
 @app.get("/projects", response_model=List[ProjectResponse])
 async def list_projects(
     approval_status: Optional[ApprovalStatus] = None,
-    db: AsyncSession = Depends(get_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """List all projects, optionally filtered by approval status"""
@@ -283,71 +458,129 @@ async def list_projects(
     if approval_status:
         query = query.filter(Project.approval_status == approval_status)
     
-    result = await db.execute(query.order_by(Project.created_at.desc()))
-    projects = result.scalars().all()
-    return projects
+    async def shard_projects(db: AsyncSession):
+        result = await db.execute(query.order_by(Project.created_at.desc()))
+        return result.scalars().all()
+    
+    return sorted(
+        itertools.chain(*await fan_out(shard_projects)), key=lambda project: project.created_at, reverse=True
+    )
+
+
+async def project_detail_body(db: AsyncSession, project_id: int, shape: ResponseShape) -> Optional[bytes]:
+    """Project detail as JSON in the given shape; None if there's no such project"""
+    schema = NormalizedProjectDetailResponse if shape == ResponseShape.NORMALIZED else ProjectDetailResponse
+    result = await db.execute(
+        select(Project)
+        .filter(Project.id == project_id)
+        .options(selectinload(Project.stages), selectinload(Project.tasks).selectinload(Task.assignees))
+    )
+    project = result.scalar_one_or_none()
+    if project is None:
+        return None
+    return schema.model_validate(project).model_dump_json().encode()
 
 
 @app.get("/projects/{project_id}", response_model=ProjectDetailResponse)
 async def get_project(
     project_id: int,
-    db: AsyncSession = Depends(get_db),
+    shape: ResponseShape = Query(ResponseShape.NESTED, description="normalized lists each assignee once"),
+    accept_encoding: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_project_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Get detailed project information including stages and tasks"""
-    result = await db.execute(
-        select(Project)
-        .filter(Project.id == project_id)
-        .options(selectinload(Project.stages), selectinload(Project.tasks))
+    """Get detailed project information including stages and tasks (served from the response cache)"""
+    body = await project_cache.get_or_build(
+        project_id, lambda: project_detail_body(db, project_id, shape), shape.value
     )
-    project = result.scalar_one_or_none()
-    
-    if not project:
+    if body is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    return project
+    variant, media_type = shape.value, "application/json"
+    if negotiated_format() == "msgpack":
+        json_body = body
+        
+        async def build_msgpack():
+            return packb(json.loads(json_body))
+        
+        variant, media_type = f"{shape.value}.msgpack", MSGPACK_MEDIA_TYPE
+        body = await project_cache.get_or_build(project_id, build_msgpack, variant)
+    
+    encoding = choose_encoding(accept_encoding) if COMPRESSION_ENABLED else None
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+    
+    # Large boards are compressed once per generation rather than on every read
+    async def build_compressed():
+        return await compress_async(body, encoding)
+    
+    compressed = await project_cache.get_or_build(project_id, build_compressed, f"{variant}.{encoding}")
+    return Response(
+        content=compressed, media_type=media_type,
+        headers={"Content-Encoding": encoding, "Vary": "Accept, Accept-Encoding"}
+    )
 
 
 @app.patch("/projects/{project_id}", response_model=ProjectResponse)
 async def update_project(
     project_id: int,
     project_update: ProjectUpdate,
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_project_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Update project details or approval status"""
-    result = await db.execute(select(Project).filter(Project.id == project_id))
-    project = result.scalar_one_or_none()
-    
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    # Update fields
+    """Update project details or approval status (If-Match: "<version>" makes it conditional)"""
     update_data = project_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(project, field, value)
-    
-    project.updated_at = datetime.utcnow()
+    update_data["updated_at"] = datetime.utcnow()
+    project = await tracked_update(db, Project, project_id, update_data, current_entity.id, parse_if_match(if_match))
     await db.commit()
-    await db.refresh(project)
+    await project_cache.invalidate(project_id)
+    
+    response.headers["ETag"] = etag(project.version)
     return project
 
 
-@app.delete("/projects/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
+@app.delete("/projects/{project_id}", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def delete_project(
     project_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_project_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Delete a project"""
-    result = await db.execute(select(Project).filter(Project.id == project_id))
-    project = result.scalar_one_or_none()
-    
-    if not project:
+    """Queue deletion of a project with its stages, tasks, comments and assignments"""
+    result = await db.execute(select(exists().where(Project.id == project_id)))
+    if not result.scalar():
         raise HTTPException(status_code=404, detail="Project not found")
     
-    await db.delete(project)
+    job = job_queue.enqueue(db, "delete_project", {"project_id": project_id}, created_by=current_entity.id)
     await db.commit()
+    job_queue.wake()
+    return job
+
+
+@app.post("/projects/{project_id}/import", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def import_project_tasks(
+    project_id: int,
+    data: TaskImport,
+    db: AsyncSession = Depends(get_project_db),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Queue a bulk import of tasks into a project"""
+    if data.stage_id is None:
+        query = select(exists().where(Project.id == project_id))
+    else:
+        query = select(exists().where(Stage.id == data.stage_id, Stage.project_id == project_id))
+    if not (await db.execute(query)).scalar():
+        raise HTTPException(status_code=404, detail="Project or stage not found")
+    
+    job = job_queue.enqueue(
+        db, "import_tasks",
+        {"project_id": project_id, "stage_id": data.stage_id, "tasks": [task.model_dump() for task in data.tasks]},
+        created_by=current_entity.id
+    )
+    await db.commit()
+    job_queue.wake()
+    return job
 
 
 # ============================================================================
@@ -358,20 +591,21 @@ async def delete_project(
 async def create_stage(
     project_id: int,
     stage: StageCreate,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_project_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """Add a new stage to a project"""
-    result = await db.execute(select(Project).filter(Project.id == project_id))
-    project = result.scalar_one_or_none()
-    
-    if not project:
+    result = await db.execute(select(exists().where(Project.id == project_id)))
+    if not result.scalar():
         raise HTTPException(status_code=404, detail="Project not found")
     
-    db_stage = Stage(project_id=project_id, **stage.model_dump())
+    db_stage = Stage(id=await next_id(db, Stage), project_id=project_id, **stage.model_dump())
     db.add(db_stage)
+    await db.flush()
+    await record(db, current_entity.id, ActivityAction.CREATED, target(db_stage))
     await db.commit()
-    await db.refresh(db_stage)
+    await project_cache.invalidate(project_id)
+    await publish_stage(db_stage, "stage_created")
     return db_stage
 
 
@@ -379,62 +613,106 @@ async def create_stage(
 async def update_stage(
     stage_id: int,
     stage_update: StageUpdate,
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_stage_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Update stage details"""
-    result = await db.execute(select(Stage).filter(Stage.id == stage_id))
-    stage = result.scalar_one_or_none()
-    
-    if not stage:
-        raise HTTPException(status_code=404, detail="Stage not found")
-    
+    """Update stage details (If-Match: "<version>" makes it conditional)"""
     update_data = stage_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(stage, field, value)
-    
+    stage = await tracked_update(db, Stage, stage_id, update_data, current_entity.id, parse_if_match(if_match))
     await db.commit()
-    await db.refresh(stage)
+    await project_cache.invalidate(stage.project_id)
+    await publish_stage(stage)
+    
+    response.headers["ETag"] = etag(stage.version)
     return stage
 
 
 @app.delete("/stages/{stage_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_stage(
     stage_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_stage_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Delete a stage"""
-    result = await db.execute(select(Stage).filter(Stage.id == stage_id))
-    stage = result.scalar_one_or_none()
+    """Delete a stage; its tasks are kept without a stage"""
+    result = await db.execute(
+        update(Task).where(Task.stage_id == stage_id)
+        .values(stage_id=None, version=Task.version + 1, updated_at=datetime.utcnow())
+        .returning(Task.id, Task.project_id)
+    )
+    unstaged = result.all()
+    await db.execute(update(ArchivedTask).where(ArchivedTask.stage_id == stage_id).values(stage_id=None))
+    result = await db.execute(delete(Stage).where(Stage.id == stage_id).returning(Stage.project_id))
+    project_id = result.scalar_one_or_none()
     
-    if not stage:
+    if project_id is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Stage not found")
     
-    await db.delete(stage)
+    await record_all(db, current_entity.id, [
+        (ActivityAction.DELETED, (ActivityObject.STAGE, stage_id, project_id), ()),
+        *((ActivityAction.UPDATED, (ActivityObject.TASK, task_id, task_project_id), [("stage_id", stage_id, None)])
+          for task_id, task_project_id in unstaged),
+    ])
     await db.commit()
+    await project_cache.invalidate(project_id)
+    await publish_stage_deleted(project_id, stage_id)
 
 
 # ============================================================================
 # TASK MANAGEMENT ENDPOINTS
 # ============================================================================
 
+async def load_assignees(db: AsyncSession, task: Task) -> List[Entity]:
+    """Load a task's assignees in one query and attach them without marking the task dirty"""
+    result = await db.execute(
+        select(Entity).join(task_assignments, task_assignments.c.entity_id == Entity.id)
+        .where(task_assignments.c.task_id == task.id)
+    )
+    assignees = list(result.scalars().all())
+    set_committed_value(task, "assignees", assignees)
+    return assignees
+
+
+async def current_stage(db: AsyncSession, task_id: int, new_stage_id: Optional[int]) -> Optional[int]:
+    """The task's stage before a move to ``new_stage_id``, which must be in the task's project (404 if not)"""
+    query = select(Task.stage_id).where(Task.id == task_id)
+    if new_stage_id is not None:
+        query = query.add_columns(
+            exists().where(Stage.id == new_stage_id, Stage.project_id == Task.project_id)
+        )
+    row = (await db.execute(query)).first()
+    if row is None:
+        return None  # The update reports the missing task
+    if new_stage_id is not None and not row[1]:
+        raise HTTPException(status_code=404, detail="Stage not found in the task's project")
+    return row[0]
+
+
 @app.post("/tasks", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
 async def create_task(
     task: TaskCreate,
-    db: AsyncSession = Depends(get_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """Create a new task or subtask"""
-    # Verify project exists
-    result = await db.execute(select(Project).filter(Project.id == task.project_id))
-    if not result.scalar_one_or_none():
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    db_task = Task(**task.model_dump())
-    db.add(db_task)
-    await db.commit()
-    await db.refresh(db_task, ["assignees"])
+    async with project_session(task.project_id) as db:
+        # Verify the project exists, and the stage is one of its own
+        if task.stage_id is None:
+            query = select(exists().where(Project.id == task.project_id))
+        else:
+            query = select(exists().where(Stage.id == task.stage_id, Stage.project_id == task.project_id))
+        if not (await db.execute(query)).scalar():
+            raise HTTPException(status_code=404, detail="Project or stage not found")
+        
+        # A new task has no assignees; setting that up front avoids reloading the collection
+        db_task = Task(id=await next_id(db, Task), **task.model_dump(), assignees=[])
+        db.add(db_task)
+        await db.flush()
+        await record(db, current_entity.id, ActivityAction.CREATED, target(db_task))
+        await db.commit()
+    await project_cache.invalidate(db_task.project_id)
+    await publish_task(db_task, "task_created")
     return db_task
 
 
@@ -444,10 +722,10 @@ async def list_tasks(
     stage_id: Optional[int] = None,
     status: Optional[TaskStatus] = None,
     assigned_to_me: bool = False,
-    db: AsyncSession = Depends(get_db),
+    include_archived: bool = False,
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """List tasks with optional filters"""
+    """List tasks with optional filters (include_archived adds archived completed tasks)"""
     query = select(Task).options(selectinload(Task.assignees))
     
     if project_id:
@@ -457,19 +735,84 @@ async def list_tasks(
     if status:
         query = query.filter(Task.status == status)
     
-    result = await db.execute(query.order_by(Task.priority.desc(), Task.created_at.desc()))
-    tasks = result.scalars().all()
+    async def shard_tasks(db: AsyncSession):
+        result = await db.execute(query.order_by(Task.priority.desc(), Task.created_at.desc()))
+        tasks = result.scalars().all()
+        
+        if include_archived and status in (None, TaskStatus.COMPLETED):
+            archived = select(ArchivedTask).options(selectinload(ArchivedTask.assignees))
+            if project_id:
+                archived = archived.filter(ArchivedTask.project_id == project_id)
+            if stage_id:
+                archived = archived.filter(ArchivedTask.stage_id == stage_id)
+            result = await db.execute(archived)
+            tasks = [*tasks, *result.scalars().all()]
+        return tasks
+    
+    # A project or stage filter needs only the shard it lives in
+    if project_id:
+        shards = [project_shard(project_id)]
+    elif stage_id:
+        shards = [await stage_shard(stage_id)]
+    else:
+        shards = None
+    tasks = sorted(
+        itertools.chain(*await fan_out(shard_tasks, shards)),
+        key=lambda task: (task.priority, task.created_at), reverse=True
+    )
     
     if assigned_to_me:
-        tasks = [task for task in tasks if current_entity in task.assignees]
+        tasks = [task for task in tasks if any(entity.id == current_entity.id for entity in task.assignees)]
     
     return tasks
 
 
+@app.post("/tasks/archive", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def archive_tasks(
+    older_than_days: int = Query(ARCHIVE_AFTER_DAYS, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Queue archival of tasks completed more than older_than_days ago"""
+    job = job_queue.enqueue(db, "archive_tasks", {"older_than_days": older_than_days}, created_by=current_entity.id)
+    await db.commit()
+    job_queue.wake()
+    return job
+
+
+@app.get("/tasks/available", response_model=List[TaskResponse])
+async def get_available_tasks(
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Get tasks available for the current entity based on skills"""
+    query = select(Task).options(selectinload(Task.assignees)).filter(
+        Task.status.in_([TaskStatus.PENDING, TaskStatus.IN_PROGRESS])
+    )
+    
+    async def shard_tasks(db: AsyncSession):
+        result = await db.execute(query)
+        return result.scalars().all()
+    
+    all_tasks = itertools.chain(*await fan_out(shard_tasks))
+    
+    # Filter tasks where entity has matching skills
+    available_tasks = []
+    entity_skills = parse_skills(current_entity.skills)
+    
+    for task in all_tasks:
+        task_skills = parse_skills(task.required_skills)
+        if not task_skills or entity_skills & task_skills:  # Open to everyone, or any skill match
+            available_tasks.append(task)
+    
+    return available_tasks
+
+
 @app.get("/tasks/{task_id}", response_model=TaskDetailResponse)
 async def get_task(
     task_id: int,
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    include_archived: bool = False,
+    db: AsyncSession = Depends(get_task_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """Get detailed task information including subtasks and comments"""
@@ -478,15 +821,28 @@ async def get_task(
         .filter(Task.id == task_id)
         .options(
             selectinload(Task.assignees),
-            selectinload(Task.subtasks),
+            selectinload(Task.subtasks).selectinload(Task.assignees),
             selectinload(Task.comments)
         )
     )
     task = result.scalar_one_or_none()
     
+    if not task and include_archived:
+        result = await db.execute(
+            select(ArchivedTask)
+            .filter(ArchivedTask.id == task_id)
+            .options(
+                selectinload(ArchivedTask.assignees),
+                selectinload(ArchivedTask.subtasks).selectinload(ArchivedTask.assignees),
+                selectinload(ArchivedTask.comments)
+            )
+        )
+        task = result.scalar_one_or_none()
+    
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    response.headers["ETag"] = etag(task.version)
     return task
 
 
@@ -494,162 +850,271 @@ async def get_task(
 async def update_task(
     task_id: int,
     task_update: TaskUpdate,
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_task_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Update task details"""
-    result = await db.execute(
-        select(Task).filter(Task.id == task_id).options(selectinload(Task.assignees))
-    )
-    task = result.scalar_one_or_none()
-    
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
+    """Update task details (If-Match: "<version>" makes it conditional)"""
+    now = datetime.utcnow()
     update_data = task_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(task, field, value)
-    
-    # Mark as completed if status changed to completed
-    if task_update.status == TaskStatus.COMPLETED and task.completed_at is None:
-        task.completed_at = datetime.utcnow()
-    
-    task.updated_at = datetime.utcnow()
+    update_data["updated_at"] = now
+    
+    if "status" in update_data:
+        # Mark as completed if status changed to completed
+        if update_data["status"] == TaskStatus.COMPLETED:
+            update_data["completed_at"] = func.coalesce(Task.completed_at, now)
+        # Leases only apply while a task is pending or in progress
+        if update_data["status"] not in LEASED_STATUSES:
+            update_data["lease_expires_at"] = None
+    
+    previous_stage_id = None
+    if "stage_id" in update_data:
+        previous_stage_id = await current_stage(db, task_id, update_data["stage_id"])
+    
+    task = await tracked_update(db, Task, task_id, update_data, current_entity.id, parse_if_match(if_match))
+    await load_assignees(db, task)
     await db.commit()
-    await db.refresh(task)
+    await project_cache.invalidate(task.project_id)
+    await publish_task(task, previous_stage_id=previous_stage_id)
+    
+    response.headers["ETag"] = etag(task.version)
     return task
 
 
 @app.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_task(
     task_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_task_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Delete a task"""
-    result = await db.execute(select(Task).filter(Task.id == task_id))
-    task = result.scalar_one_or_none()
-    
-    if not task:
+    """Delete a task with its comments and assignments; subtasks are kept as top-level tasks"""
+    result = await db.execute(
+        update(Task).where(Task.parent_task_id == task_id)
+        .values(parent_task_id=None, version=Task.version + 1, updated_at=datetime.utcnow())
+        .returning(Task.id, Task.project_id)
+    )
+    subtasks = result.all()
+    comment_buffer.forget_task(task_id)
+    await db.execute(delete(Comment).where(Comment.task_id == task_id))
+    await db.execute(delete(task_assignments).where(task_assignments.c.task_id == task_id))
+    result = await db.execute(delete(Task).where(Task.id == task_id).returning(Task.project_id, Task.stage_id))
+    deleted = result.one_or_none()
+    
+    if deleted is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Task not found")
     
-    await db.delete(task)
+    await record_all(db, current_entity.id, [
+        (ActivityAction.DELETED, (ActivityObject.TASK, task_id, deleted.project_id), ()),
+        *((ActivityAction.UPDATED, (ActivityObject.TASK, subtask_id, project_id), [("parent_task_id", task_id, None)])
+          for subtask_id, project_id in subtasks),
+    ])
     await db.commit()
+    await project_cache.invalidate(deleted.project_id, *(project_id for _, project_id in subtasks))
+    await publish_task_deleted(deleted.project_id, task_id, deleted.stage_id)
 
 
 # ============================================================================
 # TASK ASSIGNMENT ENDPOINTS
 # ============================================================================
 
+async def add_assignee(db: AsyncSession, task_id: int, entity_id: int) -> bool:
+    """Insert an assignment if both the task and the entity exist; a no-op if it is already there"""
+    result = await db.execute(
+        dialect_insert(db, task_assignments)
+        .from_select(
+            ["task_id", "entity_id"],
+            select(Task.id, Entity.id).join(Entity, Entity.id == entity_id).where(Task.id == task_id)
+        )
+        .on_conflict_do_nothing()
+    )
+    return result.rowcount > 0
+
+
 @app.post("/tasks/{task_id}/assign", response_model=TaskResponse)
 async def assign_task(
     task_id: int,
     entity_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_task_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """Assign a task to an entity (human or agent)"""
-    result = await db.execute(
-        select(Task).filter(Task.id == task_id).options(selectinload(Task.assignees))
-    )
-    task = result.scalar_one_or_none()
-    
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    entity_result = await db.execute(select(Entity).filter(Entity.id == entity_id))
-    entity = entity_result.scalar_one_or_none()
+    added = await add_assignee(db, task_id, entity_id)
+    # Assignees are part of the task, so a change bumps its version (and shows up in board deltas)
+    task = await versioned_update(db, Task, task_id, {"updated_at": datetime.utcnow()})
     
-    if not entity:
+    assignees = await load_assignees(db, task)
+    if entity_id not in {entity.id for entity in assignees}:
         raise HTTPException(status_code=404, detail="Entity not found")
     
-    if entity not in task.assignees:
-        task.assignees.append(entity)
-        await db.commit()
-        await db.refresh(task)
-    
+    if added:
+        await record(db, current_entity.id, ActivityAction.ASSIGNED, target(task), [("assignee", None, entity_id)])
+    await db.commit()
+    await project_cache.invalidate(task.project_id)
+    await publish_task(task)
     return task
 
 
 @app.post("/tasks/{task_id}/self-assign", response_model=TaskResponse)
 async def self_assign_task(
     task_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_task_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Self-assign a task"""
-    result = await db.execute(
-        select(Task).filter(Task.id == task_id).options(selectinload(Task.assignees))
-    )
-    task = result.scalar_one_or_none()
-    
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    if current_entity not in task.assignees:
-        task.assignees.append(current_entity)
-        await db.commit()
-        await db.refresh(task)
-    
+    """Self-assign a task (agents take a lease they must keep alive with heartbeats)"""
+    values = {"updated_at": datetime.utcnow()}
+    if current_entity.entity_type == EntityType.AGENT:
+        values["lease_expires_at"] = lease_expiry()
+    task = await versioned_update(db, Task, task_id, values)
+    
+    if await add_assignee(db, task_id, current_entity.id):
+        await record(
+            db, current_entity.id, ActivityAction.ASSIGNED, target(task), [("assignee", None, current_entity.id)]
+        )
+    await load_assignees(db, task)
+    await db.commit()
+    await project_cache.invalidate(task.project_id)
+    await publish_task(task)
     return task
 
 
+@app.post("/tasks/{task_id}/transition", response_model=TaskTransitionResponse)
+async def transition_task(
+    task_id: int,
+    transition: TaskTransition,
+    db: AsyncSession = Depends(get_task_db),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """
+    Apply a status/stage change, an optional comment and assignment changes in one transaction.
+    The task row is updated with a single conditional UPDATE; if expected_version is given and
+    the task has moved on, nothing is applied and 409 is returned.
+    """
+    now = datetime.utcnow()
+    unassign = set(transition.unassign)
+    if transition.release:
+        unassign.add(current_entity.id)
+    assign = set(transition.assign) - unassign
+
+    values = {"updated_at": now}
+    previous_stage_id = None
+    if transition.stage_id is not None:
+        values["stage_id"] = transition.stage_id
+        previous_stage_id = await current_stage(db, task_id, transition.stage_id)
+    if current_entity.id in assign and current_entity.entity_type == EntityType.AGENT:
+        values["lease_expires_at"] = lease_expiry(now)
+    if transition.status is not None:
+        values["status"] = transition.status
+        if transition.status == TaskStatus.COMPLETED:
+            values["completed_at"] = func.coalesce(Task.completed_at, now)
+        if transition.status not in LEASED_STATUSES:
+            values["lease_expires_at"] = None
+
+    task = await tracked_update(
+        db, Task, task_id, values, current_entity.id, transition.expected_version,
+        conflict_status=status.HTTP_409_CONFLICT
+    )
+
+    events = []
+    unassigned = []
+    if assign:
+        result = await db.execute(
+            dialect_insert(db, task_assignments)
+            .from_select(["task_id", "entity_id"], select(literal(task_id), Entity.id).where(Entity.id.in_(assign)))
+            .on_conflict_do_nothing()
+            .returning(task_assignments.c.entity_id)
+        )
+        events += [
+            (ActivityAction.ASSIGNED, target(task), [("assignee", None, entity_id)]) for entity_id in result.scalars()
+        ]
+    if unassign:
+        result = await db.execute(
+            delete(task_assignments).where(
+                task_assignments.c.task_id == task_id,
+                task_assignments.c.entity_id.in_(unassign)
+            )
+            .returning(task_assignments.c.entity_id)
+        )
+        unassigned = result.scalars().all()
+        events += [(ActivityAction.UNASSIGNED, target(task), [("assignee", entity_id, None)]) for entity_id in unassigned]
+    await record_all(db, current_entity.id, events)
+
+    db_comment = None
+    if transition.comment:
+        db_comment = Comment(
+            id=await next_id(db, Comment), content=transition.comment, task_id=task_id, author_id=current_entity.id
+        )
+        db.add(db_comment)
+
+    assignees = await load_assignees(db, task)
+    if not assign <= {entity.id for entity in assignees}:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Entity not found")
+
+    await db.commit()
+    await project_cache.invalidate(task.project_id)
+    await publish_task(task, previous_stage_id=previous_stage_id, previous_assignee_ids=unassigned)
+    return {"task": task, "comment": db_comment}
+
+
+@app.post("/agents/heartbeat", status_code=status.HTTP_204_NO_CONTENT)
+async def agent_heartbeat(agent_id: int = Depends(get_current_agent_id)):
+    """Extend the leases on all tasks the calling agent has claimed"""
+    lease_manager.heartbeat(agent_id)
+
+
 @app.delete("/tasks/{task_id}/unassign/{entity_id}", response_model=TaskResponse)
 async def unassign_task(
     task_id: int,
     entity_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_task_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """Unassign an entity from a task"""
-    result = await db.execute(
-        select(Task).filter(Task.id == task_id).options(selectinload(Task.assignees))
+    removed = await db.execute(
+        delete(task_assignments).where(
+            task_assignments.c.task_id == task_id,
+            task_assignments.c.entity_id == entity_id
+        )
     )
-    task = result.scalar_one_or_none()
+    task = await versioned_update(db, Task, task_id, {"updated_at": datetime.utcnow()})
     
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    entity_result = await db.execute(select(Entity).filter(Entity.id == entity_id))
-    entity = entity_result.scalar_one_or_none()
-    
-    if not entity:
-        raise HTTPException(status_code=404, detail="Entity not found")
-    
-    if entity in task.assignees:
-        task.assignees.remove(entity)
-        await db.commit()
-        await db.refresh(task)
+    if removed.rowcount == 0:
+        # Nothing was assigned; only now is it worth checking the entity exists
+        result = await db.execute(select(exists().where(Entity.id == entity_id)))
+        if not result.scalar():
+            raise HTTPException(status_code=404, detail="Entity not found")
+    else:
+        await record(db, current_entity.id, ActivityAction.UNASSIGNED, target(task), [("assignee", entity_id, None)])
     
+    await load_assignees(db, task)
+    await db.commit()
+    await project_cache.invalidate(task.project_id)
+    await publish_task(task, previous_assignee_ids=[entity_id] if removed.rowcount else ())
     return task
 
 
-@app.get("/tasks/available", response_model=List[TaskResponse])
-async def get_available_tasks(
-    db: AsyncSession = Depends(get_db),
+@app.post("/projects/{project_id}/schedule", response_model=ScheduleResponse)
+async def schedule_project_tasks(
+    project_id: int,
+    db: AsyncSession = Depends(get_project_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Get tasks available for the current entity based on skills"""
-    query = select(Task).options(selectinload(Task.assignees)).filter(
-        Task.status.in_([TaskStatus.PENDING, TaskStatus.IN_PROGRESS])
+    """Assign the project's pending tasks to agents by skill, capacity and current load"""
+    result = await db.execute(select(Project.id).filter(Project.id == project_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # Agents' load counts their tasks in every shard
+    assignments, unassigned = await scheduler.schedule(
+        db, project_id, add_loads(await fan_out(agent_loads)), actor_id=current_entity.id
     )
-    
-    result = await db.execute(query)
-    all_tasks = result.scalars().all()
-    
-    # Filter tasks where entity has matching skills
-    available_tasks = []
-    entity_skills = set(current_entity.skills.split(',')) if current_entity.skills else set()
-    
-    for task in all_tasks:
-        if not task.required_skills:
-            available_tasks.append(task)
-        else:
-            task_skills = set(task.required_skills.split(','))
-            if entity_skills & task_skills:  # If there's any skill match
-                available_tasks.append(task)
-    
-    return available_tasks
+    return {
+        "project_id": project_id,
+        "assignments": [{"task_id": task_id, "entity_id": entity_id} for task_id, entity_id in assignments],
+        "unassigned": unassigned
+    }
 
 
 # ============================================================================
@@ -659,29 +1124,47 @@ async def get_available_tasks(
 @app.post("/comments", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
 async def create_comment(
     comment: CommentCreate,
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    sync: bool = Query(False, description="Write before answering even when comments are buffered"),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
-    """Add a comment to a task"""
-    result = await db.execute(select(Task).filter(Task.id == comment.task_id))
-    if not result.scalar_one_or_none():
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    db_comment = Comment(
-        content=comment.content,
-        task_id=comment.task_id,
-        author_id=current_entity.id
-    )
-    db.add(db_comment)
-    await db.commit()
-    await db.refresh(db_comment)
+    """Add a comment to a task; answers 202 with a provisional id when the comment is buffered"""
+    shard = await task_shard(comment.task_id)
+    if not sync and comment_buffer.accepts(comment.task_id):
+        response.status_code = status.HTTP_202_ACCEPTED
+        return comment_buffer.add(shard, comment.task_id, current_entity.id, comment.content)
+
+    async with shard_session_makers[shard]() as db:
+        columns = {
+            "content": literal(comment.content),
+            "task_id": Task.id,
+            "author_id": literal(current_entity.id),
+            "created_at": literal(datetime.utcnow()),
+        }
+        comment_id = await next_id(db, Comment)
+        if comment_id is not None:
+            columns["id"] = literal(comment_id)
+        # INSERT ... SELECT only inserts if the task exists, so no separate existence check
+        result = await db.execute(
+            insert(Comment)
+            .from_select(list(columns), select(*columns.values()).where(Task.id == comment.task_id))
+            .returning(Comment)
+        )
+        db_comment = result.scalar_one_or_none()
+        
+        if not db_comment:
+            raise HTTPException(status_code=404, detail="Task not found")
+        
+        await db.commit()
+    comment_buffer.task_exists(comment.task_id)
     return db_comment
 
 
 @app.get("/tasks/{task_id}/comments", response_model=List[CommentResponse])
 async def get_task_comments(
     task_id: int,
-    db: AsyncSession = Depends(get_db),
+    include_archived: bool = False,
+    db: AsyncSession = Depends(get_task_db),
     current_entity: Entity = Depends(get_current_active_entity)
 ):
     """Get all comments for a task"""
@@ -691,43 +1174,250 @@ async def get_task_comments(
         .order_by(Comment.created_at.asc())
     )
     comments = result.scalars().all()
-    return comments
+    
+    # A task's comments are archived with it, so only look there when it has none live
+    if not comments and include_archived:
+        result = await db.execute(
+            select(ArchivedComment)
+            .filter(ArchivedComment.task_id == task_id)
+            .order_by(ArchivedComment.created_at.asc())
+        )
+        comments = result.scalars().all()
+    return [*comments, *comment_buffer.pending_for(task_id)]
+
+
+# ============================================================================
+# ACTIVITY ENDPOINTS
+# ============================================================================
+# Newest first. Page back in time by passing the oldest ``at`` seen as ``until``.
+
+async def all_activity(limit: int, **filters) -> List[dict]:
+    """Activity from every shard, merged newest first"""
+    rows = itertools.chain(*await fan_out(lambda db: history(db, limit=limit, **filters)))
+    return sorted(rows, key=lambda row: row["at"], reverse=True)[:limit]
+
+
+@app.get("/tasks/{task_id}/activity", response_model=List[ActivityResponse])
+async def get_task_activity(
+    task_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_task_db),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Changes to a task and its assignees"""
+    return await history(db, ActivityObject.TASK, task_id, since=since, until=until, limit=limit)
+
+
+@app.get("/projects/{project_id}/activity", response_model=List[ActivityResponse])
+async def get_project_activity(
+    project_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_project_db),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Changes to a project, its stages and its tasks"""
+    return await history(db, project_id=project_id, since=since, until=until, limit=limit)
+
+
+@app.get("/entities/{entity_id}/activity", response_model=List[ActivityResponse])
+async def get_entity_activity(
+    entity_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Changes made by an entity, across all projects"""
+    return await all_activity(limit, actor_id=entity_id, since=since, until=until)
+
+
+@app.get("/activity", response_model=List[ActivityResponse])
+async def list_activity(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """All changes in a time range"""
+    return await all_activity(limit, since=since, until=until)
+
+
+# ============================================================================
+# SEARCH ENDPOINTS
+# ============================================================================
+
+@app.get("/search", response_model=List[SearchHit])
+async def search(
+    q: str = Query(..., min_length=1),
+    project_id: Optional[int] = None,
+    scope: SearchScope = SearchScope.ALL,
+    limit: int = Query(20, ge=1, le=100),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Full-text search over task titles, descriptions and comments, best matches first"""
+    if not search_index.fts_available:
+        raise HTTPException(status_code=503, detail="Search index is not available")
+
+    async def shard_search(db: AsyncSession):
+        return await search_index.search(
+            db, q,
+            project_id=project_id,
+            include_tasks=scope != SearchScope.COMMENTS,
+            include_comments=scope != SearchScope.TASKS,
+            limit=limit
+        )
+
+    # Scores come from each shard's own index statistics, so across shards the order is approximate
+    hits = itertools.chain(*await fan_out(shard_search, [project_shard(project_id)] if project_id else None))
+    return sorted(hits, key=lambda hit: hit["score"], reverse=True)[:limit]
+
+
+@app.post("/search/reindex", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def reindex_search(
+    db: AsyncSession = Depends(get_db),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Queue a rebuild of the full-text index from the task and comment tables"""
+    job = job_queue.enqueue(db, "reindex_search", created_by=current_entity.id)
+    await db.commit()
+    job_queue.wake()
+    return job
+
+
+# ============================================================================
+# JOB ENDPOINTS
+# ============================================================================
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_entity: Entity = Depends(get_current_active_entity)
+):
+    """Get the status and result of a background job"""
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 # ============================================================================
 # WEBSOCKET ENDPOINTS
 # ============================================================================
 
+async def send_board_state(websocket: WebSocket, project_id: int, since: Optional[datetime] = None,
+                           known: Optional[List[int]] = None):
+    """Send a board snapshot, or a delta since the client's last server_time"""
+    async with project_session(project_id) as db:
+        message = await board_state(db, project_id, since, known)
+    await manager.send_personal_message(message, websocket)
+
+
+async def accept_websocket(websocket: WebSocket, project_id: Optional[int] = None) -> bool:
+    """Accept and authenticate a socket, then register it; closes it with 1008 if it isn't allowed in"""
+    wire_format = websocket_format(websocket)
+    await websocket.accept(subprotocol=MSGPACK_SUBPROTOCOL if wire_format == "msgpack" else None)
+    allowed, entity = await authenticate_websocket(websocket, project_id)
+    if not allowed:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Could not validate credentials")
+        return False
+    # Anonymous board sockets count against their address instead of an entity
+    owner = None if entity else f"addr:{websocket.client.host if websocket.client else 'unknown'}"
+    try:
+        await manager.connect(websocket, project_id, entity.id if entity else None, owner, wire_format)
+    except ConnectionLimitExceeded as e:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=str(e))
+        return False
+    return True
+
+
+def read_command(websocket: WebSocket, data):
+    """Parse a client frame, JSON or MessagePack (None if it is neither), and note it for the heartbeat"""
+    command = decode_frame(data)
+    manager.touch(websocket, active=not (isinstance(command, dict) and command.get("type") == "pong"))
+    return command
+
+
+async def handle_socket_command(websocket: WebSocket, command) -> bool:
+    """Apply a message every socket understands; False if it isn't one"""
+    if not isinstance(command, dict):
+        return False
+    if command.get("type") == "subscribe":
+        try:
+            filters = WebSocketSubscription.model_validate(command)
+            subscription = manager.subscribe(websocket, **filters.model_dump())
+        except ValueError as e:  # Includes pydantic's ValidationError
+            await manager.send_personal_message({"type": "error", "detail": str(e)}, websocket)
+        else:
+            await manager.send_personal_message({"type": "subscribed", "filters": subscription.describe()}, websocket)
+        return True
+    if command.get("type") in ("auth", "pong"):
+        # Already authenticated at connect time; pongs only count as a sign of life
+        return True
+    return False
+
+
 @app.websocket("/ws/projects/{project_id}")
-async def websocket_project_updates(websocket: WebSocket, project_id: int):
-    """WebSocket endpoint for real-time project updates"""
-    await manager.connect(websocket, project_id)
+async def websocket_project_updates(
+    websocket: WebSocket, project_id: int, since: Optional[datetime] = None, initial: bool = True
+):
+    """
+    WebSocket endpoint for real-time project updates.
+    Authenticates first (see authenticate_websocket). Sends a board snapshot on connect (a delta
+    when reconnecting with ?since=; nothing with ?initial=false), then change events. A
+    {"type": "resync", "since": ..., "known": [task ids]} message asks for another delta, and a
+    {"type": "subscribe", ...} message narrows which events are sent. Quiet sockets get
+    {"type": "ping"} and must answer (any frame will do) or be dropped.
+    """
+    # Registered before the state is read, so no change can fall between the two
+    if not await accept_websocket(websocket, project_id):
+        return
     try:
         # Send initial connection message
         await manager.send_personal_message(
             {"type": "connection", "message": f"Connected to project {project_id}"},
             websocket
         )
+        if initial:
+            await send_board_state(websocket, project_id, since)
         
         # Keep connection alive and listen for messages
         while True:
-            data = await websocket.receive_text()
-            # Echo back or handle specific commands if needed
+            data = await receive_frame(websocket)
+            command = read_command(websocket, data)
+            if isinstance(command, dict) and command.get("type") == "resync":
+                try:
+                    since = datetime.fromisoformat(command["since"])
+                except (KeyError, TypeError, ValueError):
+                    since = None  # Full snapshot instead
+                known = command.get("known")
+                if not (isinstance(known, list) and all(type(task_id) is int for task_id in known)):
+                    known = None
+                await send_board_state(websocket, project_id, since, known)
+                continue
+            if await handle_socket_command(websocket, command):
+                continue
+            # Echo back anything else
             await manager.send_personal_message(
-                {"type": "echo", "message": data},
+                {"type": "echo", "message": data if isinstance(data, str) else command},
                 websocket
             )
     except WebSocketDisconnect:
-        manager.disconnect(websocket, project_id)
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-        manager.disconnect(websocket, project_id)
+        manager.disconnect(websocket)
+    except Exception:
+        logger.exception("WebSocket error on project %s", project_id)
+        manager.disconnect(websocket)
 
 
 @app.websocket("/ws")
 async def websocket_global_updates(websocket: WebSocket):
-    """WebSocket endpoint for global updates"""
-    await manager.connect(websocket)
+    """WebSocket endpoint for events from every project; authenticated and filtered like the project socket"""
+    if not await accept_websocket(websocket):
+        return
     try:
         # Send initial connection message
         await manager.send_personal_message(
@@ -737,15 +1427,18 @@ async def websocket_global_updates(websocket: WebSocket):
         
         # Keep connection alive
         while True:
-            data = await websocket.receive_text()
+            data = await receive_frame(websocket)
+            command = read_command(websocket, data)
+            if await handle_socket_command(websocket, command):
+                continue
             await manager.send_personal_message(
-                {"type": "echo", "message": data},
+                {"type": "echo", "message": data if isinstance(data, str) else command},
                 websocket
             )
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-    except Exception as e:
-        print(f"WebSocket error: {e}")
+    except Exception:
+        logger.exception("WebSocket error on the global feed")
         manager.disconnect(websocket)
 
 
@@ -759,6 +1452,26 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/sql-profiles", include_in_schema=False)
+async def sql_profiles(limit: int = Query(20, ge=1, le=100), n_plus_one_only: bool = False):
+    """Recent per-request SQL profiles, newest first (requires SQL_PROFILING=true)"""
+    if not SQL_PROFILING:
+        raise HTTPException(status_code=404, detail="SQL profiling is disabled")
+    profiles = [profile for profile in reversed(recent_profiles) if profile["n_plus_one"] or not n_plus_one_only]
+    return profiles[:limit]
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        app, host="0.0.0.0", port=8000, ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+        ws_ping_interval=WS_PING_INTERVAL_SECONDS, ws_ping_timeout=WS_PONG_TIMEOUT_SECONDS
+    )
@@ -0,0 +1,290 @@
+"""
+Prometheus-style metrics.
+
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format at ``GET /metrics``. Recording a
+sample is a dict lookup plus an addition (a bisect for histograms), so the
+request middleware and the SQLAlchemy engine hooks stay cheap on the hot
+path. Values that are already tracked elsewhere, such as WebSocket
+connections, are read through callbacks at scrape time instead of being
+updated on every change.
+
+Per-request DB query count and time are accumulated in a context variable
+set by the middleware; engine events run in the request's context, so
+statements issued by background workers are counted globally but not
+attributed to a route.
+"""
+import contextvars
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Seconds; tuned for an API whose typical requests take single-digit milliseconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def collect(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down. Either set directly or computed at scrape
+    time by ``callback``, which returns (label values, value) pairs.
+    """
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def inc(self, amount: float = 1, *labels: str):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels: str):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def collect(self) -> List[str]:
+        samples = self.callback() if self.callback else self._values.items()
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in samples]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution per label set, with Prometheus cumulative buckets on output"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._values.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def collect(self) -> List[str]:
+        lines = []
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template, method and status", ("route", "method", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("route", "method")
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+db_queries = registry.counter("db_queries_total", "SQL statements executed")
+db_query_duration = registry.histogram("db_query_duration_seconds", "SQL statement execution time")
+db_request_queries = registry.histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", ("route",), buckets=QUERY_COUNT_BUCKETS
+)
+db_request_time = registry.histogram(
+    "db_time_per_request_seconds", "Time spent in SQL statements per HTTP request", ("route",)
+)
+db_connections_checked_out = registry.gauge(
+    "db_pool_connections_checked_out", "Database connections currently checked out of the pool"
+)
+db_connection_checkouts = registry.counter("db_pool_checkouts_total", "Database connection checkouts")
+
+auth_cache_lookups = registry.counter("auth_cache_lookups_total", "API key cache lookups by result", ("result",))
+
+
+class RequestStats:
+    """DB work attributed to one HTTP request"""
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+current_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request_stats", default=None
+)
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Count statements, statement time and pool checkouts for an engine"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        db_queries.inc()
+        db_query_duration.observe(elapsed)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+    pool = sync_engine.pool
+    if hasattr(pool, "size"):
+        registry.gauge(
+            "db_pool_size", "Configured database pool size", callback=lambda: [((), pool.size())]
+        )
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        db_connection_checkouts.inc()
+        db_connections_checked_out.inc()
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        db_connections_checked_out.dec()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and DB usage per route template.
+    Written as plain ASGI rather than BaseHTTPMiddleware to avoid its per-request task overhead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            current_request_stats.reset(token)
+
+            # FastAPI stores the matched API route in the scope; static files and 404s share one label
+            route_label = getattr(scope.get("route"), "path", "other")
+            method = scope["method"]
+            http_requests.inc(1, route_label, method, str(status_code))
+            http_request_duration.observe(elapsed, route_label, method)
+            db_request_queries.observe(stats.queries, route_label)
+            db_request_time.observe(stats.db_time, route_label)
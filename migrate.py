@@ -0,0 +1,214 @@
+"""
+Schema migrations.
+
+The schema is managed by Alembic revisions in ``migrations/versions``.
+``alembic upgrade head`` applies them from the command line. On startup,
+init_db() compares the database's revision with the newest one: when they
+match it runs no DDL at all, otherwise it upgrades (MIGRATE_ON_STARTUP) or
+refuses to start. Deployments that can't afford a long startup run
+``alembic upgrade head`` first, while the previous version keeps serving.
+
+Revisions that touch big tables use the online helpers here instead of
+plain ``op`` calls:
+
+- ``create_index_online``: CREATE INDEX CONCURRENTLY on PostgreSQL, which
+  doesn't block writers. An invalid index left by an interrupted build is
+  dropped and rebuilt.
+- ``delete_duplicates``: keeps one row of each group sharing the given
+  columns, so a unique constraint can be added on them.
+- ``backfill``: an UPDATE run in primary-key batches of
+  MIGRATION_BATCH_SIZE rows, each committed on its own, with
+  MIGRATION_BATCH_PAUSE_SECONDS between batches so other writers get the
+  database. Progress is kept in ``migration_progress``, so a rerun after an
+  interruption continues where it stopped. The UPDATE must be idempotent
+  (the last batch before a crash may run twice).
+
+A revision using either helper is applied outside a single transaction; if
+it's interrupted, its version isn't recorded and the next upgrade reruns it.
+
+Alembic itself is only imported when there is something to migrate; the
+startup check reads the revision files and ``alembic_version`` directly.
+"""
+import ast
+import glob
+import logging
+import os
+import re
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import ColumnElement
+
+if TYPE_CHECKING:
+    from alembic.config import Config
+
+logger = logging.getLogger(__name__)
+
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+MIGRATION_BATCH_PAUSE_SECONDS = float(os.getenv("MIGRATION_BATCH_PAUSE_SECONDS", "0.05"))
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+VERSIONS_DIR = os.path.join(os.path.dirname(ALEMBIC_INI), "migrations", "versions")
+
+_REVISION_LINE = re.compile(r"^(revision|down_revision)\b[^=]*=\s*(.+)$", re.MULTILINE)
+
+migration_progress = Table(
+    "migration_progress",
+    MetaData(),
+    Column("name", String(255), primary_key=True),
+    Column("last_key", Integer, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def alembic_config(connection: Optional[Connection] = None) -> "Config":
+    """Alembic config for this project; migrations run on ``connection`` when given"""
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+@lru_cache(maxsize=1)
+def head_revision() -> Optional[str]:
+    """The newest revision, read from the revision files' ``revision``/``down_revision`` lines"""
+    revisions, parents = set(), set()
+    for path in glob.glob(os.path.join(VERSIONS_DIR, "*.py")):
+        with open(path) as handle:
+            for name, value in _REVISION_LINE.findall(handle.read()):
+                value = ast.literal_eval(value.strip())
+                if name == "revision":
+                    revisions.add(value)
+                elif isinstance(value, (tuple, list)):
+                    parents.update(value)
+                elif value:
+                    parents.add(value)
+    heads = revisions - parents
+    if len(heads) == 1:
+        return heads.pop()
+    # Branches or an unusual file layout; let Alembic work it out (it raises on several heads)
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def current_revision(conn: Connection) -> Optional[str]:
+    """The revision the database is at; None for an empty (or pre-migrations) database"""
+    if not inspect(conn).has_table("alembic_version"):
+        return None
+    return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+
+
+def upgrade(conn: Connection, revision: str = "head"):
+    from alembic import command
+
+    command.upgrade(alembic_config(conn), revision)
+
+
+def create_index_online(name: str, table: str, columns: Sequence[str], unique: bool = False, **kw):
+    """Create an index without blocking writes to ``table`` (PostgreSQL); safe to rerun"""
+    from alembic import op
+
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True, **kw)
+        return
+
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        valid = bind.execute(
+            text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"),
+            {"name": name},
+        ).scalar()
+        if valid is True:
+            return
+        if valid is False:
+            logger.warning("Rebuilding index %s left invalid by an interrupted build", name)
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+        op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True, **kw)
+
+
+def delete_duplicates(table: str, columns: Sequence[str]) -> int:
+    """Delete all but one of the rows of ``table`` that share ``columns``, before making them unique"""
+    from alembic import op
+
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        same = " AND ".join(f"a.{column} = b.{column}" for column in columns)
+        statement = f"DELETE FROM {table} a USING {table} b WHERE a.ctid > b.ctid AND {same}"
+    else:
+        statement = (
+            f"DELETE FROM {table} WHERE rowid NOT IN (SELECT min(rowid) FROM {table} GROUP BY {', '.join(columns)})"
+        )
+    deleted = bind.execute(text(statement)).rowcount
+    if deleted:
+        logger.info("Deleted %d duplicate rows from %s", deleted, table)
+    return deleted
+
+
+def backfill(name: str, table: Table, values: Dict[str, Any], where: Optional[ColumnElement] = None,
+             batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE_SECONDS) -> int:
+    """
+    UPDATE ``table`` SET ``values`` (WHERE ``where``) in batches by integer
+    primary key, committing each batch. ``name`` identifies the backfill in
+    ``migration_progress``. Returns the number of rows updated by this run.
+    """
+    from alembic import op
+
+    bind = op.get_bind()
+    context = op.get_context()
+    key = table.primary_key.columns.values()[0]
+    updated = 0
+    # PostgreSQL runs each migration in a transaction, which we step out of; on
+    # SQLite (no transactional DDL) each batch is committed explicitly
+    autocommit = context.impl.transactional_ddl
+
+    with context.autocommit_block() if autocommit else nullcontext():
+        migration_progress.create(bind, checkfirst=True)
+        last_key = bind.execute(
+            select(migration_progress.c.last_key).where(migration_progress.c.name == name)
+        ).scalar()
+        if last_key is not None:
+            logger.info("Resuming backfill %s after %s = %s", name, key.name, last_key)
+
+        while True:
+            lower = [key > last_key] if last_key is not None else []
+            # The batch's upper bound: the batch_size-th key after the last one done
+            upper = bind.execute(
+                select(key).where(*lower).order_by(key).offset(batch_size - 1).limit(1)
+            ).scalar()
+            if upper is None:
+                upper = bind.execute(select(func.max(key)).where(*lower)).scalar()
+                if upper is None:
+                    break
+
+            statement = table.update().where(*lower, key <= upper).values(values)
+            if where is not None:
+                statement = statement.where(where)
+            updated += bind.execute(statement).rowcount
+
+            last_key = upper
+            progress = {"last_key": last_key, "updated_at": func.now()}
+            if not bind.execute(
+                migration_progress.update().where(migration_progress.c.name == name).values(progress)
+            ).rowcount:
+                bind.execute(migration_progress.insert().values(name=name, **progress))
+            if not autocommit:
+                bind.commit()
+            if pause:
+                time.sleep(pause)
+
+        bind.execute(migration_progress.delete().where(migration_progress.c.name == name))
+        if not autocommit:
+            bind.commit()
+
+    logger.info("Backfill %s updated %d rows", name, updated)
+    return updated
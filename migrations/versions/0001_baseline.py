@@ -0,0 +1,197 @@
+"""Baseline: the schema as init_db() used to create it
+
+Databases created before migrations already have these tables; for them this
+adds the columns that later versions of init_db() introduced (create_all
+never altered existing tables), then the missing indexes, the archive tables
+and the search index, so they need no manual stamping. Their assignment
+table gets its unique constraint in 0004.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 10:36:51.523200
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from models import ArchiveBase
+from search import build_search_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def later_columns(table: str):
+    """Columns added to ``table`` over time, which a pre-migrations database may lack"""
+    return {
+        'entities': [sa.Column('max_concurrent_tasks', sa.Integer(), nullable=True)],
+        'projects': [sa.Column('version', sa.Integer(), nullable=False, server_default='1')],
+        'stages': [sa.Column('version', sa.Integer(), nullable=False, server_default='1')],
+        'tasks': [
+            sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+            sa.Column('version', sa.Integer(), nullable=False, server_default='1'),
+        ],
+    }[table]
+
+
+def add_later_columns(bind, table: str) -> None:
+    present = {column['name'] for column in sa.inspect(bind).get_columns(table)}
+    missing = [column for column in later_columns(table) if column.name not in present]
+    if missing:
+        with op.batch_alter_table(table) as batch_op:
+            for column in missing:
+                batch_op.add_column(column)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = set(sa.inspect(bind).get_table_names())
+
+    if 'entities' not in existing:
+        op.create_table('entities',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('entity_type', sa.Enum('HUMAN', 'AGENT', name='entitytype'), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=True),
+        sa.Column('api_key', sa.String(length=255), nullable=True),
+        sa.Column('hashed_password', sa.String(length=255), nullable=True),
+        sa.Column('skills', sa.Text(), nullable=True),
+        sa.Column('max_concurrent_tasks', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('api_key'),
+        sa.UniqueConstraint('email')
+        )
+    else:
+        add_later_columns(bind, 'entities')
+    op.create_index('ix_entities_id', 'entities', ['id'], unique=False, if_not_exists=True)
+
+    if 'jobs' not in existing:
+        op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=100), nullable=False),
+        sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', name='jobstatus'), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['entities.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_jobs_id', 'jobs', ['id'], unique=False, if_not_exists=True)
+    op.create_index('ix_jobs_status_kind_id', 'jobs', ['status', 'kind', 'id'], unique=False, if_not_exists=True)
+
+    if 'projects' not in existing:
+        op.create_table('projects',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('creator_id', sa.Integer(), nullable=True),
+        sa.Column('approval_status', sa.Enum('PENDING', 'APPROVED', 'REJECTED', name='approvalstatus'), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['creator_id'], ['entities.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        add_later_columns(bind, 'projects')
+    op.create_index('ix_projects_id', 'projects', ['id'], unique=False, if_not_exists=True)
+
+    if 'stages' not in existing:
+        op.create_table('stages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('order', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        add_later_columns(bind, 'stages')
+    op.create_index('ix_stages_id', 'stages', ['id'], unique=False, if_not_exists=True)
+
+    if 'tasks' not in existing:
+        op.create_table('tasks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('status', sa.Enum('PENDING', 'IN_PROGRESS', 'IN_REVIEW', 'COMPLETED', 'BLOCKED', name='taskstatus'), nullable=True),
+        sa.Column('project_id', sa.Integer(), nullable=True),
+        sa.Column('stage_id', sa.Integer(), nullable=True),
+        sa.Column('parent_task_id', sa.Integer(), nullable=True),
+        sa.Column('required_skills', sa.Text(), nullable=True),
+        sa.Column('priority', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['parent_task_id'], ['tasks.id'], ),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['stage_id'], ['stages.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        add_later_columns(bind, 'tasks')
+    op.create_index('ix_tasks_id', 'tasks', ['id'], unique=False, if_not_exists=True)
+    op.create_index('ix_tasks_lease_expires_at', 'tasks', ['lease_expires_at'], unique=False, if_not_exists=True)
+    op.create_index('ix_tasks_parent_task_id', 'tasks', ['parent_task_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_tasks_project_stage_id', 'tasks', ['project_id', 'stage_id', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_tasks_status_completed_at', 'tasks', ['status', 'completed_at'], unique=False, if_not_exists=True)
+
+    if 'comments' not in existing:
+        op.create_table('comments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('author_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['author_id'], ['entities.id'], ),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_comments_id', 'comments', ['id'], unique=False, if_not_exists=True)
+    op.create_index('ix_comments_task_id', 'comments', ['task_id'], unique=False, if_not_exists=True)
+
+    if 'task_assignments' not in existing:
+        op.create_table('task_assignments',
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['entity_id'], ['entities.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.UniqueConstraint('task_id', 'entity_id', name='uq_task_assignments_task_entity')
+        )
+    # An existing table without the unique constraint gets it in 0004
+    op.create_index('ix_task_assignments_entity_id', 'task_assignments', ['entity_id'], unique=False, if_not_exists=True)
+
+    ArchiveBase.metadata.create_all(bind)
+    build_search_index(bind)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # The sync triggers go with their tables
+        op.execute('DROP TABLE IF EXISTS comments_fts')
+        op.execute('DROP TABLE IF EXISTS tasks_fts')
+    ArchiveBase.metadata.drop_all(bind)
+    for table in ['task_assignments', 'comments', 'tasks', 'stages', 'projects', 'jobs', 'entities']:
+        op.drop_table(table)
+    for enum in ['taskstatus', 'approvalstatus', 'jobstatus', 'entitytype']:
+        sa.Enum(name=enum).drop(bind, checkfirst=True)
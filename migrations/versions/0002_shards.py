@@ -0,0 +1,44 @@
+"""Shard directory and per-shard id sequences
+
+Every database gets both tables; only the main database's project_shards
+and the shards' id_sequences are used, and only when SHARD_COUNT > 1.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 14:02:17.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'project_shards' not in existing:
+        op.create_table('project_shards',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('moved_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('project_id')
+        )
+    if 'id_sequences' not in existing:
+        op.create_table('id_sequences',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('next_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('id_sequences')
+    op.drop_table('project_shards')
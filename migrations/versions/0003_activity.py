@@ -0,0 +1,65 @@
+"""Activity history
+
+Field names are seeded with fixed ids so they are the same in every shard.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 16:41:05.209377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FIELDS = [
+    'name', 'description', 'approval_status', 'order', 'title', 'status', 'stage_id', 'parent_task_id',
+    'required_skills', 'priority', 'completed_at', 'assignee',
+]
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'activity_fields' not in existing:
+        fields = op.create_table('activity_fields',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+        )
+        op.bulk_insert(fields, [{'id': index, 'name': name} for index, name in enumerate(FIELDS, 1)])
+    if 'activity' not in existing:
+        op.create_table('activity',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('at', sa.DateTime(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=True),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('object_type', sa.SmallInteger(), nullable=False),
+        sa.Column('object_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.SmallInteger(), nullable=False),
+        sa.Column('field_id', sa.SmallInteger(), nullable=True),
+        sa.Column('old_value', sa.Text(), nullable=True),
+        sa.Column('new_value', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_activity_object_at', 'activity', ['object_type', 'object_id', 'at'], unique=False)
+        op.create_index('ix_activity_project_at', 'activity', ['project_id', 'at'], unique=False)
+        op.create_index('ix_activity_actor_at', 'activity', ['actor_id', 'at'], unique=False)
+        op.create_index('ix_activity_at', 'activity', ['at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_activity_at', table_name='activity')
+    op.drop_index('ix_activity_actor_at', table_name='activity')
+    op.drop_index('ix_activity_project_at', table_name='activity')
+    op.drop_index('ix_activity_object_at', table_name='activity')
+    op.drop_table('activity')
+    op.drop_table('activity_fields')
@@ -0,0 +1,42 @@
+"""Unique task assignments
+
+The baseline only creates the constraint with the table, so databases whose
+tables predate migrations get it here. Duplicate assignments are removed
+first.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 18:12:40.117305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrate import delete_duplicates
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def has_unique_assignments(bind) -> bool:
+    return ['task_id', 'entity_id'] in [
+        constraint['column_names'] for constraint in sa.inspect(bind).get_unique_constraints('task_assignments')
+    ]
+
+
+def upgrade() -> None:
+    if not has_unique_assignments(op.get_bind()):
+        delete_duplicates('task_assignments', ['task_id', 'entity_id'])
+        with op.batch_alter_table('task_assignments') as batch_op:
+            batch_op.create_unique_constraint('uq_task_assignments_task_entity', ['task_id', 'entity_id'])
+
+
+def downgrade() -> None:
+    # The baseline creates the constraint too; it stays
+    pass
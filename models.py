@@ -1,19 +1,45 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Table, Enum as SQLEnum
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import (
+    Column, Integer, SmallInteger, String, Text, DateTime, ForeignKey, Boolean, Table, UniqueConstraint, Index,
+    JSON, Enum as SQLEnum
+)
+from sqlalchemy.orm import relationship, declarative_base, backref, foreign, remote
 import enum
+from typing import Iterable, Set, Union
 
 Base = declarative_base()
+# Archive tables are created separately (by the baseline migration), possibly in another database file
+ArchiveBase = declarative_base()
+
+# Placeholder schema for archive tables; database.py maps it to the attached
+# archive database, or to the default schema when there is none
+ARCHIVE_SCHEMA = "archive"
+
+# Placeholder schema for the tables every shard shares (entities, jobs, the
+# shard directory); database.py maps it to the main database, which is
+# ATTACHed to the other shards
+SHARED_SCHEMA = "shared"
 
 # Association table for task assignments
 task_assignments = Table(
     'task_assignments',
     Base.metadata,
     Column('task_id', Integer, ForeignKey('tasks.id', ondelete='CASCADE')),
-    Column('entity_id', Integer, ForeignKey('entities.id', ondelete='CASCADE'))
+    Column('entity_id', Integer, ForeignKey(f'{SHARED_SCHEMA}.entities.id', ondelete='CASCADE'), index=True),
+    # Lets assignment inserts use ON CONFLICT DO NOTHING instead of a read-before-write
+    UniqueConstraint('task_id', 'entity_id', name='uq_task_assignments_task_entity')
 )
 
 
+def parse_skills(skills: Union[str, Iterable[str], None]) -> Set[str]:
+    """Normalise a comma-separated skill list (or a list of skills) for matching"""
+    if not skills:
+        return set()
+    if isinstance(skills, str):
+        skills = skills.split(',')
+    return {skill.strip().lower() for skill in skills if skill and skill.strip()}
+
+
 class EntityType(str, enum.Enum):
     HUMAN = "human"
     AGENT = "agent"
@@ -33,6 +59,28 @@ class ApprovalStatus(str, enum.Enum):
     REJECTED = "rejected"
 
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+# Stored as small integers in the activity log; never renumber
+class ActivityObject(enum.IntEnum):
+    PROJECT = 1
+    STAGE = 2
+    TASK = 3
+
+
+class ActivityAction(enum.IntEnum):
+    CREATED = 1
+    UPDATED = 2
+    DELETED = 3
+    ASSIGNED = 4
+    UNASSIGNED = 5
+
+
 class Entity(Base):
     """Unified model for both humans and agents"""
     __tablename__ = "entities"
@@ -44,6 +92,7 @@ class Entity(Base):
     api_key = Column(String(255), unique=True, nullable=True)  # For agent authentication
     hashed_password = Column(String(255), nullable=True)  # For human authentication
     skills = Column(Text, nullable=True)  # Comma-separated skills
+    max_concurrent_tasks = Column(Integer, default=1)  # Capacity used by the scheduler
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -51,6 +100,8 @@ class Entity(Base):
     assigned_tasks = relationship("Task", secondary=task_assignments, back_populates="assignees")
     created_projects = relationship("Project", back_populates="creator")
 
+    __table_args__ = {"schema": SHARED_SCHEMA}
+
 
 class Project(Base):
     __tablename__ = "projects"
@@ -58,16 +109,19 @@ class Project(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
-    creator_id = Column(Integer, ForeignKey('entities.id'))
+    creator_id = Column(Integer, ForeignKey(f'{SHARED_SCHEMA}.entities.id'))
     approval_status = Column(SQLEnum(ApprovalStatus), default=ApprovalStatus.PENDING)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1)  # Bumped on every change, for optimistic concurrency
     
     # Relationships
     creator = relationship("Entity", back_populates="created_projects")
     tasks = relationship("Task", back_populates="project", cascade="all, delete-orphan")
     stages = relationship("Stage", back_populates="project", cascade="all, delete-orphan", order_by="Stage.order")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Stage(Base):
     __tablename__ = "stages"
@@ -78,11 +132,14 @@ class Stage(Base):
     order = Column(Integer, nullable=False)
     project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'))
     created_at = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1)  # Bumped on every change, for optimistic concurrency
     
     # Relationships
     project = relationship("Project", back_populates="stages")
     tasks = relationship("Task", back_populates="stage")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -93,30 +150,194 @@ class Task(Base):
     status = Column(SQLEnum(TaskStatus), default=TaskStatus.PENDING)
     project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'))
     stage_id = Column(Integer, ForeignKey('stages.id', ondelete='SET NULL'), nullable=True)
-    parent_task_id = Column(Integer, ForeignKey('tasks.id'), nullable=True)
+    parent_task_id = Column(Integer, ForeignKey('tasks.id'), nullable=True, index=True)
     required_skills = Column(Text, nullable=True)  # Comma-separated skills
     priority = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)  # Set while an agent holds a claim
+    version = Column(Integer, nullable=False, default=1)  # Bumped on every change, for optimistic concurrency
     
     # Relationships
     project = relationship("Project", back_populates="tasks")
     stage = relationship("Stage", back_populates="tasks")
     assignees = relationship("Entity", secondary=task_assignments, back_populates="assigned_tasks")
-    subtasks = relationship("Task", backref="parent_task", remote_side=[id])
+    subtasks = relationship("Task", backref=backref("parent_task", remote_side=[id]))
     comments = relationship("Comment", back_populates="task", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Archival scans completed tasks by completion time
+        Index('ix_tasks_status_completed_at', 'status', 'completed_at'),
+        # Board columns are paged by id within a stage, and counted per stage
+        Index('ix_tasks_project_stage_id', 'project_id', 'stage_id', 'id'),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Comment(Base):
     __tablename__ = "comments"
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text, nullable=False)
-    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='CASCADE'))
-    author_id = Column(Integer, ForeignKey('entities.id'))
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='CASCADE'), index=True)
+    author_id = Column(Integer, ForeignKey(f'{SHARED_SCHEMA}.entities.id'))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     task = relationship("Task", back_populates="comments")
     author = relationship("Entity")
+
+
+class Job(Base):
+    """Background job, persisted so queued work survives a restart"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(100), nullable=False)
+    status = Column(SQLEnum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    payload = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    created_by = Column(Integer, ForeignKey(f'{SHARED_SCHEMA}.entities.id'), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Workers claim the oldest queued job of a kind
+    __table_args__ = (Index('ix_jobs_status_kind_id', 'status', 'kind', 'id'), {"schema": SHARED_SCHEMA})
+
+
+# ============================================================================
+# SHARDING
+# ============================================================================
+# With SHARD_COUNT > 1 projects live in several SQLite files (see database.py).
+# A row's id comes from its shard's range, so the id says where it was created.
+
+class ProjectShard(Base):
+    """Directory entry for a project moved off the shard its id belongs to"""
+    __tablename__ = "project_shards"
+
+    project_id = Column(Integer, primary_key=True)
+    shard = Column(Integer, nullable=False)
+    moved_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = {"schema": SHARED_SCHEMA}
+
+
+class IdSequence(Base):
+    """Next free id of a table within this shard's range"""
+    __tablename__ = "id_sequences"
+
+    name = Column(String(100), primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+
+# ============================================================================
+# ACTIVITY
+# ============================================================================
+# Field-level history of projects, stages, tasks and assignments (see
+# activity.py). Rows live in the project's shard and outlive what they
+# describe, so there are no foreign keys.
+
+class ActivityField(Base):
+    """Interned field name, so activity rows store a small integer"""
+    __tablename__ = "activity_fields"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100), nullable=False, unique=True)
+
+
+class Activity(Base):
+    """One changed field (or a create/delete) of one object"""
+    __tablename__ = "activity"
+
+    id = Column(Integer, primary_key=True)
+    at = Column(DateTime, nullable=False)
+    actor_id = Column(Integer, nullable=True)  # NULL for the scheduler and the lease reaper
+    project_id = Column(Integer, nullable=False)
+    object_type = Column(SmallInteger, nullable=False)  # ActivityObject
+    object_id = Column(Integer, nullable=False)
+    action = Column(SmallInteger, nullable=False)  # ActivityAction
+    field_id = Column(SmallInteger, nullable=True)
+    # JSON-encoded
+    old_value = Column(Text, nullable=True)
+    new_value = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index('ix_activity_object_at', 'object_type', 'object_id', 'at'),
+        Index('ix_activity_project_at', 'project_id', 'at'),
+        Index('ix_activity_actor_at', 'actor_id', 'at'),
+        Index('ix_activity_at', 'at'),
+    )
+
+
+# ============================================================================
+# ARCHIVE
+# ============================================================================
+# Completed tasks older than ARCHIVE_AFTER_DAYS are moved here with their
+# comments and assignments (see archive.py). Rows keep their original ids.
+# There are no foreign keys, so the tables can live in another database.
+
+archived_task_assignments = Table(
+    'archived_task_assignments',
+    ArchiveBase.metadata,
+    Column('task_id', Integer, nullable=False, index=True),
+    Column('entity_id', Integer, nullable=False),
+    schema=ARCHIVE_SCHEMA
+)
+
+
+class ArchivedTask(ArchiveBase):
+    __tablename__ = "archived_tasks"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    status = Column(SQLEnum(TaskStatus), nullable=False)
+    project_id = Column(Integer, nullable=False, index=True)
+    stage_id = Column(Integer, nullable=True)
+    parent_task_id = Column(Integer, nullable=True)
+    required_skills = Column(Text, nullable=True)
+    priority = Column(Integer, default=0)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    # Part of the table's key so PostgreSQL can partition by it; rows are still identified by id
+    completed_at = Column(DateTime, primary_key=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    assignees = relationship(
+        Entity, secondary=archived_task_assignments, viewonly=True,
+        primaryjoin=lambda: ArchivedTask.id == foreign(archived_task_assignments.c.task_id),
+        secondaryjoin=lambda: Entity.id == foreign(archived_task_assignments.c.entity_id)
+    )
+    subtasks = relationship(
+        lambda: ArchivedTask, viewonly=True,
+        primaryjoin=lambda: ArchivedTask.id == foreign(remote(ArchivedTask.parent_task_id))
+    )
+    comments = relationship(
+        lambda: ArchivedComment, viewonly=True, order_by=lambda: ArchivedComment.created_at,
+        primaryjoin=lambda: ArchivedTask.id == foreign(ArchivedComment.task_id)
+    )
+
+    __table_args__ = (
+        Index('ix_archived_tasks_project_completed', 'project_id', 'completed_at'),
+        {"schema": ARCHIVE_SCHEMA, "postgresql_partition_by": "RANGE (completed_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class ArchivedComment(ArchiveBase):
+    __tablename__ = "archived_comments"
+
+    id = Column(Integer, primary_key=True)
+    content = Column(Text, nullable=False)
+    task_id = Column(Integer, nullable=False, index=True)
+    author_id = Column(Integer)
+    created_at = Column(DateTime)
+
+    __table_args__ = {"schema": ARCHIVE_SCHEMA}
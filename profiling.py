@@ -0,0 +1,232 @@
+"""
+Per-request SQL profiling and N+1 detection.
+
+Opt-in with SQL_PROFILING=true. Every statement a request executes is
+recorded with its duration and the application line that issued it.
+Statements are grouped by shape: whitespace and expanded IN lists are
+normalized, and parameters are already bound as placeholders. A shape
+repeated N_PLUS_ONE_THRESHOLD or more times in one request is flagged as a
+likely N+1. Each profiled response carries an ``X-SQL-Profile`` summary
+header, and recent profiles are kept for ``GET /debug/sql-profiles``.
+
+``capture_queries`` and ``assert_max_queries`` work without the middleware
+and are meant for tests and benchmarks:
+
+    with assert_max_queries(engine, 4):
+        client.get("/ui/projects/1/board")
+"""
+import contextvars
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from greenlet import getcurrent
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILING = os.getenv("SQL_PROFILING", "false").lower() == "true"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+SQL_PROFILE_HISTORY = int(os.getenv("SQL_PROFILE_HISTORY", "100"))
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+))*\s*\)")
+
+
+def normalize_statement(statement: str) -> str:
+    """Statement shape: collapsed whitespace and IN lists of any length reduced to (?)"""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def _call_site() -> Optional[str]:
+    """
+    First application frame (file:line function) that led to the statement.
+    Engine events run inside SQLAlchemy's greenlet, whose stack stops at the
+    sync driver call, so the walk continues into the parent greenlet where
+    the awaiting coroutines are suspended.
+    """
+    frame = sys._getframe(2)
+    current = getcurrent()
+    while True:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(PROJECT_DIR) and filename != __file__ and "site-packages" not in filename:
+                return f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} {frame.f_code.co_name}"
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return None
+        frame = current.gr_frame
+
+
+class QueryRecord:
+    """One executed statement"""
+    __slots__ = ("statement", "duration", "call_site")
+
+    def __init__(self, statement: str, duration: float, call_site: Optional[str]):
+        self.statement = statement
+        self.duration = duration
+        self.call_site = call_site
+
+
+class QueryProfile:
+    """Statements executed during one request or capture block"""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.records: List[QueryRecord] = []
+
+    def record(self, statement: str, duration: float, call_site: Optional[str] = None):
+        self.records.append(QueryRecord(statement, duration, call_site))
+
+    @property
+    def count(self) -> int:
+        return len(self.records)
+
+    @property
+    def total_time(self) -> float:
+        return sum(record.duration for record in self.records)
+
+    def n_plus_one(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statement shapes executed at least ``threshold`` times, most repeated first"""
+        shapes = Counter(normalize_statement(record.statement) for record in self.records)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def header(self) -> str:
+        """Compact summary for the X-SQL-Profile response header"""
+        return f"queries={self.count}; time_ms={self.total_time * 1000:.2f}; n_plus_one={len(self.n_plus_one())}"
+
+    def summary(self) -> Dict:
+        suspects = self.n_plus_one()
+        call_sites: Dict[str, set] = {}
+        for record in self.records:
+            call_sites.setdefault(normalize_statement(record.statement), set()).add(record.call_site)
+        return {
+            "label": self.label,
+            "queries": self.count,
+            "time_ms": round(self.total_time * 1000, 3),
+            "n_plus_one": [
+                {"statement": shape, "count": count, "call_sites": sorted(filter(None, call_sites[shape]))}
+                for shape, count in suspects
+            ],
+            "statements": [
+                {
+                    "statement": record.statement,
+                    "duration_ms": round(record.duration * 1000, 3),
+                    "call_site": record.call_site,
+                }
+                for record in self.records
+            ],
+        }
+
+    def report(self) -> str:
+        lines = [f"{self.count} queries in {self.total_time * 1000:.2f} ms"]
+        for record in self.records:
+            lines.append(f"  {record.duration * 1000:8.2f} ms  {record.call_site or '?'}  {normalize_statement(record.statement)}")
+        return "\n".join(lines)
+
+
+def listen_queries(engine: AsyncEngine, on_query: Callable[[str, float], None]) -> Callable[[], None]:
+    """Call ``on_query(statement, duration)`` after every statement; returns a function that removes the hooks"""
+    sync_engine = engine.sync_engine
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._profile_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Statements already running when the hooks were added have no start time
+        start = getattr(context, "_profile_start", None)
+        if start is not None:
+            on_query(statement, time.perf_counter() - start)
+
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+    def remove():
+        event.remove(sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+    return remove
+
+
+@contextmanager
+def capture_queries(engine: AsyncEngine, label: str = "") -> Iterator[QueryProfile]:
+    """
+    Record every statement the engine executes inside the block, from any
+    task or thread (so it also sees requests made through TestClient).
+    """
+    profile = QueryProfile(label)
+    remove = listen_queries(
+        engine, lambda statement, duration: profile.record(statement, duration, _call_site())
+    )
+    try:
+        yield profile
+    finally:
+        remove()
+
+
+@contextmanager
+def assert_max_queries(engine: AsyncEngine, max_queries: int, label: str = "") -> Iterator[QueryProfile]:
+    """Fail with the statement listing if the block executes more than ``max_queries`` statements"""
+    with capture_queries(engine, label) as profile:
+        yield profile
+    if profile.count > max_queries:
+        raise AssertionError(f"{label or 'Block'} exceeded its query budget of {max_queries}: {profile.report()}")
+
+
+current_profile: contextvars.ContextVar[Optional[QueryProfile]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+# Most recent request profiles, newest last
+recent_profiles: Deque[Dict] = deque(maxlen=SQL_PROFILE_HISTORY)
+
+
+def profile_engine(engine: AsyncEngine):
+    """Attribute statements to the request profile active in the calling context"""
+    def on_query(statement: str, duration: float):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.record(statement, duration, _call_site())
+
+    listen_queries(engine, on_query)
+
+
+class SQLProfilerMiddleware:
+    """ASGI middleware that profiles each HTTP request's SQL and adds an X-SQL-Profile header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/debug/"):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-profile", profile.header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            suspects = profile.n_plus_one()
+            if suspects:
+                logger.warning(
+                    "Possible N+1 in %s: %d x %s", profile.label, suspects[0][1], suspects[0][0][:200]
+                )
+            recent_profiles.append(profile.summary())
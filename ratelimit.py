@@ -0,0 +1,269 @@
+"""
+Rate limiting and admission control.
+
+Per-client token buckets: each API key (agents), bearer token (humans) or,
+for anonymous requests, client address gets RATE_LIMIT_BURST tokens that
+refill at RATE_LIMIT_PER_SECOND. A request spends its route's cost
+(RATE_LIMIT_ROUTE_COSTS, default 1) or is rejected with 429 and a
+Retry-After telling the client when enough tokens will be available.
+Buckets are checked before authentication so a client in a tight loop is
+turned away without touching the database.
+
+The local limiter is a dict of [tokens, last refill] pairs updated in
+place. Requests are handled on one event loop thread and the check never
+awaits, so it needs no lock. With RATE_LIMIT_REDIS_URL (needs the
+``redis`` package) buckets live in Redis and are updated by a Lua script,
+so the limit holds across worker processes; if Redis is unreachable the
+local buckets are used.
+
+Admission control watches how long requests wait to check a connection
+out of the database pool. While the worst wait in the last second exceeds
+ADMISSION_MAX_POOL_WAIT_MS, a growing share of requests is shed with 503
+and Retry-After instead of queueing behind the pool.
+"""
+import logging
+import math
+import os
+import random
+import re
+import time
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "60"))
+# "METHOD /path=cost" pairs; * matches one path segment
+RATE_LIMIT_ROUTE_COSTS = os.getenv(
+    "RATE_LIMIT_ROUTE_COSTS",
+    "GET /tasks/available=5,GET /tasks=3,GET /search=5,POST /projects/*/import=20,POST /projects/*/schedule=10",
+)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+RATE_LIMIT_MAX_KEYS = 100_000
+ADMISSION_MAX_POOL_WAIT_MS = float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", "1000"))  # 0 = disabled
+
+# Never limited: probes, scrapes and static assets
+EXEMPT_PREFIXES = ("/health", "/metrics", "/static/")
+
+rejected_requests = registry.counter(
+    "rate_limited_requests_total", "Requests rejected by the rate limiter or admission control", ("reason",)
+)
+pool_wait = registry.histogram("db_pool_wait_seconds", "Time spent waiting for a database connection")
+
+# Atomic refill-and-spend on a hash {tokens, ts}; uses the Redis clock so workers agree on time
+_REDIS_BUCKET_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+def parse_route_costs(spec: str) -> List[Tuple[str, Pattern, float]]:
+    """Parse ``METHOD /path=cost`` pairs into (method, path regex, cost)"""
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, cost = item.rpartition("=")
+        method, _, path = route.strip().partition(" ")
+        pattern = re.compile("^" + re.escape(path.strip()).replace(r"\*", "[^/]+") + "$")
+        rules.append((method.upper(), pattern, float(cost)))
+    return rules
+
+
+class RateLimiter:
+    """Token buckets keyed by client, in memory or in a shared Redis"""
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: float = RATE_LIMIT_BURST,
+                 route_costs: str = RATE_LIMIT_ROUTE_COSTS, redis_url: Optional[str] = RATE_LIMIT_REDIS_URL):
+        self.rate = rate
+        self.burst = burst
+        self.rules = parse_route_costs(route_costs)
+        self._buckets: Dict[str, List[float]] = {}
+        self._redis = None
+        self._script = None
+        if redis_url:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(redis_url)
+            self._script = self._redis.register_script(_REDIS_BUCKET_SCRIPT)
+
+    @property
+    def shared(self) -> bool:
+        return self._redis is not None
+
+    def cost(self, method: str, path: str) -> float:
+        for rule_method, pattern, cost in self.rules:
+            if rule_method == method and pattern.match(path):
+                # A cost above the burst could never be paid
+                return min(cost, self.burst)
+        return 1.0
+
+    def take_local(self, key: str, cost: float) -> float:
+        """Spend ``cost`` tokens; returns 0 if allowed, else seconds until it would be"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= RATE_LIMIT_MAX_KEYS:
+                self._prune(now)
+            bucket = self._buckets[key] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= cost:
+            bucket[0] = tokens - cost
+            return 0.0
+        bucket[0] = tokens
+        return (cost - tokens) / self.rate
+
+    def _prune(self, now: float):
+        # A bucket idle long enough to have refilled is the same as no bucket
+        full_after = self.burst / self.rate
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < full_after}
+        if len(self._buckets) >= RATE_LIMIT_MAX_KEYS:
+            self._buckets.clear()
+
+    async def take(self, key: str, cost: float) -> float:
+        if self._redis is not None:
+            try:
+                return float(await self._script(keys=[f"ratelimit:{key}"], args=[self.rate, self.burst, cost]))
+            except Exception:
+                logger.warning("Shared rate limiter unavailable, using local buckets", exc_info=True)
+        return self.take_local(key, cost)
+
+
+class AdmissionController:
+    """Sheds load while database connections are slow to obtain"""
+
+    WINDOW_SECONDS = 1.0
+
+    def __init__(self, max_wait_ms: float = ADMISSION_MAX_POOL_WAIT_MS):
+        self.max_wait = max_wait_ms / 1000
+        self._window_start = 0.0
+        self._window_max = 0.0
+        self._previous_max = 0.0
+
+    def record_wait(self, seconds: float):
+        pool_wait.observe(seconds)
+        now = time.monotonic()
+        self._roll(now)
+        if seconds > self._window_max:
+            self._window_max = seconds
+
+    def _roll(self, now: float):
+        if now - self._window_start >= self.WINDOW_SECONDS:
+            # A window with no checkouts at all resets the signal, so shedding can't latch on
+            stale = now - self._window_start >= 2 * self.WINDOW_SECONDS
+            self._previous_max = 0.0 if stale else self._window_max
+            self._window_max = 0.0
+            self._window_start = now
+
+    @property
+    def recent_wait(self) -> float:
+        self._roll(time.monotonic())
+        return max(self._window_max, self._previous_max)
+
+    def should_shed(self) -> bool:
+        if self.max_wait <= 0:
+            return False
+        wait = self.recent_wait
+        # Shed in proportion to the overload: twice the allowed wait drops half the requests
+        return wait > self.max_wait and random.random() > self.max_wait / wait
+
+    def track(self, engine: AsyncEngine):
+        """Time every connection checkout from the engine's pool"""
+        pool = engine.sync_engine.pool
+        connect = pool.connect
+
+        def timed_connect():
+            start = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                self.record_wait(time.perf_counter() - start)
+
+        pool.connect = timed_connect
+
+
+# Global instances
+rate_limiter = RateLimiter()
+admission = AdmissionController()
+
+registry.gauge(
+    "admission_pool_wait_seconds", "Worst database connection wait in the last second",
+    callback=lambda: [((), admission.recent_wait)]
+)
+
+
+def _client_key(scope) -> str:
+    api_key = authorization = None
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            api_key = value
+        elif name == b"authorization":
+            authorization = value
+    if api_key:
+        return "key:" + api_key.decode("latin-1")
+    if authorization:
+        return "auth:" + authorization.decode("latin-1")
+    client = scope.get("client")
+    return "addr:" + (client[0] if client else "unknown")
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    body = ('{"detail":"%s"}' % detail).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying admission control, then the caller's token bucket"""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter, controller: AdmissionController = admission):
+        self.app = app
+        self.limiter = limiter
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        if self.controller.should_shed():
+            rejected_requests.inc(1, "overload")
+            await _reject(send, 503, "Server overloaded, retry later", self.controller.WINDOW_SECONDS)
+            return
+
+        cost = self.limiter.cost(scope["method"], scope["path"])
+        key = _client_key(scope)
+        # The local check is a plain call; only the shared backend needs an await
+        retry_after = await self.limiter.take(key, cost) if self.limiter.shared else self.limiter.take_local(key, cost)
+        if retry_after:
+            rejected_requests.inc(1, "rate_limit")
+            await _reject(send, 429, "Rate limit exceeded", retry_after)
+            return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,265 @@
+"""
+Skill-aware task scheduler.
+
+Pending, unassigned tasks are dispatched in priority order to active agents
+that have spare capacity (``max_concurrent_tasks`` minus their IN_PROGRESS
+tasks). Agents sit in one min-heap per skill, plus one for tasks without
+required skills, ordered by load ratio, so each assignment costs
+O(skills * log agents) instead of a scan over every agent.
+
+With several shards an agent's load is summed over all of them, and the
+background pass schedules one shard after another.
+"""
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select, update, func, exists
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import (
+    ActivityAction, ActivityObject, Entity, Task, EntityType, TaskStatus, parse_skills, task_assignments
+)
+from leases import lease_expiry
+from database import dialect_insert
+from activity import record_all
+from cache import project_cache
+from board import publish_changed
+
+logger = logging.getLogger(__name__)
+
+# Background mode runs a scheduling pass over all projects every N seconds (0 disables it)
+SCHEDULER_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_INTERVAL_SECONDS", "0"))
+# Maximum number of pending tasks considered per pass
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "1000"))
+
+# Heap key for tasks that have no required skills
+ANY_SKILL = None
+
+
+async def agent_loads(db: AsyncSession) -> Dict[int, int]:
+    """IN_PROGRESS tasks per assigned entity"""
+    result = await db.execute(
+        select(task_assignments.c.entity_id, func.count())
+        .join(Task, Task.id == task_assignments.c.task_id)
+        .where(Task.status == TaskStatus.IN_PROGRESS)
+        .group_by(task_assignments.c.entity_id)
+    )
+    return dict(result.all())
+
+
+def add_loads(loads: Iterable[Dict[int, int]]) -> Dict[int, int]:
+    """Sum per-shard loads"""
+    total = Counter()
+    for shard_loads in loads:
+        total.update(shard_loads)
+    return dict(total)
+
+
+class AgentSlot:
+    """Scheduling state for one agent"""
+    __slots__ = ("id", "skills", "capacity", "load")
+
+    def __init__(self, id: int, skills: Set[str], capacity: int, load: int):
+        self.id = id
+        self.skills = skills
+        self.capacity = max(capacity or 1, 1)
+        self.load = load
+
+
+class Dispatcher:
+    """
+    Matches tasks to the least-loaded agent that has one of the required skills.
+
+    Heap entries are never updated in place: when an agent's load changes a
+    fresh entry is pushed and the old ones are discarded lazily on peek.
+    """
+
+    def __init__(self, agents: Iterable[AgentSlot]):
+        self.agents: Dict[int, AgentSlot] = {}
+        self.heaps: Dict[Optional[str], list] = {}
+        for agent in agents:
+            self.agents[agent.id] = agent
+            self._push(agent)
+
+    def _push(self, agent: AgentSlot):
+        if agent.load >= agent.capacity:
+            return
+        entry = (agent.load / agent.capacity, agent.load, agent.id)
+        for skill in agent.skills:
+            heapq.heappush(self.heaps.setdefault(skill, []), entry)
+        heapq.heappush(self.heaps.setdefault(ANY_SKILL, []), entry)
+
+    def _peek(self, skill: Optional[str]) -> Optional[tuple]:
+        heap = self.heaps.get(skill)
+        while heap:
+            entry = heap[0]
+            if self.agents[entry[2]].load == entry[1]:
+                return entry
+            heapq.heappop(heap)  # Stale entry
+        return None
+
+    def assign(self, required_skills: Set[str]) -> Optional[int]:
+        """Pick an agent for a task and account for the new load; None if nobody can take it"""
+        best = None
+        for skill in required_skills or (ANY_SKILL,):
+            entry = self._peek(skill)
+            if entry is not None and (best is None or entry < best):
+                best = entry
+        if best is None:
+            return None
+
+        agent = self.agents[best[2]]
+        agent.load += 1
+        self._push(agent)
+        return agent.id
+
+    @property
+    def has_capacity(self) -> bool:
+        return self._peek(ANY_SKILL) is not None
+
+
+class TaskScheduler:
+    """Runs scheduling passes on demand or continuously in the background"""
+
+    def __init__(self):
+        # Passes are serialized so two passes never hand out the same capacity
+        self._lock = asyncio.Lock()
+        self._background: Optional[asyncio.Task] = None
+
+    async def _load_agents(self, db: AsyncSession, loads: Optional[Dict[int, int]] = None) -> List[AgentSlot]:
+        if loads is None:
+            loads = await agent_loads(db)
+
+        result = await db.execute(
+            select(Entity.id, Entity.skills, Entity.max_concurrent_tasks)
+            .where(Entity.entity_type == EntityType.AGENT, Entity.is_active == True)
+        )
+        return [
+            AgentSlot(entity_id, parse_skills(skills), capacity, loads.get(entity_id, 0))
+            for entity_id, skills, capacity in result
+        ]
+
+    async def schedule(self, db: AsyncSession, project_id: Optional[int] = None,
+                       loads: Optional[Dict[int, int]] = None,
+                       actor_id: Optional[int] = None) -> Tuple[List[Tuple[int, int]], int]:
+        """
+        Assign pending, unassigned tasks (optionally for one project) to agents.
+        ``loads`` overrides the agents' load as counted in ``db`` (for shards).
+        The activity log names ``actor_id`` as the one who scheduled (None for the background pass).
+        Returns the (task_id, entity_id) assignments made and the number of
+        considered tasks that could not be placed.
+        """
+        async with self._lock:
+            dispatcher = Dispatcher(await self._load_agents(db, loads))
+            if not dispatcher.has_capacity:
+                return [], 0
+
+            query = select(Task.id, Task.required_skills).where(
+                Task.status == TaskStatus.PENDING,
+                ~exists().where(task_assignments.c.task_id == Task.id)
+            )
+            if project_id is not None:
+                query = query.where(Task.project_id == project_id)
+            query = query.order_by(Task.priority.desc(), Task.created_at.asc()).limit(SCHEDULER_BATCH_SIZE)
+
+            assignments = []
+            unassigned = 0
+            for task_id, required_skills in await db.execute(query):
+                entity_id = dispatcher.assign(parse_skills(required_skills))
+                if entity_id is None:
+                    unassigned += 1
+                    if not dispatcher.has_capacity:
+                        break
+                else:
+                    assignments.append((task_id, entity_id))
+
+            if assignments:
+                # Assigns and transitions don't take the lock: only tasks still pending and
+                # unassigned are claimed, and the rest of the pass goes by what was claimed
+                result = await db.execute(
+                    update(Task)
+                    .where(
+                        Task.id.in_([task_id for task_id, _ in assignments]),
+                        Task.status == TaskStatus.PENDING,
+                        ~exists().where(task_assignments.c.task_id == Task.id)
+                    )
+                    .values(
+                        status=TaskStatus.IN_PROGRESS,
+                        lease_expires_at=lease_expiry(),
+                        version=Task.version + 1,
+                        updated_at=datetime.utcnow()
+                    )
+                    .returning(Task.id, Task.project_id)
+                    .execution_options(synchronize_session=False)
+                )
+                task_projects = dict(result.all())
+                assignments = [(task_id, entity_id) for task_id, entity_id in assignments if task_id in task_projects]
+            if assignments:
+                await db.execute(
+                    dialect_insert(db, task_assignments).on_conflict_do_nothing(),
+                    [{"task_id": task_id, "entity_id": entity_id} for task_id, entity_id in assignments]
+                )
+                entity_ids = dict(assignments)
+                events = []
+                for task_id, project_id in task_projects.items():
+                    task_target = (ActivityObject.TASK, task_id, project_id)
+                    events.append((ActivityAction.ASSIGNED, task_target, [("assignee", None, entity_ids[task_id])]))
+                    events.append(
+                        (ActivityAction.UPDATED, task_target, [("status", TaskStatus.PENDING, TaskStatus.IN_PROGRESS)])
+                    )
+                await record_all(db, actor_id, events)
+                project_ids = set(task_projects.values())
+                await db.commit()
+                await project_cache.invalidate(*project_ids)
+                await publish_changed(*project_ids)
+
+            return assignments, unassigned
+
+    async def run_forever(self, session_makers: Sequence[async_sessionmaker], interval: float):
+        """Schedule across all projects (shard by shard) every ``interval`` seconds"""
+        while True:
+            try:
+                loads = None
+                if len(session_makers) > 1:
+                    loads = Counter()
+                    for session_maker in session_makers:
+                        async with session_maker() as db:
+                            loads.update(await agent_loads(db))
+                assigned = 0
+                for session_maker in session_makers:
+                    async with session_maker() as db:
+                        assignments, _ = await self.schedule(db, loads=loads)
+                    assigned += len(assignments)
+                    if loads is not None:
+                        loads.update(entity_id for _, entity_id in assignments)
+                if assigned:
+                    logger.info("Scheduler assigned %d tasks", assigned)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler pass failed")
+            await asyncio.sleep(interval)
+
+    def start(self, session_makers: Sequence[async_sessionmaker], interval: float = SCHEDULER_INTERVAL_SECONDS):
+        """Start background mode over the shards' session makers"""
+        if self._background is None:
+            self._background = asyncio.create_task(self.run_forever(session_makers, interval))
+
+    async def stop(self):
+        """Stop background mode"""
+        if self._background is not None:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
+
+
+# Global instance
+scheduler = TaskScheduler()
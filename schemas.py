@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, computed_field
+from typing import Any, Optional, List
 from datetime import datetime
-from models import EntityType, TaskStatus, ApprovalStatus
+from models import EntityType, TaskStatus, ApprovalStatus, JobStatus
+import enum
 
 
 # Entity Schemas
@@ -10,6 +11,7 @@ class EntityBase(BaseModel):
     entity_type: EntityType
     email: Optional[EmailStr] = None
     skills: Optional[str] = None
+    max_concurrent_tasks: int = Field(1, ge=1)
 
 
 class EntityCreate(EntityBase):
@@ -48,6 +50,7 @@ class ProjectResponse(ProjectBase):
     approval_status: ApprovalStatus
     created_at: datetime
     updated_at: datetime
+    version: int
 
     class Config:
         from_attributes = True
@@ -74,6 +77,7 @@ class StageResponse(StageBase):
     id: int
     project_id: int
     created_at: datetime
+    version: int
 
     class Config:
         from_attributes = True
@@ -111,6 +115,8 @@ class TaskResponse(TaskBase):
     created_at: datetime
     updated_at: datetime
     completed_at: Optional[datetime]
+    lease_expires_at: Optional[datetime] = None
+    version: int
     assignees: List[EntityResponse] = []
 
     class Config:
@@ -131,17 +137,103 @@ class CommentResponse(CommentBase):
     task_id: int
     author_id: int
     created_at: datetime
+    # Accepted into the write-behind buffer; id is negative and replaced once written
+    provisional: bool = False
 
     class Config:
         from_attributes = True
 
 
+# Transition Schemas
+class TaskTransition(BaseModel):
+    """Status/stage change, comment and assignment changes applied in one transaction"""
+    status: Optional[TaskStatus] = None
+    stage_id: Optional[int] = None
+    comment: Optional[str] = None
+    assign: List[int] = []  # Entity ids to add as assignees
+    unassign: List[int] = []  # Entity ids to remove
+    release: bool = False  # Unassign the caller
+    expected_version: Optional[int] = None  # Fail with 409 if the task changed since this version
+
+
+class TaskTransitionResponse(BaseModel):
+    task: TaskResponse
+    comment: Optional[CommentResponse] = None
+
+
 # Assignment Schema
 class TaskAssignment(BaseModel):
     task_id: int
     entity_id: int
 
 
+# WebSocket Schemas
+class WebSocketSubscription(BaseModel):
+    """Filters a socket sets with a {"type": "subscribe", ...} message; None matches everything"""
+    events: Optional[List[str]] = Field(None, max_length=100)
+    stage_ids: Optional[List[int]] = Field(None, max_length=1000)
+    assigned_to_me: bool = False
+    skills: Optional[List[str]] = Field(None, max_length=100)
+
+
+# Search Schemas
+class SearchScope(str, enum.Enum):
+    ALL = "all"
+    TASKS = "tasks"
+    COMMENTS = "comments"
+
+
+class SearchHit(BaseModel):
+    kind: str  # "task" or "comment"
+    id: int
+    task_id: int
+    project_id: int
+    title: str
+    snippet: str  # HTML: escaped text with matched terms wrapped in <mark></mark>
+    score: float  # Relative to the best hit of the same kind, which scores 1.0
+
+
+# Scheduler Schemas
+class ScheduleResponse(BaseModel):
+    project_id: int
+    assignments: List[TaskAssignment] = []
+    unassigned: int  # Pending tasks that no agent could take
+
+
+# Job Schemas
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: JobStatus
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class TaskImport(BaseModel):
+    stage_id: Optional[int] = None  # Stage for every imported task; defaults to none
+    tasks: List[TaskBase]
+
+
+# Activity Schemas
+class ActivityResponse(BaseModel):
+    at: datetime
+    actor_id: Optional[int] = None  # None for the scheduler and the lease reaper
+    project_id: int
+    object_type: str
+    object_id: int
+    action: str
+    field: Optional[str] = None
+    old_value: Any = None
+    new_value: Any = None
+
+
 # Auth Schemas
 class Token(BaseModel):
     access_token: str
@@ -162,6 +254,38 @@ class ProjectDetailResponse(ProjectResponse):
         from_attributes = True
 
 
+class ResponseShape(str, enum.Enum):
+    NESTED = "nested"
+    NORMALIZED = "normalized"  # Entities listed once and referenced by id
+
+
+class NormalizedTaskResponse(TaskResponse):
+    assignees: List[EntityResponse] = Field(default=[], exclude=True)
+
+    @computed_field
+    @property
+    def assignee_ids(self) -> List[int]:
+        return [entity.id for entity in self.assignees]
+
+
+class NormalizedProjectDetailResponse(ProjectResponse):
+    stages: List[StageResponse] = []
+    tasks: List[NormalizedTaskResponse] = []
+
+    @computed_field
+    @property
+    def entities(self) -> List[EntityResponse]:
+        """Every assignee referenced by the project's tasks, once"""
+        unique = {}
+        for task in self.tasks:
+            for entity in task.assignees:
+                unique.setdefault(entity.id, entity)
+        return list(unique.values())
+
+    class Config:
+        from_attributes = True
+
+
 # Task Detail with subtasks
 class TaskDetailResponse(TaskResponse):
     subtasks: List[TaskResponse] = []
@@ -0,0 +1,269 @@
+"""
+Full-text search over task titles/descriptions and comment contents.
+
+SQLite uses FTS5 external-content tables that triggers keep in sync with
+``tasks`` and ``comments``. PostgreSQL uses GIN expression indexes over
+``to_tsvector``, which the database maintains on its own.
+
+Snippets are HTML: the indexed text is escaped and only the highlight tags
+are markup. Tasks and comments are ranked separately (tasks weigh title
+matches more), so each kind's scores are scaled to its best hit, which
+scores 1.0, before the two are merged.
+"""
+import html
+import logging
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# What the database wraps matches in; control characters, so they survive html.escape()
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+SNIPPET_TOKENS = 12
+
+# Set by build_search_index() or detect_search_index(); search is disabled without the index
+fts_available = False
+
+SQLITE_INDEX_DDL = [
+    # Tasks: only title/description changes touch the index, status updates don't
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description, content='tasks', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    # Comments
+    """CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+        content, content='comments', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_ai AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_ad AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_au AFTER UPDATE OF content ON comments BEGIN
+        INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+POSTGRES_TASK_VECTOR = "to_tsvector('english', coalesce(t.title, '') || ' ' || coalesce(t.description, ''))"
+POSTGRES_COMMENT_VECTOR = "to_tsvector('english', c.content)"
+
+POSTGRES_INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_tasks_fts ON tasks USING GIN ("
+    "(to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, ''))))",
+    "CREATE INDEX IF NOT EXISTS ix_comments_fts ON comments USING GIN ((to_tsvector('english', content)))",
+]
+
+
+def build_search_index(conn: Connection):
+    """Create the full-text index (and sync triggers) for the connected database; used by migrations"""
+    global fts_available
+    dialect = conn.dialect.name
+
+    if dialect == "sqlite":
+        existing = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('tasks_fts', 'comments_fts')")
+        )
+        existing = {row[0] for row in existing}
+        try:
+            for statement in SQLITE_INDEX_DDL:
+                conn.execute(text(statement))
+        except OperationalError as e:
+            logger.warning("FTS5 is not available, search is disabled: %s", e)
+            return
+        # Index rows that were written before the index existed
+        if "tasks_fts" not in existing:
+            conn.execute(text("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')"))
+        if "comments_fts" not in existing:
+            conn.execute(text("INSERT INTO comments_fts(comments_fts) VALUES ('rebuild')"))
+        fts_available = True
+    elif dialect == "postgresql":
+        for statement in POSTGRES_INDEX_DDL:
+            conn.execute(text(statement))
+        fts_available = True
+    else:
+        logger.warning("Full-text search is not supported on %s", dialect)
+
+
+async def create_search_index(conn: AsyncConnection):
+    await conn.run_sync(build_search_index)
+
+
+async def detect_search_index(conn: AsyncConnection):
+    """Turn search on if the index exists, without any DDL (startup on a migrated database)"""
+    global fts_available
+    if conn.dialect.name == "sqlite":
+        result = await conn.execute(
+            text("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN ('tasks_fts', 'comments_fts')")
+        )
+        fts_available = result.scalar() == 2
+    elif conn.dialect.name == "postgresql":
+        result = await conn.execute(
+            text("SELECT count(*) FROM pg_indexes WHERE indexname IN ('ix_tasks_fts', 'ix_comments_fts')")
+        )
+        fts_available = result.scalar() == 2
+    if not fts_available:
+        logger.warning("No full-text index in the database, search is disabled")
+
+
+def query_terms(q: str) -> List[str]:
+    """Split free text into word terms, dropping any query-syntax characters"""
+    return re.findall(r"\w+", q.lower())
+
+
+def _sqlite_match(terms: List[str]) -> str:
+    # Quote every term so user input can never be parsed as FTS5 syntax;
+    # the last term is a prefix match to support search-as-you-type
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _postgres_tsquery(terms: List[str]) -> str:
+    return " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+
+
+async def _search_sqlite(db: AsyncSession, terms: List[str], project_id: Optional[int],
+                         include_tasks: bool, include_comments: bool, limit: int) -> List[dict]:
+    params = {
+        "match": _sqlite_match(terms),
+        "project_id": project_id,
+        "start": _MARK_START,
+        "end": _MARK_END,
+        "tokens": SNIPPET_TOKENS,
+        "limit": limit,
+    }
+    project_filter = "AND t.project_id = :project_id" if project_id is not None else ""
+    hits = []
+
+    if include_tasks:
+        # bm25() is lower-is-better; title matches weigh more than description matches
+        result = await db.execute(text(f"""
+            SELECT t.id, t.id, t.project_id, t.title,
+                   snippet(tasks_fts, -1, :start, :end, '…', :tokens),
+                   -bm25(tasks_fts, 10.0, 1.0) AS score
+            FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH :match {project_filter}
+            ORDER BY bm25(tasks_fts, 10.0, 1.0)
+            LIMIT :limit
+        """), params)
+        hits += [_hit("task", row) for row in result]
+
+    if include_comments:
+        result = await db.execute(text(f"""
+            SELECT c.id, c.task_id, t.project_id, t.title,
+                   snippet(comments_fts, 0, :start, :end, '…', :tokens),
+                   -bm25(comments_fts) AS score
+            FROM comments_fts
+            JOIN comments c ON c.id = comments_fts.rowid
+            JOIN tasks t ON t.id = c.task_id
+            WHERE comments_fts MATCH :match {project_filter}
+            ORDER BY bm25(comments_fts)
+            LIMIT :limit
+        """), params)
+        hits += [_hit("comment", row) for row in result]
+
+    return hits
+
+
+async def _search_postgres(db: AsyncSession, terms: List[str], project_id: Optional[int],
+                           include_tasks: bool, include_comments: bool, limit: int) -> List[dict]:
+    params = {
+        "tsquery": _postgres_tsquery(terms),
+        "project_id": project_id,
+        "headline": f"StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords={SNIPPET_TOKENS}, MinWords=3",
+        "limit": limit,
+    }
+    project_filter = "AND t.project_id = :project_id" if project_id is not None else ""
+    hits = []
+
+    if include_tasks:
+        result = await db.execute(text(f"""
+            SELECT t.id, t.id, t.project_id, t.title,
+                   ts_headline('english', t.title || ' ' || coalesce(t.description, ''), q, :headline),
+                   ts_rank({POSTGRES_TASK_VECTOR}, q) AS score
+            FROM tasks t, to_tsquery('english', :tsquery) q
+            WHERE {POSTGRES_TASK_VECTOR} @@ q {project_filter}
+            ORDER BY score DESC
+            LIMIT :limit
+        """), params)
+        hits += [_hit("task", row) for row in result]
+
+    if include_comments:
+        result = await db.execute(text(f"""
+            SELECT c.id, c.task_id, t.project_id, t.title,
+                   ts_headline('english', c.content, q, :headline),
+                   ts_rank({POSTGRES_COMMENT_VECTOR}, q) AS score
+            FROM comments c JOIN tasks t ON t.id = c.task_id, to_tsquery('english', :tsquery) q
+            WHERE {POSTGRES_COMMENT_VECTOR} @@ q {project_filter}
+            ORDER BY score DESC
+            LIMIT :limit
+        """), params)
+        hits += [_hit("comment", row) for row in result]
+
+    return hits
+
+
+def _snippet(marked: str) -> str:
+    """Escape the indexed text, then turn the database's match markers into highlight tags"""
+    escaped = html.escape(marked or "")
+    return escaped.replace(_MARK_START, HIGHLIGHT_START).replace(_MARK_END, HIGHLIGHT_END)
+
+
+def _hit(kind: str, row) -> dict:
+    return {
+        "kind": kind,
+        "id": row[0],
+        "task_id": row[1],
+        "project_id": row[2],
+        "title": row[3],
+        "snippet": _snippet(row[4]),
+        "score": float(row[5]),
+    }
+
+
+def _normalize_scores(hits: List[dict]):
+    """Scale each kind's scores to its best hit, so differently weighted rankings can be merged"""
+    best = {}
+    for hit in hits:
+        best[hit["kind"]] = max(best.get(hit["kind"], 0.0), hit["score"])
+    for hit in hits:
+        if best[hit["kind"]] > 0:
+            hit["score"] /= best[hit["kind"]]
+
+
+async def search(db: AsyncSession, q: str, project_id: Optional[int] = None,
+                 include_tasks: bool = True, include_comments: bool = True, limit: int = 20) -> List[dict]:
+    """Run a ranked full-text search, best matches first"""
+    terms = query_terms(q)
+    if not terms:
+        return []
+
+    if db.bind.dialect.name == "postgresql":
+        hits = await _search_postgres(db, terms, project_id, include_tasks, include_comments, limit)
+    else:
+        hits = await _search_sqlite(db, terms, project_id, include_tasks, include_comments, limit)
+
+    _normalize_scores(hits)
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits[:limit]
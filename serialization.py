@@ -0,0 +1,147 @@
+"""
+Wire formats.
+
+Responses are JSON unless the client prefers MessagePack (``Accept:
+application/msgpack``) and the ``msgpack`` package (in requirements.txt)
+is installed.
+``WireFormatMiddleware`` reads the Accept header into a context variable,
+and ``NegotiatedResponse``, the app's default response class, renders in
+that format. Every endpoint negotiates without changes. Error responses
+stay JSON.
+
+WebSocket clients opt in with the ``msgpack`` subprotocol and then receive
+binary frames. They may send commands in either format. A broadcast is
+encoded once for each format in use, not once per socket (``encode``).
+"""
+import json
+from contextvars import ContextVar
+from typing import Any, Optional, Union
+
+from fastapi.responses import JSONResponse
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # Optional; JSON only without it
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+_wire_format: ContextVar[str] = ContextVar("wire_format", default="json")
+
+Frame = Union[str, bytes]
+
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    """Whether an Accept header ranks MessagePack at least as high as JSON (and we can send it)"""
+    if msgpack is None or not accept:
+        return False
+    msgpack_quality = json_quality = 0.0
+    for item in accept.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        name = name.strip().lower()
+        if name in MSGPACK_MEDIA_TYPES:
+            msgpack_quality = max(msgpack_quality, quality)
+        elif name in ("application/json", "application/*", "*/*"):
+            json_quality = max(json_quality, quality)
+    return msgpack_quality > 0 and msgpack_quality >= json_quality
+
+
+def negotiated_format() -> str:
+    """The current request's response format: ``json`` or ``msgpack``"""
+    return _wire_format.get()
+
+
+def packb(content: Any) -> bytes:
+    return msgpack.packb(content, use_bin_type=True, default=str)
+
+
+def encode(message: Any, wire_format: str = "json") -> Frame:
+    """A WebSocket frame: compact JSON text, or MessagePack bytes"""
+    if wire_format == "msgpack":
+        return packb(message)
+    # Same output as starlette's send_json
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode(frame: Frame) -> Any:
+    """Parse a client frame; None if it isn't valid JSON or MessagePack"""
+    try:
+        if isinstance(frame, str):
+            return json.loads(frame)
+        if msgpack is not None:
+            return msgpack.unpackb(frame, raw=False)
+    except Exception:  # msgpack raises several unrelated types for bad input
+        return None
+    return None
+
+
+def websocket_format(websocket: WebSocket) -> str:
+    """``msgpack`` when the client offered the msgpack subprotocol and we can speak it"""
+    if msgpack is not None and MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", ()):
+        return "msgpack"
+    return "json"
+
+
+async def receive_frame(websocket: WebSocket) -> Frame:
+    """The next text or binary frame; raises WebSocketDisconnect when the client goes away"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("text") is not None:
+        return message["text"]
+    return message.get("bytes") or b""
+
+
+async def send_frame(websocket: WebSocket, frame: Frame):
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+
+
+class NegotiatedResponse(JSONResponse):
+    """JSON, or MessagePack when the request asked for it"""
+
+    def __init__(self, content: Any, *args, **kwargs):
+        if msgpack is not None and _wire_format.get() == "msgpack":
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, *args, **kwargs)
+        self.headers.add_vary_header("Accept")
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return packb(content)
+        return super().render(content)
+
+
+class WireFormatMiddleware:
+    """ASGI middleware recording each HTTP request's preferred format for NegotiatedResponse"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = None
+        for name, value in scope["headers"]:
+            if name == b"accept":
+                accept = value.decode("latin-1")
+                break
+        token = _wire_format.set("msgpack" if prefers_msgpack(accept) else "json")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _wire_format.reset(token)
@@ -0,0 +1,206 @@
+"""
+Shard status and rebalancing (see database.py for the layout).
+
+    python shards.py status
+    python shards.py move PROJECT_ID SHARD
+    python shards.py rebalance [--dry-run] [--max-moves N]
+
+A move copies the project's rows (stages, tasks, assignments, comments,
+their archived counterparts and the activity log) to the target shard in
+one transaction, then records the new location in ``project_shards`` and
+deletes the source rows in another. Rows keep their ids, except activity
+rows, whose ids are only unique within a shard. An interrupted move can
+simply be run again: the target's partial copy is replaced.
+
+Run it with the app stopped: workers load the directory at startup and keep
+routing by it.
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import (
+    SHARD_COUNT, fan_out, init_db, moved_projects, project_shard, shard_engines, shard_of_id
+)
+from models import (
+    Activity, ActivityField, ArchivedComment, ArchivedTask, Comment, Project, ProjectShard, Stage, Task,
+    archived_task_assignments, task_assignments
+)
+
+MOVE_BATCH_SIZE = 1000
+
+
+def project_rows(project_id: int):
+    """(table, condition) for every row that belongs to the project, parents first"""
+    task_ids = select(Task.id).where(Task.project_id == project_id)
+    archived_ids = select(ArchivedTask.id).where(ArchivedTask.project_id == project_id)
+    return [
+        (Project.__table__, Project.id == project_id),
+        (Stage.__table__, Stage.project_id == project_id),
+        (Task.__table__, Task.project_id == project_id),
+        (task_assignments, task_assignments.c.task_id.in_(task_ids)),
+        (Comment.__table__, Comment.task_id.in_(task_ids)),
+        (ArchivedTask.__table__, ArchivedTask.project_id == project_id),
+        (archived_task_assignments, archived_task_assignments.c.task_id.in_(archived_ids)),
+        (ArchivedComment.__table__, ArchivedComment.task_id.in_(archived_ids)),
+        (Activity.__table__, Activity.project_id == project_id),
+    ]
+
+
+async def field_mapping(source_conn, target_conn) -> Dict[int, int]:
+    """Source activity field id -> target field id, interning missing names in the target"""
+    source = dict((await source_conn.execute(select(ActivityField.id, ActivityField.name))).all())
+    target = dict((await target_conn.execute(select(ActivityField.name, ActivityField.id))).all())
+    missing = [{"name": name} for name in source.values() if name not in target]
+    if missing:
+        await target_conn.execute(insert(ActivityField), missing)
+        target = dict((await target_conn.execute(select(ActivityField.name, ActivityField.id))).all())
+    return {field_id: target[name] for field_id, name in source.items()}
+
+
+async def project_sizes() -> List[Dict[int, int]]:
+    """Live tasks per project, for each shard"""
+    async def sizes(db) -> Dict[int, int]:
+        projects = dict.fromkeys((await db.execute(select(Project.id))).scalars(), 0)
+        result = await db.execute(select(Task.project_id, func.count()).group_by(Task.project_id))
+        projects.update((project_id, count) for project_id, count in result if project_id in projects)
+        return projects
+
+    return await fan_out(sizes)
+
+
+async def move_project(project_id: int, target: int) -> Dict[str, int]:
+    """Move a project and everything in it to shard ``target``; returns rows copied per table"""
+    source = project_shard(project_id)
+    if source == target:
+        return {}
+    rows = project_rows(project_id)
+    copied = {}
+
+    async with shard_engines[source].connect() as source_conn, shard_engines[target].begin() as target_conn:
+        if not (await source_conn.execute(select(Project.id).where(Project.id == project_id))).first():
+            raise SystemExit(f"Project {project_id} is not in shard {source}")
+        # Children first, so the conditions still find the tasks whose rows they remove
+        for table, condition in reversed(rows):
+            await target_conn.execute(delete(table).where(condition))
+        for table, condition in rows:
+            result = await source_conn.execute(select(table).where(condition))
+            records = [dict(row) for row in result.mappings()]
+            if table is Activity.__table__:
+                fields = await field_mapping(source_conn, target_conn)
+                for record in records:
+                    del record["id"]
+                    record["field_id"] = fields.get(record["field_id"])
+            for start in range(0, len(records), MOVE_BATCH_SIZE):
+                await target_conn.execute(table.insert(), records[start:start + MOVE_BATCH_SIZE])
+            copied[table.name] = len(records)
+
+    # The main database is attached to the source shard (or is it), so the new location and the
+    # removal of the source rows share one transaction (atomic per database file, as for jobs)
+    async with shard_engines[source].begin() as conn:
+        if target == shard_of_id(project_id):
+            await conn.execute(delete(ProjectShard).where(ProjectShard.project_id == project_id))
+        else:
+            statement = sqlite_insert(ProjectShard).values(
+                project_id=project_id, shard=target, moved_at=datetime.utcnow()
+            )
+            await conn.execute(statement.on_conflict_do_update(
+                index_elements=[ProjectShard.project_id],
+                set_={"shard": target, "moved_at": statement.excluded.moved_at}
+            ))
+        for table, condition in reversed(rows):
+            await conn.execute(delete(table).where(condition))
+
+    if target == shard_of_id(project_id):
+        moved_projects.pop(project_id, None)
+    else:
+        moved_projects[project_id] = target
+    return copied
+
+
+def plan_rebalance(sizes: List[Dict[int, int]], max_moves: int = 100) -> List[Tuple[int, int, int]]:
+    """
+    Greedy plan evening out live tasks per shard: repeatedly move the largest
+    project from the fullest shard to the emptiest one that narrows the gap.
+    Returns (project_id, source, target) moves.
+    """
+    sizes = [dict(shard) for shard in sizes]
+    totals = [sum(shard.values()) for shard in sizes]
+    moves = []
+    while len(moves) < max_moves:
+        fullest = max(range(len(sizes)), key=totals.__getitem__)
+        emptiest = min(range(len(sizes)), key=totals.__getitem__)
+        gap = totals[fullest] - totals[emptiest]
+        # A project bigger than half the gap would only swap which shard is fuller
+        candidates = [(size, project_id) for project_id, size in sizes[fullest].items() if 0 < size <= gap // 2]
+        if not candidates:
+            break
+        size, project_id = max(candidates)
+        del sizes[fullest][project_id]
+        sizes[emptiest][project_id] = size
+        totals[fullest] -= size
+        totals[emptiest] += size
+        moves.append((project_id, fullest, emptiest))
+    return moves
+
+
+async def command_status(args):
+    for shard, sizes in enumerate(await project_sizes()):
+        print(f"shard {shard:3}  projects {len(sizes):7}  tasks {sum(sizes.values()):10}")
+    if moved_projects:
+        print(f"{len(moved_projects)} projects live outside the shard of their id")
+
+
+async def command_move(args):
+    if not 0 <= args.shard < SHARD_COUNT:
+        raise SystemExit(f"Shard must be between 0 and {SHARD_COUNT - 1}")
+    copied = await move_project(args.project_id, args.shard)
+    print(f"Moved project {args.project_id} to shard {args.shard}: {copied}" if copied else "Already there")
+
+
+async def command_rebalance(args):
+    moves = plan_rebalance(await project_sizes(), args.max_moves)
+    for project_id, source, target in moves:
+        print(f"project {project_id}: shard {source} -> {target}")
+        if not args.dry_run:
+            await move_project(project_id, target)
+    if not moves:
+        print("Shards are balanced")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python shards.py", description="Inspect and rebalance project shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Projects and tasks per shard")
+    move_parser = commands.add_parser("move", help="Move one project to another shard")
+    move_parser.add_argument("project_id", type=int)
+    move_parser.add_argument("shard", type=int)
+    rebalance_parser = commands.add_parser("rebalance", help="Move projects until shards hold similar task counts")
+    rebalance_parser.add_argument("--dry-run", action="store_true", help="Only print the planned moves")
+    rebalance_parser.add_argument("--max-moves", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if SHARD_COUNT < 2:
+        raise SystemExit("Sharding is off; set SHARD_COUNT")
+    command = {"status": command_status, "move": command_move, "rebalance": command_rebalance}[args.command]
+
+    async def run():
+        # Migrates the shards and loads the directory
+        await init_db()
+        try:
+            await command(args)
+        finally:
+            for engine in shard_engines:
+                await engine.dispose()
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Startup phases and warm-up.
+
+``startup_event`` times each of its phases (``with startup.phase(name)``),
+so a slow boot shows where the time went: in the log, in the
+``startup_phase_seconds`` gauge and in ``python -m benchmarks
+--check-startup``.
+
+A fresh worker pays for its first requests: empty connection pool,
+templates not compiled, project detail cache cold. Warm-up runs after the
+schema check and before the worker serves: it opens WARMUP_CONNECTIONS pool
+connections, then runs each function registered with ``@startup.hook``.
+The whole warm-up is bounded by WARMUP_TIMEOUT_SECONDS, and a failing hook
+is logged and skipped, since a cold worker is better than none.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import AsyncExitStack, contextmanager
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "5"))
+WARMUP_PROJECTS = int(os.getenv("WARMUP_PROJECTS", "20"))
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "10"))
+
+Hook = Callable[[], Awaitable[None]]
+
+
+class Startup:
+    """Phase timings of the last startup, and the warm-up hooks"""
+
+    def __init__(self):
+        self.hooks: List[Hook] = []
+        # Phase (or warmup:<hook>) -> seconds
+        self.timings: Dict[str, float] = {}
+
+    def hook(self, fn: Hook) -> Hook:
+        """Register a warm-up function (a decorator)"""
+        self.hooks.append(fn)
+        return fn
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    async def _prime_pool(self, engine: AsyncEngine, connections: int):
+        """Open pool connections and return them to the pool; held together so each one is new"""
+        pool_size = getattr(engine.pool, "size", None)
+        if pool_size is not None:
+            connections = min(connections, pool_size())
+        async with AsyncExitStack() as stack:
+            for _ in range(connections):
+                conn = await stack.enter_async_context(engine.connect())
+                await conn.execute(text("SELECT 1"))
+
+    async def _run_hooks(self, engine: AsyncEngine, connections: int):
+        with self.phase("warmup:pool"):
+            await self._prime_pool(engine, connections)
+        for hook in self.hooks:
+            with self.phase(f"warmup:{hook.__name__}"):
+                try:
+                    await hook()
+                except Exception:
+                    logger.warning("Warm-up hook %s failed", hook.__name__, exc_info=True)
+
+    async def warm_up(self, engine: AsyncEngine, connections: int = WARMUP_CONNECTIONS,
+                      timeout: float = WARMUP_TIMEOUT_SECONDS):
+        try:
+            await asyncio.wait_for(self._run_hooks(engine, connections), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Warm-up did not finish within %ss, serving anyway", timeout)
+
+    def report(self) -> str:
+        return ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.timings.items())
+
+
+# Global instance
+startup = Startup()
+
+registry.gauge(
+    "startup_phase_seconds", "Time spent in each phase of this worker's startup", ("phase",),
+    callback=lambda: [((name,), seconds) for name, seconds in startup.timings.items()]
+)
@@ -0,0 +1,424 @@
+// Live kanban board: keeps the server-rendered board current from WebSocket deltas,
+// and loads the rest of each column page by page as it is scrolled
+(function() {
+    'use strict';
+
+    const board = document.querySelector('.kanban-board[data-project-id]');
+    if (!board) return;
+
+    // Tells main.js not to start the periodic full refresh
+    window.liveBoard = true;
+
+    const projectId = Number(board.dataset.projectId);
+    const columns = new Map();   // stage id -> column element
+    const cards = new Map();     // task id -> card element (only loaded cards)
+    const counts = new Map();    // stage id -> tasks in the stage, loaded or not
+    const entities = new Map();  // entity id -> {id, name, entity_type}
+    const deleted = new Set();   // task ids deleted since the last delta
+
+    // Changes wait here until the next animation frame; only the latest state of each row is kept
+    const pendingStages = new Map();  // stage id -> stage, or null to remove
+    const pendingTasks = new Map();   // task id -> task, or null to remove
+    let frameRequested = false;
+
+    let socket = null;
+    let serverTime = board.dataset.serverTime;
+    let synced = false;
+    let buffered = [];
+    let retries = 0;
+    let resyncTimer = null;
+
+    const loader = new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            if (entry.isIntersecting) loadMore(entry.target.closest('.kanban-column'));
+        });
+    }, { rootMargin: '400px' });
+
+    board.querySelectorAll('.kanban-column[data-stage-id]').forEach(function(column) {
+        const stageId = Number(column.dataset.stageId);
+        columns.set(stageId, column);
+        counts.set(stageId, Number(column.querySelector('.kanban-count').textContent));
+        watchColumn(column);
+    });
+    board.querySelectorAll('.kanban-task[data-task-id]').forEach(function(card) {
+        cards.set(Number(card.dataset.taskId), card);
+    });
+
+    function el(tag, className, text) {
+        const node = document.createElement(tag);
+        if (className) node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    }
+
+    // Mirrors the card markup in kanban_board.html
+    function fillCard(card, task) {
+        const parts = [];
+
+        const title = el('div', 'mb-2');
+        title.appendChild(el('strong', null, task.title));
+        parts.push(title);
+
+        const badges = el('div', 'mb-2');
+        badges.appendChild(el('span', 'badge badge-' + task.status, task.status));
+        if (task.priority > 5) {
+            badges.appendChild(document.createTextNode(' '));
+            badges.appendChild(el('span', 'badge badge-warning', 'High Priority'));
+        }
+        parts.push(badges);
+
+        if (task.description) {
+            const description = el('div', 'mb-2 text-secondary');
+            const text = task.description.length > 60 ? task.description.slice(0, 60) + '...' : task.description;
+            description.appendChild(el('small', null, text));
+            parts.push(description);
+        }
+
+        const assignees = task.assignee_ids.map(function(id) { return entities.get(id); }).filter(Boolean);
+        if (assignees.length) {
+            const list = el('div', 'mb-2');
+            const label = el('small');
+            label.appendChild(el('strong', null, 'Assigned to:'));
+            list.appendChild(label);
+            list.appendChild(el('br'));
+            assignees.forEach(function(entity) {
+                list.appendChild(el('span', 'badge badge-' + entity.entity_type, entity.name));
+                list.appendChild(document.createTextNode(' '));
+            });
+            parts.push(list);
+        }
+
+        if (task.required_skills) {
+            const skills = el('div');
+            const small = el('small');
+            small.appendChild(el('strong', null, 'Skills:'));
+            small.appendChild(document.createTextNode(' ' + task.required_skills));
+            skills.appendChild(small);
+            parts.push(skills);
+        }
+
+        card.replaceChildren.apply(card, parts);
+        card.dataset.version = task.version;
+    }
+
+    // ---- Columns and paging ----
+
+    function createColumn(stage, complete) {
+        const column = el('div', 'kanban-column');
+        column.dataset.stageId = stage.id;
+        column.dataset.lastId = 0;
+        column.dataset.complete = complete ? 'true' : 'false';
+        const header = el('div', 'kanban-column-header');
+        header.appendChild(el('span', 'kanban-stage-name', stage.name));
+        header.appendChild(document.createTextNode(' '));
+        header.appendChild(el('span', 'badge kanban-count', '0'));
+        column.appendChild(header);
+        column.appendChild(el('div', 'kanban-cards'));
+        const more = el('button', 'btn kanban-more', 'Load more');
+        more.type = 'button';
+        column.appendChild(more);
+        const empty = el('div', 'text-center text-secondary kanban-empty');
+        empty.style.padding = '2rem';
+        empty.appendChild(el('small', null, 'No tasks in this stage'));
+        column.appendChild(empty);
+        watchColumn(column);
+        return column;
+    }
+
+    function watchColumn(column) {
+        const more = column.querySelector('.kanban-more');
+        more.addEventListener('click', function() { loadMore(column); });
+        loader.observe(more);
+    }
+
+    // Cards are kept in id order; a column holds every card up to its last loaded id
+    function inWindow(column, taskId) {
+        return column.dataset.complete === 'true' || taskId <= Number(column.dataset.lastId);
+    }
+
+    function insertCard(column, card, taskId) {
+        const container = column.querySelector('.kanban-cards');
+        let next = null;
+        // New tasks have the highest ids, so search from the end
+        for (let node = container.lastElementChild; node; node = node.previousElementSibling) {
+            if (Number(node.dataset.taskId) < taskId) break;
+            next = node;
+        }
+        container.insertBefore(card, next);
+    }
+
+    function loadMore(column) {
+        if (!column || !column.isConnected || column.dataset.complete === 'true' || column.dataset.loading) return;
+        column.dataset.loading = 'true';
+        const url = '/ui/projects/' + projectId + '/stages/' + column.dataset.stageId +
+            '/cards?after=' + column.dataset.lastId;
+        fetch(url)
+            .then(function(response) {
+                if (!response.ok) throw new Error('HTTP ' + response.status);
+                return response.json();
+            })
+            .then(function(page) {
+                addEntities(page.entities);
+                if (page.tasks.length) column.dataset.lastId = page.tasks[page.tasks.length - 1].id;
+                if (page.next_after === null) column.dataset.complete = 'true';
+                page.tasks.forEach(queueTask);
+                schedule();
+            })
+            .catch(function(error) {
+                console.warn('Loading board cards failed', error);
+            })
+            .finally(function() {
+                delete column.dataset.loading;
+                // Re-observing reports the sentinel again if it is still in view after this page
+                const more = column.querySelector('.kanban-more');
+                loader.unobserve(more);
+                if (column.dataset.complete !== 'true') loader.observe(more);
+            });
+    }
+
+    function placeColumn(column, stage) {
+        column.dataset.order = stage.order;
+        let before = null;
+        for (const other of columns.values()) {
+            if (other !== column && Number(other.dataset.order) > stage.order &&
+                (!before || Number(other.dataset.order) < Number(before.dataset.order))) {
+                before = other;
+            }
+        }
+        board.insertBefore(column, before);
+    }
+
+    // ---- Applying changes ----
+
+    function applyStage(id, stage) {
+        let column = columns.get(id);
+        if (stage === null) {
+            if (!column) return;
+            // The stage's tasks are kept without a stage, so they leave the board
+            column.querySelectorAll('.kanban-task[data-task-id]').forEach(function(card) {
+                cards.delete(Number(card.dataset.taskId));
+            });
+            loader.unobserve(column.querySelector('.kanban-more'));
+            column.remove();
+            columns.delete(id);
+            counts.delete(id);
+            return;
+        }
+        if (!column) {
+            // A stage created while this board was open starts empty; one found in a delta may not be
+            column = createColumn(stage, !stage.task_count);
+            columns.set(id, column);
+            placeColumn(column, stage);
+        } else {
+            column.querySelector('.kanban-stage-name').textContent = stage.name;
+            if (Number(column.dataset.order) !== stage.order) placeColumn(column, stage);
+        }
+    }
+
+    function applyTask(id, task) {
+        let card = cards.get(id);
+        const column = task === null ? null : columns.get(task.stage_id);
+        if (!column || !inWindow(column, id)) {
+            // Removed, without a stage, or not loaded yet: it arrives with its page
+            if (card) card.remove();
+            cards.delete(id);
+            return;
+        }
+        if (!card) {
+            card = el('div', 'kanban-task');
+            card.dataset.taskId = id;
+            cards.set(id, card);
+        } else if (Number(card.dataset.version) === task.version && card.closest('.kanban-column') === column) {
+            return;
+        }
+        fillCard(card, task);
+        if (card.closest('.kanban-column') !== column) insertCard(column, card, id);
+    }
+
+    function flush() {
+        frameRequested = false;
+        pendingStages.forEach(function(stage, id) { applyStage(id, stage); });
+        pendingStages.clear();
+        pendingTasks.forEach(function(task, id) { applyTask(id, task); });
+        pendingTasks.clear();
+        columns.forEach(function(column, id) {
+            const count = counts.get(id) || 0;
+            column.querySelector('.kanban-count').textContent = count;
+            column.querySelector('.kanban-empty').hidden = count > 0;
+            column.querySelector('.kanban-more').hidden = column.dataset.complete === 'true';
+        });
+    }
+
+    function schedule() {
+        if (!frameRequested) {
+            frameRequested = true;
+            requestAnimationFrame(flush);
+        }
+    }
+
+    function queueTask(task) {
+        if (deleted.has(task.id)) return;
+        const queued = pendingTasks.get(task.id);
+        const card = cards.get(task.id);
+        const known = queued ? queued.version : (card ? Number(card.dataset.version) : -1);
+        // Ignore anything older than what the board already has
+        if (task.version >= known) {
+            pendingTasks.set(task.id, task);
+            schedule();
+        }
+    }
+
+    // Stage a task was in before this change, as far as this board can tell
+    function currentStage(taskId) {
+        const queued = pendingTasks.get(taskId);
+        if (queued) return queued.stage_id;
+        const card = cards.get(taskId);
+        return card ? Number(card.closest('.kanban-column').dataset.stageId) : undefined;
+    }
+
+    function countMove(from, to) {
+        if (from === to) return;
+        if (from !== null && from !== undefined && counts.has(from)) counts.set(from, counts.get(from) - 1);
+        if (to !== null && to !== undefined && counts.has(to)) counts.set(to, counts.get(to) + 1);
+    }
+
+    function addEntities(list) {
+        (list || []).forEach(function(entity) { entities.set(entity.id, entity); });
+    }
+
+    function applyState(message) {
+        addEntities(message.entities);
+        deleted.clear();
+
+        const stageIds = new Set();
+        message.stages.forEach(function(stage) {
+            stageIds.add(stage.id);
+            counts.set(stage.id, stage.task_count);
+            pendingStages.set(stage.id, stage);
+        });
+        columns.forEach(function(column, id) {
+            if (!stageIds.has(id)) pendingStages.set(id, null);
+        });
+
+        message.tasks.forEach(queueTask);
+        let gone = message.deleted || [];
+        if (message.type === 'snapshot' || message.task_ids) {
+            const live = new Set(message.task_ids || message.tasks.map(function(task) { return task.id; }));
+            gone = Array.from(cards.keys()).filter(function(id) { return !live.has(id); });
+        }
+        gone.forEach(function(id) { pendingTasks.set(id, null); });
+        schedule();
+
+        serverTime = message.server_time;
+        synced = true;
+        // Events that arrived while the state was being read; its counts already include the older ones
+        const replay = buffered;
+        buffered = [];
+        replay.forEach(function(event) { applyEvent(event, event.timestamp > message.server_time); });
+    }
+
+    function resync() {
+        if (!socket || socket.readyState !== WebSocket.OPEN) return;
+        synced = false;
+        socket.send(JSON.stringify({ type: 'resync', since: serverTime, known: Array.from(cards.keys()) }));
+    }
+
+    function requestResync() {
+        if (resyncTimer) return;
+        // Spread out the requests from every open board
+        resyncTimer = setTimeout(function() {
+            resyncTimer = null;
+            resync();
+        }, 250 + Math.random() * 750);
+    }
+
+    function applyEvent(message, adjustCounts) {
+        const data = message.data || {};
+        switch (message.event_type) {
+            case 'task_created':
+                addEntities(data.entities);
+                if (adjustCounts) countMove(undefined, data.task.stage_id);
+                queueTask(data.task);
+                break;
+            case 'task_updated': {
+                addEntities(data.entities);
+                let from = currentStage(data.task.id);
+                if (from === undefined) from = 'previous_stage_id' in data ? data.previous_stage_id : data.task.stage_id;
+                if (adjustCounts) countMove(from, data.task.stage_id);
+                queueTask(data.task);
+                break;
+            }
+            case 'task_deleted': {
+                const from = currentStage(data.id);
+                if (adjustCounts && !deleted.has(data.id)) countMove(from === undefined ? data.stage_id : from, undefined);
+                deleted.add(data.id);
+                pendingTasks.set(data.id, null);
+                schedule();
+                break;
+            }
+            case 'stage_created':
+            case 'stage_updated':
+                if (!counts.has(data.stage.id)) counts.set(data.stage.id, 0);
+                pendingStages.set(data.stage.id, data.stage);
+                schedule();
+                break;
+            case 'stage_deleted':
+                counts.delete(data.id);
+                pendingStages.set(data.id, null);
+                schedule();
+                break;
+            case 'tasks_changed':
+            case 'tasks_imported':
+                requestResync();
+                break;
+            case 'project_deleted':
+                if (data.id === projectId) window.location.href = '/ui/projects';
+                return;
+            default:
+                return;
+        }
+        if (message.timestamp && message.project_id === projectId) serverTime = message.timestamp;
+    }
+
+    function onMessage(event) {
+        const message = JSON.parse(event.data);
+        if (message.type === 'ping') {
+            socket.send(JSON.stringify({ type: 'pong' }));
+        } else if (message.type === 'snapshot' || message.type === 'delta') {
+            applyState(message);
+        } else if (message.event_type) {
+            if (synced) applyEvent(message, true);
+            else buffered.push(message);
+        }
+    }
+
+    function connect() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        // No snapshot: the page (or what this board already shows) is the starting point,
+        // and the resync sent on open brings it up to date
+        const url = protocol + '//' + window.location.host + '/ws/projects/' + projectId + '?initial=false';
+
+        synced = false;
+        buffered = [];
+        socket = new WebSocket(url);
+        socket.addEventListener('open', function() {
+            retries = 0;
+            // Authenticate in the first frame rather than in the URL, which ends up in access logs
+            socket.send(JSON.stringify({ type: 'auth', token: board.dataset.wsToken }));
+            resync();
+        });
+        socket.addEventListener('message', onMessage);
+        socket.addEventListener('close', function(event) {
+            socket = null;
+            // Rejected: the page's token has expired, and reloading gets a new one
+            if (event.code === 1008) {
+                window.location.reload();
+                return;
+            }
+            const delay = Math.min(30000, 1000 * Math.pow(2, retries++));
+            setTimeout(connect, delay / 2 + Math.random() * delay / 2);
+        });
+    }
+
+    connect();
+})();
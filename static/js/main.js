@@ -70,8 +70,8 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Auto-refresh data every 30 seconds
-    if (typeof window.refreshData === 'function') {
+    // Auto-refresh data every 30 seconds (live boards are kept current over their WebSocket instead)
+    if (typeof window.refreshData === 'function' && !window.liveBoard) {
         setInterval(window.refreshData, 30000);
     }
 });
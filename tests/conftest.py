@@ -0,0 +1,99 @@
+"""
+Shared fixtures: one app instance on a scratch SQLite database for the whole
+run, with rate limiting and warm-up off and a short job poll interval.
+"""
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIRECTORY = tempfile.mkdtemp(prefix="kanban-tests-")
+
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(DATA_DIRECTORY, 'kanban.db')}")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+os.environ.setdefault("JOB_POLL_SECONDS", "0.05")
+# Per-request statement counts in X-SQL-Profile, for the query budget tests
+os.environ.setdefault("SQL_PROFILING", "true")
+sys.path.insert(0, ROOT)
+# The app serves static/ and templates/ relative to the working directory
+os.chdir(ROOT)
+
+_names = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def register_agent(client, skills: str = "python") -> dict:
+    """A new agent's id and X-API-Key headers"""
+    response = client.post("/entities/register/agent", json={
+        "name": f"agent-{next(_names)}", "entity_type": "agent", "skills": skills,
+    })
+    assert response.status_code == 201, response.text
+    return {"id": response.json()["id"], "headers": {"X-API-Key": response.json()["api_key"]}}
+
+
+@pytest.fixture(scope="session")
+def agent(client):
+    """A registered agent; tests authenticate with API keys, which skip password hashing"""
+    return register_agent(client)
+
+
+def create_project(client, headers) -> dict:
+    """An approved project, with its default stages"""
+    # The dashboard template expects a description
+    response = client.post("/projects", headers=headers, json={"name": f"project-{next(_names)}", "description": "test"})
+    assert response.status_code == 201, response.text
+    project_id = response.json()["id"]
+    response = client.patch(f"/projects/{project_id}", headers=headers, json={"approval_status": "approved"})
+    assert response.status_code == 200, response.text
+    response = client.get(f"/projects/{project_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def sql_profile(response) -> dict:
+    """The request's X-SQL-Profile header, e.g. {"queries": 3, "time_ms": 1.2, "n_plus_one": 0}"""
+    fields = (field.split("=") for field in response.headers["x-sql-profile"].split("; "))
+    return {name: float(value) if "." in value else int(value) for name, value in fields}
+
+
+def query_count(response) -> int:
+    """Statements the request executed"""
+    return sql_profile(response)["queries"]
+
+
+async def scratch_engine(name: str):
+    """An engine on a new SQLite file with the app's tables, shared ones included"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from benchmarks.seed import SHARED_TABLES_IN_DATABASE
+    from models import Base
+
+    path = os.path.join(tempfile.mkdtemp(prefix="kanban-scratch-"), f"{name}.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", execution_options=SHARED_TABLES_IN_DATABASE)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+def wait_for_job(client, headers, job_id: int, timeout: float = 10) -> dict:
+    """Poll a background job until it finishes"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        assert time.monotonic() < deadline, f"job {job_id} still {job['status']}"
+        time.sleep(0.05)
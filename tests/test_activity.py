@@ -0,0 +1,103 @@
+import asyncio
+import os
+import tempfile
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.seed import SHARED_TABLES_IN_DATABASE
+
+
+async def scratch_engine(name: str, fields=()):
+    from models import ActivityField, Base
+
+    path = os.path.join(tempfile.mkdtemp(prefix="kanban-activity-"), f"{name}.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", execution_options=SHARED_TABLES_IN_DATABASE)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        if fields:
+            await conn.execute(insert(ActivityField), [{"name": name} for name in fields])
+    return engine
+
+
+def test_field_ids_interns_new_names():
+    from activity import field_ids
+
+    async def run():
+        engine = await scratch_engine("fields", ["title"])
+        try:
+            async with async_sessionmaker(engine)() as db:
+                ids = await field_ids(db, {"title", "brand_new"})
+                await db.commit()
+            assert ids["title"] == 1 and ids["brand_new"] == 2
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_field_mapping_interns_only_missing_names():
+    from models import ActivityField
+    from shards import field_mapping
+
+    async def run():
+        source = await scratch_engine("source", ["title", "status", "custom"])
+        target = await scratch_engine("target", ["status", "other"])
+        try:
+            async with source.connect() as source_conn, target.begin() as target_conn:
+                mapping = await field_mapping(source_conn, target_conn)
+                names = dict((await target_conn.execute(select(ActivityField.id, ActivityField.name))).all())
+            assert sorted(names.values()) == ["custom", "other", "status", "title"]
+            assert {field_id: names[target_id] for field_id, target_id in mapping.items()} == {
+                1: "title", 2: "status", 3: "custom"
+            }
+        finally:
+            await source.dispose()
+            await target.dispose()
+
+    asyncio.run(run())
+
+
+def test_values_are_json_with_iso_datetimes():
+    from datetime import datetime
+
+    from activity import decode, encode
+    from models import TaskStatus
+
+    completed = datetime(2026, 10, 19, 12, 30, 5, 250000)
+    assert encode(completed) == '"2026-10-19T12:30:05.250000"'
+    assert datetime.fromisoformat(decode(encode(completed))) == completed
+    assert decode(encode(TaskStatus.COMPLETED)) == "completed"
+    assert encode(None) is None
+
+
+def test_postgres_update_returns_old_values_from_a_locked_cte():
+    from sqlalchemy.dialects import postgresql
+
+    from activity import update_returning_old
+    from models import Task
+
+    statement = update_returning_old(Task, 7, ["title", "status"], {"title": "new", "status": "completed"}, 3)
+    sql = " ".join(str(statement.compile(dialect=postgresql.dialect())).split())
+    assert sql.startswith('WITH "old" AS (SELECT tasks.id AS id, tasks.title AS title, tasks.status AS status')
+    assert 'FOR UPDATE) UPDATE tasks SET' in sql
+    assert 'FROM "old" WHERE tasks.id = "old".id AND tasks.version =' in sql
+    assert sql.endswith('"old".title AS title_1, "old".status AS status_1')
+
+
+def test_tracked_update_records_old_and_new_values(client, agent):
+    from datetime import datetime
+
+    from conftest import create_project
+
+    project = create_project(client, agent["headers"])
+    task = client.post("/tasks", headers=agent["headers"], json={"title": "before", "project_id": project["id"]}).json()
+    response = client.patch(f"/tasks/{task['id']}", headers=agent["headers"], json={"title": "after", "status": "completed"})
+    assert response.status_code == 200, response.text
+
+    events = client.get(f"/tasks/{task['id']}/activity", headers=agent["headers"]).json()
+    changes = {event["field"]: (event["old_value"], event["new_value"]) for event in events if event["action"] == "updated"}
+    assert changes["title"] == ("before", "after")
+    assert changes["status"] == ("pending", "completed")
+    assert changes["completed_at"][0] is None
+    datetime.fromisoformat(changes["completed_at"][1])
@@ -0,0 +1,55 @@
+import httpx
+import pytest
+
+from agent_sdk import AgentAPIError, AgentClient, _AgentEndpoints
+
+
+def flaky_client(statuses):
+    """A client whose requests get ``statuses`` in turn; returns it and the list of requests made"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(statuses[min(len(requests), len(statuses)) - 1], json={"id": 1, "version": 2})
+
+    client = AgentClient("http://kanban", "key", backoff=0, transport=httpx.MockTransport(handler), use_msgpack=False)
+    return client, requests
+
+
+def test_endpoints_need_a_call_implementation():
+    with pytest.raises(TypeError):
+        _AgentEndpoints()
+
+
+def test_patch_is_not_retried_after_gateway_error():
+    client, requests = flaky_client([502, 200])
+    with pytest.raises(AgentAPIError):
+        client.update_task_status(1, "in_progress")
+    assert len(requests) == 1
+
+
+def test_conditional_patch_is_retried_after_gateway_error():
+    client, requests = flaky_client([502, 200])
+    assert client.update_task_status(1, "in_progress", expected_version=1) == {"id": 1, "version": 2}
+    assert len(requests) == 2 and requests[-1].headers["if-match"] == '"1"'
+
+
+def test_rate_limited_patch_is_retried():
+    client, requests = flaky_client([429, 200])
+    client.update_task_status(1, "in_progress")
+    assert len(requests) == 2
+
+
+def test_msgpack_is_the_default():
+    import msgpack
+
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, content=msgpack.packb({"id": 7}), headers={"Content-Type": "application/msgpack"})
+
+    client = AgentClient("http://kanban", "key", transport=httpx.MockTransport(handler))
+    assert client.use_msgpack
+    assert client.get_profile() == {"id": 7}
+    assert requests[0].headers["accept"].startswith("application/msgpack")
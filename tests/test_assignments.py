@@ -0,0 +1,92 @@
+"""
+Database round trips per assignment endpoint (see the X-SQL-Profile header).
+Every request starts with the API key lookup.
+"""
+import pytest
+
+from conftest import create_project, query_count, register_agent
+
+
+@pytest.fixture
+def board(client, agent):
+    """A task, with the calling agent and another one to assign; the auth cache is warm"""
+    project = create_project(client, agent["headers"])
+    task = client.post("/tasks", headers=agent["headers"], json={"title": "assign me", "project_id": project["id"]})
+    assert task.status_code == 201, task.text
+    other = register_agent(client)
+    client.get("/entities/me", headers=other["headers"])
+    return {"project": project, "task_id": task.json()["id"], "other": other}
+
+
+def assignee_ids(response):
+    task = response.json().get("task", response.json())
+    return sorted(entity["id"] for entity in task["assignees"])
+
+
+def test_assign_round_trips(client, agent, board):
+    task_id, other_id = board["task_id"], board["other"]["id"]
+    response = client.post(f"/tasks/{task_id}/assign", headers=agent["headers"], params={"entity_id": other_id})
+    assert response.status_code == 200, response.text
+    # auth, insert-select, versioned update, assignees, field ids (until cached), activity
+    assert query_count(response) <= 6
+    assert assignee_ids(response) == [other_id]
+
+    response = client.post(f"/tasks/{task_id}/assign", headers=agent["headers"], params={"entity_id": other_id})
+    assert response.status_code == 200, response.text
+    assert query_count(response) <= 4
+    assert assignee_ids(response) == [other_id]
+
+
+def test_assign_unknown_entity_is_404(client, agent, board):
+    response = client.post(f"/tasks/{board['task_id']}/assign", headers=agent["headers"], params={"entity_id": 10 ** 9})
+    assert response.status_code == 404
+    assert query_count(response) <= 4
+
+
+def test_self_assign_round_trips(client, agent, board):
+    response = client.post(f"/tasks/{board['task_id']}/self-assign", headers=agent["headers"])
+    assert response.status_code == 200, response.text
+    assert query_count(response) <= 5
+    assert assignee_ids(response) == [agent["id"]]
+
+
+def test_unassign_round_trips(client, agent, board):
+    task_id, other_id = board["task_id"], board["other"]["id"]
+    client.post(f"/tasks/{task_id}/assign", headers=agent["headers"], params={"entity_id": other_id})
+    response = client.delete(f"/tasks/{task_id}/unassign/{other_id}", headers=agent["headers"])
+    assert response.status_code == 200, response.text
+    assert query_count(response) <= 5
+    assert assignee_ids(response) == []
+
+
+def test_transition_round_trips(client, agent, board):
+    task_id, other_id = board["task_id"], board["other"]["id"]
+    stage_id = board["project"]["stages"][2]["id"]
+    response = client.post(f"/tasks/{task_id}/transition", headers=agent["headers"], json={
+        "status": "in_progress", "stage_id": stage_id, "assign": [agent["id"], other_id], "comment": "starting",
+    })
+    assert response.status_code == 200, response.text
+    # auth, stage lookup, old values, update, field ids, activity x2, assignments, comment id and insert, assignees
+    assert query_count(response) <= 11
+    assert assignee_ids(response) == sorted([agent["id"], other_id])
+
+    response = client.post(f"/tasks/{task_id}/transition", headers=agent["headers"], json={"release": True})
+    assert response.status_code == 200, response.text
+    assert query_count(response) <= 5
+    assert assignee_ids(response) == [other_id]
+
+
+def test_stage_must_belong_to_the_task_project(client, agent, board):
+    headers = agent["headers"]
+    task_id = board["task_id"]
+    foreign_stage_id = create_project(client, headers)["stages"][0]["id"]
+
+    response = client.post(f"/tasks/{task_id}/transition", headers=headers, json={"stage_id": foreign_stage_id})
+    assert response.status_code == 404
+    response = client.patch(f"/tasks/{task_id}", headers=headers, json={"stage_id": foreign_stage_id})
+    assert response.status_code == 404
+    response = client.post("/tasks", headers=headers, json={
+        "title": "misplaced", "project_id": board["project"]["id"], "stage_id": foreign_stage_id,
+    })
+    assert response.status_code == 404
+    assert client.get(f"/tasks/{task_id}", headers=headers).json()["stage_id"] is None
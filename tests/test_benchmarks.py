@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+
+from conftest import create_project
+
+
+def test_occ_and_serialized_contention_report_applied_updates(client, agent):
+    import main
+    from benchmarks.scenarios import SCENARIOS, applied_throughput, run_scenario
+
+    project = create_project(client, agent["headers"])
+    task_ids = [
+        client.post("/tasks", headers=agent["headers"], json={"title": f"hot {i}", "project_id": project["id"]}).json()["id"]
+        for i in range(3)
+    ]
+    ctx = {"open_task_ids": task_ids, "api_keys": [agent["headers"]["X-API-Key"]]}
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        summaries = {}
+        async with httpx.AsyncClient(base_url="http://bench", transport=transport) as http:
+            for name in ("occ_contention", "occ_serialized"):
+                scenario = SCENARIOS[name](ctx, "http://bench", transport)
+                summaries[name] = await run_scenario(scenario, http, concurrency=4, duration=0.5, warmup=0)
+        return summaries
+
+    summaries = asyncio.run(run())
+    occ, serialized = summaries["occ_contention"], summaries["occ_serialized"]
+    assert applied_throughput(occ) > 0 and applied_throughput(serialized) > 0
+    assert "worker_exceptions" not in occ.get("counters", {})
+    # One at a time: nothing to conflict with, and no update fails
+    assert "conflicts" not in serialized.get("counters", {})
+    assert serialized["operations"]["serialized_update"]["errors"] == 0
+
+
+def test_scenario_without_step_fails_when_built():
+    from benchmarks.scenarios import Scenario
+
+    class Incomplete(Scenario):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete({}, "http://bench")
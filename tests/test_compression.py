@@ -0,0 +1,95 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from compression import CompressionMiddleware, choose_encoding, compress
+
+BIG = "kanban " * 1000
+
+
+async def small(request):
+    return PlainTextResponse("tiny")
+
+
+async def big(request):
+    return PlainTextResponse(BIG)
+
+
+async def image(request):
+    return Response(b"\x89PNG" + b"\0" * 4096, media_type="image/png")
+
+
+async def precompressed(request):
+    return Response(compress(BIG.encode(), "gzip"), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+
+async def streamed(request):
+    async def chunks():
+        for _ in range(5):
+            yield BIG
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+@pytest.fixture(scope="module")
+def app_client():
+    app = Starlette(routes=[
+        Route("/small", small), Route("/big", big), Route("/image", image),
+        Route("/precompressed", precompressed), Route("/streamed", streamed),
+    ])
+    app.add_middleware(CompressionMiddleware, min_size=1024)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("identity, *;q=0.5", "gzip"),
+    ("gzip;q=abc", None),
+    ("gzip;q=", None),
+    ("br;q=nope, gzip", "gzip"),
+    ("compress, deflate", None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_threshold(app_client):
+    response = app_client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers and response.text == "tiny"
+
+    response = app_client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == BIG
+
+
+def test_uncompressible_and_unaccepted_bodies_pass_through(app_client):
+    response = app_client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    response = app_client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers and response.text == BIG
+
+
+def test_already_encoded_body_passes_through(app_client):
+    response = app_client.get("/precompressed", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    # Compressed once, by the endpoint
+    assert response.text == BIG
+
+
+def test_streamed_response_is_compressed_per_chunk(app_client):
+    with app_client.stream("GET", "/streamed", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode() == BIG * 5
+
+
+def test_malformed_accept_encoding_is_not_an_error(client):
+    response = client.get("/health", headers={"Accept-Encoding": "gzip;q=abc"})
+    assert response.status_code == 200
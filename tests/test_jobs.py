@@ -0,0 +1,101 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.seed import SHARED_TABLES_IN_DATABASE
+from conftest import create_project, wait_for_job
+
+
+def test_import_tasks_job_imports_and_records_activity(client, agent):
+    headers = agent["headers"]
+    project = create_project(client, headers)
+    stage_id = project["stages"][0]["id"]
+    response = client.post(f"/projects/{project['id']}/import", headers=headers, json={
+        "stage_id": stage_id, "tasks": [{"title": f"imported {i}"} for i in range(3)],
+    })
+    assert response.status_code == 202, response.text
+
+    job = wait_for_job(client, headers, response.json()["id"])
+    assert job["status"] == "succeeded", job
+
+    tasks = client.get("/tasks", headers=headers, params={"project_id": project["id"]}).json()
+    assert sorted(task["title"] for task in tasks) == ["imported 0", "imported 1", "imported 2"]
+    assert all(task["stage_id"] == stage_id for task in tasks)
+    activity = client.get(f"/tasks/{tasks[0]['id']}/activity", headers=headers).json()
+    assert [(event["action"], event["actor_id"]) for event in activity] == [("created", agent["id"])]
+
+
+def test_delete_project_job_removes_project(client, agent):
+    headers = agent["headers"]
+    project = create_project(client, headers)
+    task = client.post("/tasks", headers=headers, json={"title": "doomed", "project_id": project["id"]})
+    assert task.status_code == 201, task.text
+    response = client.delete(f"/projects/{project['id']}", headers=headers)
+    assert response.status_code == 202, response.text
+
+    job = wait_for_job(client, headers, response.json()["id"])
+    assert job["status"] == "succeeded", job
+
+    assert client.get(f"/projects/{project['id']}", headers=headers).status_code == 404
+    assert client.get(f"/tasks/{task.json()['id']}", headers=headers).status_code == 404
+    activity = client.get(f"/projects/{project['id']}/activity", headers=headers).json()
+    assert activity[0]["action"] == "deleted" and activity[0]["actor_id"] == agent["id"]
+
+
+# Far below the ~150 jobs/s of a laptop SSD, so slow CI disks pass too
+MIN_JOBS_PER_SECOND = 20
+
+
+def test_job_queue_throughput():
+    from benchmarks.micro import job_throughput
+
+    result = asyncio.run(asyncio.wait_for(job_throughput(jobs=300, workers=4), timeout=60))
+    assert result["succeeded"] == 290 and result["failed"] == 10
+    assert result["serial_peak_concurrency"] == 1
+    assert result["jobs_per_s"] >= MIN_JOBS_PER_SECOND, result
+
+
+def test_woken_job_starts_without_waiting_for_the_poll(monkeypatch):
+    import jobs
+    from jobs import JobQueue
+    from models import Base
+
+    # A job committed and woken must not wait for the poll interval
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 30.0)
+
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(prefix="kanban-jobs-"), "jobs.db")
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", execution_options=SHARED_TABLES_IN_DATABASE)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        queue = JobQueue(workers=2, kind_limits={})
+        started = asyncio.Queue()
+
+        @queue.handler("probe")
+        async def probe(db, job):
+            started.put_nowait(time.perf_counter())
+
+        latencies = []
+        await queue.start(session_maker)
+        try:
+            # Let the workers find the queue empty and go idle
+            await asyncio.sleep(0.1)
+            for _ in range(20):
+                async with session_maker() as db:
+                    queue.enqueue(db, "probe")
+                    await db.commit()
+                enqueued = time.perf_counter()
+                queue.wake()
+                latencies.append(await asyncio.wait_for(started.get(), timeout=5) - enqueued)
+        finally:
+            await queue.stop()
+            await engine.dispose()
+        return sorted(latencies)
+
+    latencies = asyncio.run(run())
+    assert latencies[-1] < 1.0, latencies
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from conftest import scratch_engine
+
+
+async def seed_leased_tasks(engine, count: int):
+    """Tasks in progress whose leases expired a minute ago, each assigned to one agent"""
+    from models import Entity, EntityType, Project, Stage, Task, TaskStatus, task_assignments
+
+    expired = datetime.utcnow() - timedelta(minutes=1)
+    async with engine.begin() as conn:
+        await conn.execute(insert(Entity), [{"id": 1, "name": "bot", "entity_type": EntityType.AGENT}])
+        await conn.execute(insert(Project), [{"id": 1, "name": "p"}])
+        await conn.execute(insert(Stage), [{"id": 1, "name": "todo", "project_id": 1, "order": 0}])
+        await conn.execute(insert(Task), [
+            {"id": task_id, "title": f"task {task_id}", "project_id": 1, "stage_id": 1,
+             "status": TaskStatus.IN_PROGRESS, "lease_expires_at": expired}
+            for task_id in range(1, count + 1)
+        ])
+        await conn.execute(insert(task_assignments), [
+            {"task_id": task_id, "entity_id": 1} for task_id in range(1, count + 1)
+        ])
+
+
+def test_reap_reclaims_expired_leases():
+    from leases import LeaseManager
+    from models import Task, TaskStatus, task_assignments
+
+    async def run():
+        engine = await scratch_engine("reap")
+        try:
+            await seed_leased_tasks(engine, 3)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                reclaimed = await LeaseManager().reap(db)
+                statuses = (await db.execute(select(Task.status))).scalars().all()
+                assignments = (await db.execute(select(task_assignments))).all()
+            return reclaimed, statuses, assignments
+        finally:
+            await engine.dispose()
+
+    reclaimed, statuses, assignments = asyncio.run(run())
+    assert reclaimed == 3
+    assert statuses == [TaskStatus.PENDING] * 3 and assignments == []
+
+
+def test_reap_leaves_tasks_changed_after_its_select():
+    from leases import LeaseManager, lease_expiry
+    from models import Task, TaskStatus, task_assignments
+
+    async def run():
+        engine = await scratch_engine("reap-race")
+        try:
+            await seed_leased_tasks(engine, 3)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                execute = db.execute
+                calls = 0
+
+                async def racing_execute(statement, *args, **kwargs):
+                    # Between the reaper's SELECT and its UPDATE: task 1 completes, task 2's lease is renewed
+                    nonlocal calls
+                    result = await execute(statement, *args, **kwargs)
+                    calls += 1
+                    if calls == 1:
+                        await execute(update(Task).where(Task.id == 1).values(status=TaskStatus.COMPLETED))
+                        await execute(update(Task).where(Task.id == 2).values(lease_expires_at=lease_expiry()))
+                    return result
+
+                db.execute = racing_execute
+                reclaimed = await LeaseManager().reap(db)
+                del db.execute
+                statuses = dict((await db.execute(select(Task.id, Task.status))).all())
+                assigned = (await db.execute(select(task_assignments.c.task_id))).scalars().all()
+            return reclaimed, statuses, sorted(assigned)
+        finally:
+            await engine.dispose()
+
+    reclaimed, statuses, assigned = asyncio.run(run())
+    assert reclaimed == 1
+    assert statuses == {1: TaskStatus.COMPLETED, 2: TaskStatus.IN_PROGRESS, 3: TaskStatus.PENDING}
+    assert assigned == [1, 2]
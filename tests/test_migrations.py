@@ -0,0 +1,233 @@
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+# The schema of a database created by init_db() before migrations, versions and leases
+PRE_MIGRATIONS_SCHEMA = """
+CREATE TABLE entities (
+    id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, entity_type VARCHAR(5) NOT NULL,
+    email VARCHAR(255) UNIQUE, api_key VARCHAR(255) UNIQUE, hashed_password VARCHAR(255), skills TEXT,
+    is_active BOOLEAN, created_at DATETIME
+);
+CREATE TABLE projects (
+    id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, description TEXT, creator_id INTEGER,
+    approval_status VARCHAR(8), created_at DATETIME, updated_at DATETIME
+);
+CREATE TABLE stages (
+    id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, description TEXT, "order" INTEGER NOT NULL,
+    project_id INTEGER, created_at DATETIME
+);
+CREATE TABLE tasks (
+    id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, description TEXT, status VARCHAR(11),
+    project_id INTEGER, stage_id INTEGER, parent_task_id INTEGER, required_skills TEXT, priority INTEGER,
+    created_at DATETIME, updated_at DATETIME, completed_at DATETIME
+);
+CREATE TABLE comments (
+    id INTEGER PRIMARY KEY, content TEXT NOT NULL, task_id INTEGER, author_id INTEGER, created_at DATETIME
+);
+CREATE TABLE task_assignments (task_id INTEGER, entity_id INTEGER);
+INSERT INTO entities (id, name, entity_type) VALUES (1, 'bot', 'AGENT');
+INSERT INTO projects (id, name, creator_id) VALUES (1, 'old', 1);
+INSERT INTO stages (id, name, "order", project_id) VALUES (1, 'Backlog', 1, 1);
+INSERT INTO tasks (id, title, project_id, stage_id) VALUES (1, 'old task', 1, 1);
+INSERT INTO task_assignments VALUES (1, 1), (1, 1), (1, 1);
+"""
+
+
+def standalone_engine(path: str):
+    """An engine on one SQLite file holding every table, archive and shared ones included"""
+    from models import ARCHIVE_SCHEMA, SHARED_SCHEMA
+
+    return create_engine(
+        f"sqlite:///{path}", execution_options={"schema_translate_map": {ARCHIVE_SCHEMA: None, SHARED_SCHEMA: None}}
+    )
+
+
+def test_baseline_upgrades_pre_migrations_database():
+    from migrate import current_revision, head_revision, upgrade
+
+    path = os.path.join(tempfile.mkdtemp(prefix="kanban-migrations-"), "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.executescript(PRE_MIGRATIONS_SCHEMA)
+
+    engine = standalone_engine(path)
+    try:
+        with engine.connect() as conn:
+            upgrade(conn)
+            conn.commit()
+            assert current_revision(conn) == head_revision()
+
+            columns = {table: {column["name"] for column in inspect(conn).get_columns(table)}
+                       for table in ("entities", "projects", "stages", "tasks")}
+            assert "max_concurrent_tasks" in columns["entities"]
+            assert {"lease_expires_at", "version"} <= columns["tasks"]
+            assert "version" in columns["projects"] and "version" in columns["stages"]
+            assert conn.execute(text("SELECT version FROM tasks")).scalar() == 1
+
+            assert conn.execute(text("SELECT count(*) FROM task_assignments")).scalar() == 1
+            unique = [constraint["column_names"] for constraint in inspect(conn).get_unique_constraints("task_assignments")]
+            assert ["task_id", "entity_id"] in unique
+    finally:
+        engine.dispose()
+
+
+def test_migrations_downgrade_to_empty_and_upgrade_again():
+    from alembic import command
+    from migrate import alembic_config, upgrade
+
+    path = os.path.join(tempfile.mkdtemp(prefix="kanban-migrations-"), "fresh.db")
+    engine = standalone_engine(path)
+    try:
+        with engine.connect() as conn:
+            upgrade(conn)
+            command.downgrade(alembic_config(conn), "base")
+            assert inspect(conn).get_table_names() == ["alembic_version"]
+            upgrade(conn)
+            assert "tasks_fts" in inspect(conn).get_table_names()
+    finally:
+        engine.dispose()
+
+
+def test_unique_assignments_added_to_database_at_0003():
+    from migrate import upgrade
+
+    path = os.path.join(tempfile.mkdtemp(prefix="kanban-migrations-"), "stamped.db")
+    engine = standalone_engine(path)
+    try:
+        with engine.connect() as conn:
+            upgrade(conn, "0003")
+            conn.commit()
+        # As left by the first baseline on a database whose tables predate it
+        with sqlite3.connect(path) as raw:
+            raw.executescript("""
+                DROP TABLE task_assignments;
+                CREATE TABLE task_assignments (task_id INTEGER, entity_id INTEGER);
+                INSERT INTO task_assignments VALUES (1, 1), (1, 1), (1, 2), (2, 1), (2, 1);
+            """)
+        with engine.connect() as conn:
+            upgrade(conn)
+            conn.commit()
+            rows = conn.execute(text("SELECT task_id, entity_id FROM task_assignments ORDER BY 1, 2")).all()
+            assert [tuple(row) for row in rows] == [(1, 1), (1, 2), (2, 1)]
+            unique = [constraint["column_names"] for constraint in inspect(conn).get_unique_constraints("task_assignments")]
+            assert ["task_id", "entity_id"] in unique
+    finally:
+        engine.dispose()
+
+
+def scratch_table():
+    from sqlalchemy import Boolean, Column, Integer, MetaData, Table
+
+    return Table(
+        "items", MetaData(),
+        Column("id", Integer, primary_key=True), Column("hits", Integer), Column("flagged", Boolean),
+    )
+
+
+def run_backfill(path: str, *args, **kwargs) -> int:
+    """backfill() in an Alembic operations context on the SQLite file at ``path``"""
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    from migrate import backfill
+
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        with engine.connect() as conn, Operations.context(MigrationContext.configure(conn)):
+            return backfill(*args, **kwargs)
+    finally:
+        engine.dispose()
+
+
+def seeded_items(rows: int) -> str:
+    path = os.path.join(tempfile.mkdtemp(prefix="kanban-migrations-"), "backfill.db")
+    engine = create_engine(f"sqlite:///{path}")
+    table = scratch_table()
+    with engine.begin() as conn:
+        table.create(conn)
+        conn.execute(table.insert(), [{"id": i, "hits": 0, "flagged": i % 3 == 0} for i in range(1, rows + 1)])
+    engine.dispose()
+    return path
+
+
+def read_items(path: str):
+    with sqlite3.connect(path) as conn:
+        hits = dict(conn.execute("SELECT id, hits FROM items"))
+        tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        progress = conn.execute("SELECT count(*) FROM migration_progress").fetchone()[0]
+    return hits, tables, progress
+
+
+def test_backfill_runs_in_batches(monkeypatch):
+    import migrate
+
+    pauses = []
+    monkeypatch.setattr(migrate.time, "sleep", pauses.append)
+    path = seeded_items(35)
+    table = scratch_table()
+
+    updated = run_backfill(path, "count_hits", table, {"hits": table.c.hits + 1}, batch_size=10, pause=0.01)
+    hits, tables, progress = read_items(path)
+    assert updated == 35 and set(hits.values()) == {1}
+    # One pause after each committed batch: 10 + 10 + 10 + 5
+    assert len(pauses) == 4
+    assert "migration_progress" in tables and progress == 0
+
+
+def test_backfill_resumes_after_an_interruption(monkeypatch):
+    import migrate
+
+    batches = []
+
+    def interrupt_after_two(seconds):
+        batches.append(seconds)
+        if len(batches) == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(migrate.time, "sleep", interrupt_after_two)
+    path = seeded_items(35)
+    table = scratch_table()
+    values = {"hits": table.c.hits + 1}
+
+    try:
+        run_backfill(path, "count_hits", table, values, batch_size=10, pause=0.01)
+    except KeyboardInterrupt:
+        pass
+    hits, _, progress = read_items(path)
+    assert sorted(item_id for item_id, count in hits.items() if count) == list(range(1, 21))
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT name, last_key FROM migration_progress").fetchall() == [("count_hits", 20)]
+
+    monkeypatch.setattr(migrate.time, "sleep", lambda seconds: None)
+    assert run_backfill(path, "count_hits", table, values, batch_size=10, pause=0.01) == 15
+    hits, _, progress = read_items(path)
+    # Every row updated exactly once across both runs, and the progress row is gone
+    assert set(hits.values()) == {1} and progress == 0
+
+
+def test_backfill_only_updates_rows_matching_where():
+    path = seeded_items(35)
+    table = scratch_table()
+
+    updated = run_backfill(path, "flagged_hits", table, {"hits": 7}, where=table.c.flagged, batch_size=4, pause=0)
+    hits, _, _ = read_items(path)
+    assert updated == 11
+    assert {item_id for item_id, count in hits.items() if count == 7} == set(range(3, 36, 3))
+    assert {count for item_id, count in hits.items() if item_id % 3} == {0}
+
+
+def test_create_index_online_can_be_rerun():
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    from migrate import create_index_online
+
+    path = seeded_items(3)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        with engine.connect() as conn, Operations.context(MigrationContext.configure(conn)):
+            create_index_online("ix_items_hits", "items", ["hits"])
+            create_index_online("ix_items_hits", "items", ["hits"])
+            assert [index["name"] for index in inspect(conn).get_indexes("items")] == ["ix_items_hits"]
+    finally:
+        engine.dispose()
@@ -0,0 +1,64 @@
+"""
+Statement budgets for the hot endpoints, on a project big enough that an
+N+1 would show: the counts must not grow with the number of tasks,
+assignees or comments. Every request starts with the API key lookup.
+"""
+import pytest
+
+from conftest import create_project, register_agent, sql_profile
+
+TASKS = 20
+
+
+@pytest.fixture(scope="module")
+def board(client, agent):
+    project = create_project(client, agent["headers"])
+    other = register_agent(client)
+    task_ids = []
+    for number in range(TASKS):
+        response = client.post("/tasks", headers=agent["headers"], json={
+            "title": f"budget task {number}", "description": "keeps the dashboard happy",
+            "project_id": project["id"], "required_skills": "python",
+        })
+        assert response.status_code == 201, response.text
+        task_id = response.json()["id"]
+        client.post(f"/tasks/{task_id}/assign", headers=agent["headers"], params={"entity_id": other["id"]})
+        client.post("/comments", headers=agent["headers"], json={"task_id": task_id, "content": "budget comment"})
+        task_ids.append(task_id)
+    return {"project_id": project["id"], "task_id": task_ids[0]}
+
+
+# (name, method, path, request arguments, statement budget)
+ENDPOINTS = [
+    ("project_detail", "GET", "/projects/{project_id}", {}, 5),
+    ("list_projects", "GET", "/projects", {}, 2),
+    ("task_detail", "GET", "/tasks/{task_id}", {}, 5),
+    ("list_tasks", "GET", "/tasks", {"params": {"project_id": "{project_id}"}}, 3),
+    ("available_tasks", "GET", "/tasks/available", {}, 3),
+    # Includes the SELECT of the old values for the activity log, which PostgreSQL folds into the UPDATE
+    ("update_task", "PATCH", "/tasks/{task_id}", {"json": {"priority": 3}}, 6),
+    ("create_task", "POST", "/tasks", {"json": {"title": "one more", "project_id": "{project_id}"}}, 4),
+    ("add_comment", "POST", "/comments", {"json": {"task_id": "{task_id}", "content": "hi"}}, 2),
+    ("list_comments", "GET", "/tasks/{task_id}/comments", {}, 2),
+    ("board_html", "GET", "/ui/projects/{project_id}/board", {}, 4),
+    ("project_activity", "GET", "/projects/{project_id}/activity", {}, 2),
+    ("search", "GET", "/search", {"params": {"q": "budget"}}, 3),
+    ("heartbeat", "POST", "/agents/heartbeat", {}, 1),
+]
+
+
+def fill(value, ids):
+    if isinstance(value, dict):
+        return {key: fill(item, ids) for key, item in value.items()}
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        return ids[value[1:-1]]
+    return value.format(**ids) if isinstance(value, str) else value
+
+
+@pytest.mark.parametrize("name, method, path, kwargs, budget", ENDPOINTS, ids=[endpoint[0] for endpoint in ENDPOINTS])
+def test_query_budget(client, agent, board, name, method, path, kwargs, budget):
+    response = client.request(method, fill(path, board), headers=agent["headers"], **fill(kwargs, board))
+    assert response.status_code < 300, response.text
+    profile = sql_profile(response)
+    assert profile["queries"] <= budget, f"{name} ran {profile['queries']} statements, budget {budget}"
+    assert profile["n_plus_one"] == 0
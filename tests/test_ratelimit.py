@@ -0,0 +1,37 @@
+import importlib.util
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import ROOT
+
+
+@pytest.fixture(scope="module")
+def limited_app():
+    """A second instance of the app, built with rate limiting on"""
+    import ratelimit
+
+    patch = pytest.MonkeyPatch()
+    patch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    spec = importlib.util.spec_from_file_location("main_rate_limited", os.path.join(ROOT, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    patch.undo()
+    return module.app
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_rejections_carry_cors_headers(limited_app, monkeypatch, status_code):
+    import ratelimit
+
+    if status_code == 429:
+        monkeypatch.setattr(ratelimit.rate_limiter, "take_local", lambda key, cost: 100)
+    else:
+        monkeypatch.setattr(ratelimit.admission, "should_shed", lambda: True)
+
+    response = TestClient(limited_app).get("/projects", headers={"Origin": "http://ui.example"})
+    assert response.status_code == status_code
+    assert response.headers["access-control-allow-origin"] in ("*", "http://ui.example")
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
+    assert int(response.headers["retry-after"]) >= 1
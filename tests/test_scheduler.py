@@ -0,0 +1,62 @@
+import asyncio
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+from conftest import scratch_engine
+
+
+def test_schedule_skips_tasks_claimed_during_the_pass():
+    from models import Activity, Entity, EntityType, Project, Stage, Task, TaskStatus, task_assignments
+    from scheduler import TaskScheduler
+
+    async def run():
+        engine = await scratch_engine("schedule-race")
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(insert(Entity), [
+                    {"id": 1, "name": "bot", "entity_type": EntityType.AGENT, "max_concurrent_tasks": 4},
+                    {"id": 2, "name": "other", "entity_type": EntityType.HUMAN, "max_concurrent_tasks": 1},
+                ])
+                await conn.execute(insert(Project), [{"id": 1, "name": "p"}])
+                await conn.execute(insert(Stage), [{"id": 1, "name": "todo", "project_id": 1, "order": 0}])
+                await conn.execute(insert(Task), [
+                    {"id": task_id, "title": f"task {task_id}", "project_id": 1, "stage_id": 1,
+                     "status": TaskStatus.PENDING, "priority": 10 - task_id}
+                    for task_id in range(1, 5)
+                ])
+
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                execute = db.execute
+                raced = False
+
+                async def racing_execute(statement, *args, **kwargs):
+                    # Before the pass writes anything: task 1 is assigned to the same agent, task 2 to
+                    # someone else, and task 3 is blocked
+                    nonlocal raced
+                    if isinstance(statement, UpdateBase) and not raced:
+                        raced = True
+                        await execute(insert(task_assignments), [
+                            {"task_id": 1, "entity_id": 1}, {"task_id": 2, "entity_id": 2}
+                        ])
+                        await execute(update(Task).where(Task.id == 3).values(status=TaskStatus.BLOCKED))
+                    return await execute(statement, *args, **kwargs)
+
+                db.execute = racing_execute
+                assignments, unassigned = await TaskScheduler().schedule(db)
+                del db.execute
+                assigned = (await db.execute(select(task_assignments.c.task_id, task_assignments.c.entity_id))).all()
+                statuses = dict((await db.execute(select(Task.id, Task.status))).all())
+                logged = (await db.execute(select(Activity.object_id))).scalars().all()
+            return assignments, sorted(assigned), statuses, set(logged)
+        finally:
+            await engine.dispose()
+
+    assignments, assigned, statuses, logged = asyncio.run(run())
+    assert assignments == [(4, 1)]
+    assert assigned == [(1, 1), (2, 2), (4, 1)]
+    assert statuses == {
+        1: TaskStatus.PENDING, 2: TaskStatus.PENDING, 3: TaskStatus.BLOCKED, 4: TaskStatus.IN_PROGRESS
+    }
+    assert logged == {4}
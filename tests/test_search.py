@@ -0,0 +1,39 @@
+from conftest import create_project
+
+
+def test_snippets_escape_indexed_text(client, agent):
+    headers = agent["headers"]
+    project = create_project(client, headers)
+    response = client.post("/tasks", headers=headers, json={
+        "title": "tuning notes", "description": '<img src=x onerror="alert(1)"> xylophone & friends',
+        "project_id": project["id"],
+    })
+    assert response.status_code == 201, response.text
+
+    hits = client.get("/search", headers=headers, params={"q": "xylophone", "project_id": project["id"]}).json()
+    snippet = hits[0]["snippet"]
+    assert "<img" not in snippet and "&lt;img" in snippet and "&amp;" in snippet
+    assert "<mark>xylophone</mark>" in snippet
+
+
+def test_task_and_comment_scores_are_comparable(client, agent):
+    headers = agent["headers"]
+    project = create_project(client, headers)
+    titled = client.post("/tasks", headers=headers, json={
+        "title": "zeppelin", "description": "hangar", "project_id": project["id"],
+    }).json()
+    other = client.post("/tasks", headers=headers, json={
+        "title": "mooring", "description": "rope for the zeppelin, and more rope", "project_id": project["id"],
+    }).json()
+    client.post("/comments", headers=headers, params={"sync": "true"}, json={
+        "task_id": other["id"], "content": "the zeppelin zeppelin zeppelin landed",
+    })
+
+    hits = client.get("/search", headers=headers, params={"q": "zeppelin", "project_id": project["id"]}).json()
+    best = {}
+    for hit in hits:
+        best.setdefault(hit["kind"], hit)
+    # Each kind's best hit scores 1.0, whatever the column weights of its ranking
+    assert best["task"]["id"] == titled["id"] and best["task"]["score"] == 1.0
+    assert best["comment"]["score"] == 1.0
+    assert all(0 < hit["score"] <= 1.0 for hit in hits)
@@ -0,0 +1,32 @@
+"""Skills match the same way in /tasks/available, the scheduler and WebSocket filters."""
+from conftest import create_project, register_agent
+
+from models import parse_skills
+from websocket_manager import event_attributes
+
+
+def test_parse_skills_normalises():
+    assert parse_skills(" Python, RUST ,,") == {"python", "rust"}
+    assert parse_skills(["Go ", ""]) == {"go"}
+    assert parse_skills(None) == set()
+
+
+def test_available_tasks_ignore_case_and_spacing(client, agent):
+    project = create_project(client, agent["headers"])
+    task = client.post("/tasks", headers=agent["headers"], json={
+        "title": "mixed case skills", "project_id": project["id"], "required_skills": "Rust, PYTHON",
+    })
+    assert task.status_code == 201, task.text
+    task_id = task.json()["id"]
+
+    matching = register_agent(client, skills=" python ,sql")
+    other = register_agent(client, skills="go")
+    available = client.get("/tasks/available", headers=matching["headers"]).json()
+    assert task_id in {task["id"] for task in available}
+    available = client.get("/tasks/available", headers=other["headers"]).json()
+    assert task_id not in {task["id"] for task in available}
+
+
+def test_websocket_skill_filters_ignore_case():
+    message = {"event_type": "task_created", "data": {"task": {"required_skills": "Rust, PYTHON"}}}
+    assert event_attributes(message)["skill"] == frozenset({"rust", "python"})
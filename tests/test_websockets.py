@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import time
+
+import pytest
+
+from conftest import create_project, register_agent
+
+
+class SinkWebSocket:
+    """An accepted socket whose sends go nowhere, or fail once the peer is gone"""
+
+    def __init__(self):
+        self.gone = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        if self.gone:
+            raise ConnectionResetError("peer went away")
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+class StalledWebSocket(SinkWebSocket):
+    """A peer that stopped reading: sends never complete"""
+
+    async def send_text(self, frame):
+        await asyncio.Event().wait()
+
+
+def test_sweep_evicts_thousands_of_vanished_clients():
+    from benchmarks.micro import websocket_sweep
+
+    result = asyncio.run(websocket_sweep(clients=5000, dropped=0.4, messages=5))
+    modes = result["modes"]
+    # Sends to reset and stalled sockets fail at the first ping; silent ones miss the pong deadline
+    assert result["first_sweep"]["ping_failed"] == modes["reset"] + modes["stalled"]
+    assert result["second_sweep"]["zombie"] == modes["silent"]
+    assert result["remaining"] == modes["live"] and result["leaked"] == 0
+    assert result["first_sweep"]["seconds"] < 5 and result["second_sweep"]["seconds"] < 5
+
+
+def test_connect_and_drop_churn_leaves_no_state():
+    from websocket_manager import ConnectionLimitExceeded, ConnectionManager
+
+    async def run():
+        manager = ConnectionManager(max_connections=5000, max_per_owner=10, send_timeout=0.05)
+        sockets = []
+        for index in range(5000):
+            socket = SinkWebSocket()
+            await manager.connect(socket, project_id=index % 50, entity_id=index % 500)
+            manager.subscribe(socket, stage_ids=[index % 7], assigned_to_me=index % 2 == 0)
+            sockets.append(socket)
+        with pytest.raises(ConnectionLimitExceeded):
+            await manager.connect(SinkWebSocket(), project_id=1, entity_id=10 ** 6)
+
+        # Half close cleanly, the other half vanish and are found by the next ping
+        for socket in sockets[::2]:
+            manager.disconnect(socket)
+        for socket in sockets[1::2]:
+            socket.gone = True
+        swept = await manager.sweep(time.monotonic() + manager.ping_interval)
+        assert swept["ping_failed"] == 2500
+        return manager
+
+    manager = asyncio.run(run())
+    assert not manager.subscriptions and not manager.rooms and not manager.owner_counts
+
+
+def test_stalled_peer_does_not_block_broadcasts():
+    from websocket_manager import ConnectionManager
+
+    async def run():
+        manager = ConnectionManager(send_timeout=0.2)
+        healthy, stalled = SinkWebSocket(), StalledWebSocket()
+        frames = []
+
+        async def record(frame):
+            frames.append(frame)
+        healthy.send_text = record
+        for socket in (stalled, healthy):
+            await manager.connect(socket, project_id=1)
+        started = time.monotonic()
+        await asyncio.wait_for(
+            manager.broadcast_to_project({"type": "event", "event_type": "task_updated", "data": {}}, 1), 3
+        )
+        return manager, frames, time.monotonic() - started, healthy, stalled
+
+    manager, frames, seconds, healthy, stalled = asyncio.run(run())
+    assert len(frames) == 1 and "task_updated" in frames[0]
+    assert seconds < 1
+    assert stalled not in manager.subscriptions and healthy in manager.subscriptions
+    assert manager.pending_sends == 0
+
+
+def test_websocket_endpoint_connects_and_drops_clients(client, agent):
+    import main
+
+    project = create_project(client, agent["headers"])
+    agents = [register_agent(client) for _ in range(5)]
+    before = len(main.manager.subscriptions)
+    with contextlib.ExitStack() as stack:
+        for number in range(100):
+            headers = agents[number % len(agents)]["headers"]
+            socket = stack.enter_context(
+                client.websocket_connect(f"/ws/projects/{project['id']}?initial=false", headers=headers)
+            )
+            assert socket.receive_json()["type"] == "connection"
+        assert len(main.manager.subscriptions) == before + 100
+
+    # The server notices each close on its next receive
+    deadline = time.monotonic() + 10
+    while len(main.manager.subscriptions) > before and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(main.manager.subscriptions) == before
+    assert project["id"] not in main.manager.rooms
+
+
+def test_assigned_to_me_hears_about_being_unassigned(client, agent):
+    project = create_project(client, agent["headers"])
+    task = client.post("/tasks", headers=agent["headers"], json={"title": "hand over", "project_id": project["id"]})
+    task_id = task.json()["id"]
+    worker = register_agent(client)
+    client.post(f"/tasks/{task_id}/assign", headers=agent["headers"], params={"entity_id": worker["id"]})
+
+    url = f"/ws/projects/{project['id']}?initial=false"
+    with client.websocket_connect(url, headers=worker["headers"]) as socket:
+        assert socket.receive_json()["type"] == "connection"
+        socket.send_json({"type": "subscribe", "assigned_to_me": True})
+        assert socket.receive_json()["type"] == "subscribed"
+
+        response = client.delete(f"/tasks/{task_id}/unassign/{worker['id']}", headers=agent["headers"])
+        assert response.status_code == 200, response.text
+        event = socket.receive_json()
+        assert event["data"]["task"]["assignee_ids"] == []
+        assert event["data"]["previous_assignee_ids"] == [worker["id"]]
+
+        client.post(f"/tasks/{task_id}/assign", headers=agent["headers"], params={"entity_id": worker["id"]})
+        assert socket.receive_json()["data"]["task"]["assignee_ids"] == [worker["id"]]
+        response = client.post(f"/tasks/{task_id}/transition", headers=agent["headers"],
+                               json={"unassign": [worker["id"]]})
+        assert response.status_code == 200, response.text
+        assert socket.receive_json()["data"]["previous_assignee_ids"] == [worker["id"]]
@@ -1,80 +1,463 @@
+"""
+WebSocket connections and event delivery.
+
+Each socket is registered as a ``Subscription``: the project it watches
+(None for /ws, which hears about every project), the entity it
+authenticated as, and optional filters on event type, stage id, tasks
+assigned to that entity, and required skills. An unset filter matches
+everything; an event must pass every filter that is set.
+
+Subscriptions are indexed per room by their most selective filter
+(assignee, then stage, then skill, then event type). A broadcast looks up
+only the index buckets for the event's own assignees, stages, skills and
+type, so delivery costs O(matching sockets) rather than O(connections).
+An event that says nothing about a dimension (a bulk ``tasks_changed``, or
+a stage event seen by an assignee filter) goes to every subscription on
+that dimension: a client can ignore an extra event but can't recover a
+missed one.
+
+Dead peers are found by a sweeper that runs every WS_SWEEP_INTERVAL_SECONDS.
+A socket that has sent nothing for WS_PING_INTERVAL_SECONDS gets a
+{"type": "ping"} message. Any frame counts as an answer, {"type": "pong"}
+included. Sockets that stay silent for WS_PONG_TIMEOUT_SECONDS after a ping,
+or whose ping can't be sent, are closed and dropped. So are sockets that
+don't take an event within WS_SEND_TIMEOUT_SECONDS; events are sent to all
+matching sockets at once, so a stalled peer doesn't hold up the others. With
+WS_IDLE_TIMEOUT_SECONDS set, sockets that only answer pings are dropped
+after that long as well. New sockets are refused past WS_MAX_CONNECTIONS,
+or past WS_MAX_CONNECTIONS_PER_ENTITY for one entity (or one address, for
+anonymous sockets).
+"""
 from fastapi import WebSocket
-from typing import Dict, Set, List
-import json
+from starlette.websockets import WebSocketState
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Set
+import asyncio
+import logging
+import os
+import time
 from datetime import datetime
 
+from metrics import registry
+from models import parse_skills
+from serialization import encode, send_frame
+
+logger = logging.getLogger(__name__)
+
+WS_PING_INTERVAL_SECONDS = float(os.getenv("WS_PING_INTERVAL_SECONDS", "20"))
+WS_PONG_TIMEOUT_SECONDS = float(os.getenv("WS_PONG_TIMEOUT_SECONDS", "20"))
+# 0 keeps sockets that answer pings open however long they stay quiet
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "0"))
+WS_SWEEP_INTERVAL_SECONDS = float(os.getenv("WS_SWEEP_INTERVAL_SECONDS", "5"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+WS_MAX_CONNECTIONS_PER_ENTITY = int(os.getenv("WS_MAX_CONNECTIONS_PER_ENTITY", "20"))
+# How long an event, a ping or a close may wait on a peer that stopped reading
+WS_SEND_TIMEOUT_SECONDS = 5.0
+
+websocket_evictions = registry.counter(
+    "websocket_evictions_total", "WebSockets closed by the server, by reason", ("reason",)
+)
+websocket_rejections = registry.counter(
+    "websocket_rejections_total", "WebSockets refused at a connection limit", ("limit",)
+)
+
+# Filter dimensions, most selective first; a subscription is indexed under the first one it sets
+INDEX_ORDER = ("assignee", "stage", "skill", "event")
+
+
+def _skill_set(skills) -> FrozenSet[str]:
+    return frozenset(parse_skills(skills))
+
+
+def event_attributes(message: dict) -> Dict[str, FrozenSet[Hashable]]:
+    """The values of each filter dimension an event carries; missing dimensions match any filter"""
+    attributes = {"event": frozenset((message.get("event_type"),))}
+    data = message.get("data") or {}
+    task = data.get("task")
+    if task is not None:
+        attributes["stage"] = frozenset(
+            stage_id for stage_id in (task.get("stage_id"), data.get("previous_stage_id")) if stage_id is not None
+        )
+        attributes["assignee"] = frozenset(task.get("assignee_ids") or ()) | frozenset(
+            data.get("previous_assignee_ids") or ()
+        )
+        skills = _skill_set(task.get("required_skills"))
+        if skills:  # Tasks without required skills are open to everyone
+            attributes["skill"] = skills
+    elif "stage" in data:
+        attributes["stage"] = frozenset((data["stage"]["id"],))
+    elif message.get("event_type") in ("task_deleted", "stage_deleted"):
+        stage_id = data.get("stage_id") if message["event_type"] == "task_deleted" else data.get("id")
+        if stage_id is not None:
+            attributes["stage"] = frozenset((stage_id,))
+    return attributes
+
+
+class ConnectionLimitExceeded(Exception):
+    """Raised by ConnectionManager.connect when a socket would go over a connection cap"""
+
+
+class Subscription:
+    """One socket, what it authenticated as, the events it wants, and when it was last heard from"""
+
+    __slots__ = (
+        "websocket", "project_id", "entity_id", "owner", "wire_format", "filters", "last_seen", "last_active",
+        "pinged_at"
+    )
+
+    def __init__(self, websocket: WebSocket, project_id: Optional[int] = None, entity_id: Optional[int] = None,
+                 owner: Optional[str] = None, wire_format: str = "json"):
+        self.websocket = websocket
+        self.project_id = project_id
+        self.entity_id = entity_id
+        # Who the per-entity cap counts this socket against
+        self.owner = owner
+        # "json" (text frames) or "msgpack" (binary frames)
+        self.wire_format = wire_format
+        self.filters: Dict[str, FrozenSet[Hashable]] = {}
+        # Monotonic times: any frame, any frame but a pong, and the unanswered ping
+        self.last_seen = self.last_active = time.monotonic()
+        self.pinged_at: Optional[float] = None
+
+    @property
+    def index_dimension(self) -> Optional[str]:
+        for dimension in INDEX_ORDER:
+            if dimension in self.filters:
+                return dimension
+        return None
+
+    def matches(self, attributes: Dict[str, FrozenSet[Hashable]]) -> bool:
+        for dimension, wanted in self.filters.items():
+            values = attributes.get(dimension)
+            if values is not None and wanted.isdisjoint(values):
+                return False
+        return True
+
+    def describe(self) -> dict:
+        return {
+            "events": sorted(self.filters["event"]) if "event" in self.filters else None,
+            "stage_ids": sorted(self.filters["stage"]) if "stage" in self.filters else None,
+            "assigned_to_me": "assignee" in self.filters,
+            "skills": sorted(self.filters["skill"]) if "skill" in self.filters else None,
+        }
+
+
+class _Room:
+    """Subscriptions of one project (or of /ws), indexed by their most selective filter"""
+
+    __slots__ = ("members", "unfiltered", "index")
+
+    def __init__(self):
+        self.members: Set[Subscription] = set()
+        self.unfiltered: Set[Subscription] = set()
+        self.index: Dict[str, Dict[Hashable, Set[Subscription]]] = {}
+
+    def add(self, subscription: Subscription):
+        self.members.add(subscription)
+        dimension = subscription.index_dimension
+        if dimension is None:
+            self.unfiltered.add(subscription)
+            return
+        buckets = self.index.setdefault(dimension, {})
+        for value in subscription.filters[dimension]:
+            buckets.setdefault(value, set()).add(subscription)
+
+    def remove(self, subscription: Subscription):
+        if subscription not in self.members:
+            return
+        self.members.discard(subscription)
+        dimension = subscription.index_dimension
+        if dimension is None:
+            self.unfiltered.discard(subscription)
+            return
+        buckets = self.index[dimension]
+        for value in subscription.filters[dimension]:
+            bucket = buckets[value]
+            bucket.discard(subscription)
+            if not bucket:
+                del buckets[value]
+        if not buckets:
+            del self.index[dimension]
+
+    def matching(self, attributes: Dict[str, FrozenSet[Hashable]]) -> Iterable[Subscription]:
+        yield from self.unfiltered
+        seen: Set[Subscription] = set()
+        for dimension, buckets in self.index.items():
+            values = attributes.get(dimension)
+            if values is None:
+                candidates = (subscription for bucket in buckets.values() for subscription in bucket)
+            else:
+                candidates = (subscription for value in values for subscription in buckets.get(value, ()))
+            for subscription in candidates:
+                if subscription not in seen:
+                    seen.add(subscription)
+                    if subscription.matches(attributes):
+                        yield subscription
+
 
 class ConnectionManager:
     """Manages WebSocket connections for real-time updates"""
-    
-    def __init__(self):
-        # Store connections by project_id
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
-        # Store all connections
-        self.all_connections: Set[WebSocket] = set()
-    
-    async def connect(self, websocket: WebSocket, project_id: int = None):
-        """Accept a new WebSocket connection"""
-        await websocket.accept()
-        self.all_connections.add(websocket)
-        
-        if project_id:
-            if project_id not in self.active_connections:
-                self.active_connections[project_id] = set()
-            self.active_connections[project_id].add(websocket)
-    
-    def disconnect(self, websocket: WebSocket, project_id: int = None):
+
+    def __init__(self, ping_interval: float = WS_PING_INTERVAL_SECONDS,
+                 pong_timeout: float = WS_PONG_TIMEOUT_SECONDS, idle_timeout: float = WS_IDLE_TIMEOUT_SECONDS,
+                 max_connections: int = WS_MAX_CONNECTIONS,
+                 max_per_owner: int = WS_MAX_CONNECTIONS_PER_ENTITY, send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self.max_per_owner = max_per_owner
+        self.send_timeout = send_timeout
+        # Every open socket
+        self.subscriptions: Dict[WebSocket, Subscription] = {}
+        # Subscriptions by project_id; None holds the /ws sockets
+        self.rooms: Dict[Optional[int], _Room] = {}
+        # Open sockets per owner, for the per-entity cap
+        self.owner_counts: Dict[str, int] = {}
+        # Broadcast sends queued behind the one in progress
+        self.pending_sends = 0
+        self._background: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: WebSocket, project_id: Optional[int] = None,
+                      entity_id: Optional[int] = None, owner: Optional[str] = None,
+                      wire_format: str = "json") -> Subscription:
+        """
+        Accept a WebSocket connection (unless already accepted) and subscribe
+        it to everything. ``owner`` defaults to the entity; sockets without
+        one aren't held to the per-entity cap. Raises ConnectionLimitExceeded
+        at a cap, leaving the accepted socket for the caller to close.
+        """
+        if getattr(websocket, "client_state", WebSocketState.CONNECTING) == WebSocketState.CONNECTING:
+            await websocket.accept()
+        if owner is None and entity_id is not None:
+            owner = f"entity:{entity_id}"
+        # Checked and counted with no await in between, so concurrent connects can't overshoot
+        if len(self.subscriptions) >= self.max_connections:
+            websocket_rejections.inc(1, "global")
+            raise ConnectionLimitExceeded("Too many open WebSockets")
+        if owner is not None and self.owner_counts.get(owner, 0) >= self.max_per_owner:
+            websocket_rejections.inc(1, "entity")
+            raise ConnectionLimitExceeded("Too many open WebSockets for this client")
+
+        subscription = Subscription(websocket, project_id, entity_id, owner, wire_format)
+        self.subscriptions[websocket] = subscription
+        self.rooms.setdefault(project_id, _Room()).add(subscription)
+        if owner is not None:
+            self.owner_counts[owner] = self.owner_counts.get(owner, 0) + 1
+        return subscription
+
+    def touch(self, websocket: WebSocket, active: bool = True):
+        """Record a frame from the socket; ``active`` is False for pongs"""
+        subscription = self.subscriptions.get(websocket)
+        if subscription is not None:
+            subscription.last_seen = time.monotonic()
+            subscription.pinged_at = None
+            if active:
+                subscription.last_active = subscription.last_seen
+
+    def subscribe(self, websocket: WebSocket, events: Optional[Iterable[str]] = None,
+                  stage_ids: Optional[Iterable[int]] = None, assigned_to_me: bool = False,
+                  skills: Optional[Iterable[str]] = None) -> Subscription:
+        """Replace a socket's filters; None (or False) leaves a dimension unfiltered"""
+        subscription = self.subscriptions[websocket]
+        if assigned_to_me and subscription.entity_id is None:
+            raise ValueError("assigned_to_me needs an authenticated socket")
+        filters = {}
+        if assigned_to_me:
+            filters["assignee"] = frozenset((subscription.entity_id,))
+        if stage_ids is not None:
+            filters["stage"] = frozenset(stage_ids)
+        if skills is not None:
+            filters["skill"] = _skill_set(skills)
+        if events is not None:
+            filters["event"] = frozenset(events)
+
+        room = self.rooms[subscription.project_id]
+        room.remove(subscription)
+        subscription.filters = filters
+        room.add(subscription)
+        return subscription
+
+    def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
-        self.all_connections.discard(websocket)
-        
-        if project_id and project_id in self.active_connections:
-            self.active_connections[project_id].discard(websocket)
-            # Clean up empty project rooms
-            if not self.active_connections[project_id]:
-                del self.active_connections[project_id]
-    
+        subscription = self.subscriptions.pop(websocket, None)
+        if subscription is None:
+            return
+        if subscription.owner is not None:
+            remaining = self.owner_counts[subscription.owner] - 1
+            if remaining:
+                self.owner_counts[subscription.owner] = remaining
+            else:
+                del self.owner_counts[subscription.owner]
+        room = self.rooms.get(subscription.project_id)
+        if room is not None:
+            room.remove(subscription)
+            # Clean up empty rooms
+            if not room.members:
+                del self.rooms[subscription.project_id]
+
+    def matching(self, message: dict, project_id: Optional[int] = None) -> List[Subscription]:
+        """Subscriptions an event should reach: the project's room plus /ws"""
+        attributes = event_attributes(message)
+        matched = []
+        for room_id in {project_id, None}:
+            room = self.rooms.get(room_id)
+            if room is not None:
+                matched.extend(room.matching(attributes))
+        return matched
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Send a message to a specific connection"""
+        """Send a message to a specific connection, in its wire format"""
+        subscription = self.subscriptions.get(websocket)
+        try:
+            await send_frame(websocket, encode(message, subscription.wire_format if subscription else "json"))
+        except Exception:
+            logger.warning("Error sending personal message", exc_info=True)
+
+    async def _send(self, subscription: Subscription, frame) -> Optional[str]:
+        """Send one frame; returns why the socket has to go, or None"""
         try:
-            await websocket.send_json(message)
-        except Exception as e:
-            print(f"Error sending personal message: {e}")
-    
+            await asyncio.wait_for(send_frame(subscription.websocket, frame), self.send_timeout)
+            return None
+        except asyncio.TimeoutError:
+            return "send_timeout"
+        except Exception:
+            logger.info("Dropping WebSocket for project %s after a failed send",
+                        subscription.project_id, exc_info=True)
+            return "send_failed"
+        finally:
+            self.pending_sends -= 1
+
+    async def _deliver(self, message: dict, subscriptions: List[Subscription]):
+        # Encoded once per wire format, however many sockets get it
+        frames = {}
+        for subscription in subscriptions:
+            if subscription.wire_format not in frames:
+                frames[subscription.wire_format] = encode(message, subscription.wire_format)
+        self.pending_sends += len(subscriptions)
+        # Concurrently and with a timeout, so a peer that stopped reading only holds up its own send
+        failed = await asyncio.gather(
+            *(self._send(subscription, frames[subscription.wire_format]) for subscription in subscriptions)
+        )
+
+        stalled = []
+        for subscription, reason in zip(subscriptions, failed):
+            if reason == "send_timeout":
+                stalled.append(subscription)
+            elif reason is not None:
+                self.disconnect(subscription.websocket)
+        if stalled:
+            logger.info("Dropping %d WebSockets that stopped reading", len(stalled))
+            await asyncio.gather(*(self._evict(subscription, "send_timeout") for subscription in stalled))
+
     async def broadcast_to_project(self, message: dict, project_id: int):
-        """Broadcast a message to all connections watching a project"""
-        if project_id not in self.active_connections:
-            return
-        
-        disconnected = set()
-        for connection in self.active_connections[project_id]:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting to project {project_id}: {e}")
-                disconnected.add(connection)
-        
-        # Clean up disconnected connections
-        for connection in disconnected:
-            self.disconnect(connection, project_id)
-    
+        """Send a project's event to the sockets on that project and on /ws whose filters match"""
+        await self._deliver(message, self.matching(message, project_id))
+
     async def broadcast_to_all(self, message: dict):
-        """Broadcast a message to all connections"""
-        disconnected = set()
-        for connection in self.all_connections:
+        """Send an event that isn't about one project to the matching /ws sockets"""
+        await self._deliver(message, self.matching(message))
+
+    def states(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Open sockets by health: live, awaiting_pong, or zombie (past the pong timeout, not swept yet)"""
+        now = time.monotonic() if now is None else now
+        counts = {"live": 0, "awaiting_pong": 0, "zombie": 0}
+        for subscription in self.subscriptions.values():
+            if subscription.pinged_at is None:
+                counts["live"] += 1
+            elif now - subscription.pinged_at < self.pong_timeout:
+                counts["awaiting_pong"] += 1
+            else:
+                counts["zombie"] += 1
+        return counts
+
+    async def _ping(self, subscription: Subscription, now: float) -> bool:
+        subscription.pinged_at = now
+        try:
+            frame = encode({"type": "ping"}, subscription.wire_format)
+            await asyncio.wait_for(send_frame(subscription.websocket, frame), self.send_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _evict(self, subscription: Subscription, reason: str):
+        self.disconnect(subscription.websocket)
+        websocket_evictions.inc(1, reason)
+        try:
+            # Going Away: clients reconnect, and a live one gets a delta for what it missed
+            await asyncio.wait_for(subscription.websocket.close(code=1001), self.send_timeout)
+        except Exception:
+            pass  # Already gone; the receive loop sees the disconnect and exits
+
+    async def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Ping quiet sockets and drop the ones that stopped answering; returns what it did"""
+        now = time.monotonic() if now is None else now
+        to_ping: List[Subscription] = []
+        evict: Dict[str, List[Subscription]] = {"zombie": [], "idle": [], "ping_failed": []}
+        for subscription in self.subscriptions.values():
+            if subscription.pinged_at is not None:
+                if now - subscription.pinged_at >= self.pong_timeout:
+                    evict["zombie"].append(subscription)
+            elif self.idle_timeout and now - subscription.last_active >= self.idle_timeout:
+                evict["idle"].append(subscription)
+            elif now - subscription.last_seen >= self.ping_interval:
+                to_ping.append(subscription)
+
+        # Concurrently, so a peer that stopped reading only holds up its own ping
+        sent = await asyncio.gather(*(self._ping(subscription, now) for subscription in to_ping))
+        evict["ping_failed"] = [subscription for subscription, ok in zip(to_ping, sent) if not ok]
+        for reason, subscriptions in evict.items():
+            if subscriptions:
+                await asyncio.gather(*(self._evict(subscription, reason) for subscription in subscriptions))
+        if any(evict.values()):
+            logger.info("Dropped %d unresponsive and %d idle WebSockets",
+                        len(evict["zombie"]) + len(evict["ping_failed"]), len(evict["idle"]))
+        return {"pinged": len(to_ping), **{reason: len(subscriptions) for reason, subscriptions in evict.items()}}
+
+    async def run_forever(self, interval: float = WS_SWEEP_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
             try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting to all: {e}")
-                disconnected.add(connection)
-        
-        # Clean up disconnected connections
-        for connection in disconnected:
-            self.disconnect(connection)
+                await self.sweep()
+            except Exception:
+                logger.exception("WebSocket sweep failed")
+
+    def start(self):
+        """Start the background sweeper"""
+        if self._background is None:
+            self._background = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._background is not None:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
 
 
 # Global instance
 manager = ConnectionManager()
 
+registry.gauge(
+    "websocket_connections", "Open WebSocket connections",
+    callback=lambda: [((), len(manager.subscriptions))]
+)
+registry.gauge(
+    "websocket_project_connections", "Open WebSocket connections per project", ("project_id",),
+    callback=lambda: [
+        ((str(project_id),), len(room.members)) for project_id, room in manager.rooms.items() if project_id is not None
+    ]
+)
+registry.gauge(
+    "websocket_connections_by_state", "Open WebSocket connections by heartbeat state", ("state",),
+    callback=lambda: [((state,), count) for state, count in manager.states().items()]
+)
+registry.gauge(
+    "websocket_broadcast_queue_depth", "Broadcast sends waiting to be delivered",
+    callback=lambda: [((), manager.pending_sends)]
+)
+
 
 def create_notification(event_type: str, data: dict, project_id: int = None):
     """Create a standardized notification message"""
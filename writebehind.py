@@ -0,0 +1,188 @@
+"""
+Write-behind buffer for comments.
+
+With COMMENT_BUFFER_ENABLED, ``POST /comments`` on a task already known to
+exist answers 202 at once with a provisional (negative) id and the comment
+is written later, in one transaction with every other comment buffered on
+the same shard, once COMMENT_FLUSH_SIZE comments are waiting or
+COMMENT_FLUSH_SECONDS have passed. The final id shows up in
+``GET /tasks/{id}/comments``, which also lists comments still buffered.
+
+Durability: an acknowledged comment only lives in process memory until its
+flush commits. A crash loses up to COMMENT_FLUSH_SECONDS (or
+COMMENT_FLUSH_SIZE comments) of acknowledged comments; a normal shutdown
+flushes the buffer. A flush that fails is retried on the next one. Comments
+whose task was deleted or archived before the flush are dropped.
+
+The synchronous path (201 with the final id, committed before the response)
+is still taken when buffering is off, when the client asks for it with
+``?sync=true``, for the first comment on a task this process hasn't seen,
+and while COMMENT_BUFFER_MAX_PENDING comments are waiting.
+"""
+import asyncio
+import itertools
+import logging
+import os
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import assign_ids
+from models import Comment, Task
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+COMMENT_BUFFER_ENABLED = os.getenv("COMMENT_BUFFER_ENABLED", "false").lower() == "true"
+COMMENT_FLUSH_SECONDS = float(os.getenv("COMMENT_FLUSH_SECONDS", "0.5"))
+COMMENT_FLUSH_SIZE = int(os.getenv("COMMENT_FLUSH_SIZE", "500"))
+COMMENT_BUFFER_MAX_PENDING = int(os.getenv("COMMENT_BUFFER_MAX_PENDING", "10000"))
+# Task ids confirmed to exist, so their comments can skip the existence check
+COMMENT_BUFFER_KNOWN_TASKS = int(os.getenv("COMMENT_BUFFER_KNOWN_TASKS", "100000"))
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+FLUSH_CHUNK_SIZE = 500
+
+comments_dropped = registry.counter(
+    "comment_buffer_dropped_total", "Buffered comments dropped at flush because their task was gone"
+)
+
+PendingComment = Tuple[int, Comment]
+
+
+class CommentBuffer:
+    """Acknowledges comments immediately and inserts them in batches per shard"""
+
+    def __init__(self, enabled: bool = COMMENT_BUFFER_ENABLED):
+        self.enabled = enabled
+        self._pending: List[PendingComment] = []
+        # Taken from _pending by the running flush, still listed until committed
+        self._flushing: List[PendingComment] = []
+        self._known_tasks: "OrderedDict[int, None]" = OrderedDict()
+        self._provisional_ids = itertools.count(1)
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._background: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._flushing)
+
+    def task_exists(self, task_id: int):
+        """Record that ``task_id`` exists; later comments on it may be buffered"""
+        self._known_tasks[task_id] = None
+        self._known_tasks.move_to_end(task_id)
+        if len(self._known_tasks) > COMMENT_BUFFER_KNOWN_TASKS:
+            self._known_tasks.popitem(last=False)
+
+    def forget_task(self, task_id: int):
+        self._known_tasks.pop(task_id, None)
+
+    def accepts(self, task_id: int) -> bool:
+        """Whether a comment on ``task_id`` can be buffered rather than written now"""
+        return (
+            self._background is not None
+            and not self._stopping
+            and task_id in self._known_tasks
+            and len(self) < COMMENT_BUFFER_MAX_PENDING
+        )
+
+    def add(self, shard: int, task_id: int, author_id: int, content: str) -> Comment:
+        """Buffer a comment; returns it, unsaved, with a provisional id"""
+        comment = Comment(
+            id=-next(self._provisional_ids), content=content, task_id=task_id, author_id=author_id,
+            created_at=datetime.utcnow()
+        )
+        comment.provisional = True
+        self._pending.append((shard, comment))
+        if len(self._pending) >= COMMENT_FLUSH_SIZE:
+            self._wake.set()
+        return comment
+
+    def pending_for(self, task_id: int) -> List[Comment]:
+        """Comments on ``task_id`` acknowledged but not yet committed, oldest first"""
+        return [comment for _, comment in self._flushing + self._pending if comment.task_id == task_id]
+
+    async def _write(self, db: AsyncSession, comments: List[Comment]) -> int:
+        """Insert ``comments`` whose task still exists in one transaction; returns the number written"""
+        task_ids = list({comment.task_id for comment in comments})
+        existing = set()
+        for start in range(0, len(task_ids), FLUSH_CHUNK_SIZE):
+            result = await db.execute(select(Task.id).where(Task.id.in_(task_ids[start:start + FLUSH_CHUNK_SIZE])))
+            existing.update(result.scalars())
+
+        rows = [
+            {"content": comment.content, "task_id": comment.task_id, "author_id": comment.author_id,
+             "created_at": comment.created_at}
+            for comment in comments if comment.task_id in existing
+        ]
+        if len(rows) < len(comments):
+            for task_id in set(task_ids) - existing:
+                self.forget_task(task_id)
+            comments_dropped.inc(len(comments) - len(rows))
+            logger.warning("Dropped %d buffered comments on deleted tasks", len(comments) - len(rows))
+        if rows:
+            await assign_ids(db, Comment, rows)
+            await db.execute(insert(Comment), rows)
+        await db.commit()
+        return len(rows)
+
+    async def flush(self, session_makers: Sequence[async_sessionmaker]) -> int:
+        """Write every buffered comment, one transaction per shard; returns the number written"""
+        self._flushing, self._pending = self._pending, []
+        by_shard: Dict[int, List[Comment]] = defaultdict(list)
+        for shard, comment in self._flushing:
+            by_shard[shard].append(comment)
+
+        written = 0
+        failed: List[PendingComment] = []
+        for shard, comments in by_shard.items():
+            try:
+                async with session_makers[shard]() as db:
+                    written += await self._write(db, comments)
+            except Exception:
+                logger.exception("Flushing %d buffered comments to shard %d failed", len(comments), shard)
+                failed.extend((shard, comment) for comment in comments)
+        # Failed comments go back to the front, ahead of the ones buffered meanwhile
+        self._pending[:0] = failed
+        self._flushing = []
+        return written
+
+    async def run_forever(self, session_makers: Sequence[async_sessionmaker]):
+        """Flush every COMMENT_FLUSH_SECONDS, or as soon as COMMENT_FLUSH_SIZE comments are waiting"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), COMMENT_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._pending:
+                await self.flush(session_makers)
+
+    def start(self, session_makers: Sequence[async_sessionmaker]):
+        """Start the background flusher over the shards' session makers"""
+        if self.enabled and self._background is None:
+            self._stopping = False
+            self._background = asyncio.create_task(self.run_forever(session_makers))
+
+    async def stop(self, session_makers: Sequence[async_sessionmaker]):
+        """Stop accepting comments, let a running flush finish and write the rest"""
+        if self._background is not None:
+            # Not cancelled: a flush cut short would lose the comments it had taken
+            self._stopping = True
+            self._wake.set()
+            await self._background
+            self._background = None
+        if self._pending:
+            await self.flush(session_makers)
+
+
+# Global instance
+comment_buffer = CommentBuffer()
+
+registry.gauge(
+    "comment_buffer_pending", "Comments acknowledged but not yet committed",
+    callback=lambda: [((), len(comment_buffer))]
+)